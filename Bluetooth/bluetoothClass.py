@@ -28,6 +28,7 @@ class Bluetooth(object):
 
 	successfulConnection = None
 	receptionQueue = None
+	frameDecoder = None # Decodifica los datos recibidos fuera de los hilos de los sockets
 	isActive = False
 
 	def __init__(self, _receptionQueue):
@@ -74,7 +75,7 @@ class Bluetooth(object):
 			self.successfulConnection = False
 			return False
 
-	def send(self, messageToSend, destinationServiceName, destinationMAC, destinationUUID):
+	def send(self, messageToSend, destinationServiceName, destinationMAC, destinationUUID, frameCache = None):
 		logger.write('DEBUG', '[BLUETOOTH] Buscando el servicio \'%s\'.' % destinationServiceName)
 		# Buscamos un servicio Bluetooth específico
 		serviceMatches = bluetooth.find_service(uuid = destinationUUID, address = destinationMAC)
@@ -90,7 +91,7 @@ class Bluetooth(object):
 				# Conecta el socket con el dispositivo remoto (host) sobre el puerto (channel) especificado
 				clientSocket.connect((host, port))
 				logger.write('DEBUG', '[BLUETOOTH] Conectado con la dirección \'%s\'.' % host)
-				return self.bluetoothTransmitter.send(messageToSend, clientSocket)
+				return self.bluetoothTransmitter.send(messageToSend, clientSocket, frameCache)
 			except bluetooth.btcommon.BluetoothError as bluetoothError:
 				# (11, 'Resource temporarily unavailable')
 				# (16, 'Device or resource busy')
@@ -125,7 +126,7 @@ class Bluetooth(object):
 				# El filtro está activado y el cliente fue encontrado, o el filtro no está habilitado
 				if not enabledFilter:
 					logger.write('DEBUG', '[BLUETOOTH] Conexión desde \'%s\' aceptada.' % macAddress)
-					receptorThread = bluetoothReceptor.BluetoothReceptor('Thread-Receptor', remoteSocket, self.receptionQueue)
+					receptorThread = bluetoothReceptor.BluetoothReceptor('Thread-Receptor', remoteSocket, self.receptionQueue, self.frameDecoder)
 					receptorThread.start()
 				# El cliente no fue encontrado, por lo que debemos rechazar su mensaje
 				else:
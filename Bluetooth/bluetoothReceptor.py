@@ -1,14 +1,15 @@
 # coding=utf-8
 
 import os
+import zlib
 import time
 import json
 import Queue
-import pickle
 import threading
 import bluetooth
 
 import logger
+import compression
 import messageClass
 
 JSON_FILE = 'config.json'
@@ -20,11 +21,13 @@ DOWNLOADS = 'Downloads'
 class BluetoothReceptor(threading.Thread):
 
 	receptionQueue = None
+	frameDecoder = None # Decodifica los datos recibidos fuera del hilo del socket
 
-	def __init__(self, _threadName, _remoteSocket, _receptionQueue):
+	def __init__(self, _threadName, _remoteSocket, _receptionQueue, _frameDecoder):
 		threading.Thread.__init__(self, name = _threadName)
 		self.remoteSocket = _remoteSocket
 		self.receptionQueue = _receptionQueue
+		self.frameDecoder = _frameDecoder
 
 	def run(self):
 		try:
@@ -32,18 +35,9 @@ class BluetoothReceptor(threading.Thread):
 			# Debemos iniciar una descarga de archivo
 			if receivedData == 'START_OF_FILE':
 				self.receiveFile()
-			# Recibimos una instancia de objeto
-			elif receivedData.startswith('INSTANCE'):
-				# Quitamos la 'etiqueta' que hace refencia a una instancia de mensaje
-				serializedMessage = receivedData[len('INSTANCE'):]
-				# 'Deserializamos' la instancia de mensaje para obtener el objeto en sí
-				messageInstance = pickle.loads(serializedMessage)
-				self.receptionQueue.put((messageInstance.priority, messageInstance))
-				logger.write('INFO', '[BLUETOOTH] Ha llegado una nueva instancia de mensaje!')
-			# Se trata de un texto plano, sólo se lo almacena 
+			# Recibimos una instancia de objeto o un texto plano (se decodifica en otro hilo)
 			else:
-				self.receptionQueue.put((10, receivedData))
-				logger.write('INFO', '[BLUETOOTH] Ha llegado un nuevo mensaje!')
+				self.frameDecoder.submit('BLUETOOTH', receivedData)
 		except bluetooth.BluetoothError as errorMessage:
 			logger.write('WARNING', '[BLUETOOTH] Error al intentar recibir un mensaje: \'%s\'.'% errorMessage )
 		finally:
@@ -56,6 +50,8 @@ class BluetoothReceptor(threading.Thread):
 			self.remoteSocket.send('ACK')
 			currentDirectory = os.getcwd()                 # Obtenemos el directorio actual de trabajo
 			fileName = self.remoteSocket.recv(BUFFER_SIZE) # Obtenemos el nombre del archivo a recibir
+			# El transmisor puede ofrecer, a continuación del nombre, enviar el archivo comprimido
+			fileName, fileOption = (fileName.split('\0', 1) + [None])[:2]
 			# Obtenemos el path relativo del archivo a descargar
 			relativeFilePath = os.path.join(currentDirectory, DOWNLOADS, fileName)
 			# Verificamos si el directorio 'DOWNLOADS' no está creado en el directorio actual
@@ -65,14 +61,24 @@ class BluetoothReceptor(threading.Thread):
 			if not os.path.isfile(relativeFilePath):
 				fileObject = open(relativeFilePath, 'w+')
 				logger.write('DEBUG', '[BLUETOOTH] Descargando archivo \'%s\'...' % fileName)
-				self.remoteSocket.send('READY')
+				decompressObject = None
+				if fileOption == compression.FILE_OPTION:
+					decompressObject = compression.FileDecompressor()
+					self.remoteSocket.send('READY-%s' % compression.FILE_OPTION)
+				else:
+					self.remoteSocket.send('READY')
 				while True:
 					inputData = self.remoteSocket.recv(BUFFER_SIZE)
 					if inputData != 'EOF':
-						fileObject.write(inputData)
+						if decompressObject is not None:
+							decompressObject.decompress(inputData, fileObject)
+						else:
+							fileObject.write(inputData)
 						time.sleep(0.15) # IMPORTANTE, no borrar.
 						self.remoteSocket.send('ACK')
 					else: 
+						if decompressObject is not None:
+							decompressObject.flush(fileObject)
 						fileObject.close()
 						break
 				self.remoteSocket.send('ACK') # IMPORTANTE, no borrar.
@@ -83,6 +89,6 @@ class BluetoothReceptor(threading.Thread):
 				self.remoteSocket.send('FILE_EXISTS') # Comunicamos al transmisor que el archivo ya existe
 				logger.write('WARNING', '[BLUETOOTH] El archivo \'%s\' ya existe! Imposible descargar.' % fileName)
 				return False
-		except bluetooth.BluetoothError as errorMessage:
+		except (bluetooth.BluetoothError, zlib.error) as errorMessage:
 			logger.write('WARNING', '[BLUETOOTH] Error al intentar descargar el archivo \'%s\': %s' % (fileName, str(errorMessage)))
 			return False
\ No newline at end of file
@@ -1,11 +1,13 @@
 # coding=utf-8
 
 import os
+import zlib
 import time
-import pickle
 import bluetooth
 
 import logger
+import wireCodec
+import compression
 import messageClass
 
 BUFFER_SIZE = 4096 # Tamano del buffer en bytes (cantidad de caracteres)
@@ -15,7 +17,7 @@ class BluetoothTransmitter():
 	def __init__(self):
 		pass
 
-	def send(self, message, clientSocket):
+	def send(self, message, clientSocket, frameCache = None):
 		# Comprobación de envío de texto plano
 		if isinstance(message, messageClass.Message) and hasattr(message, 'plainText'):
 			return self.sendMessage(message.plainText, clientSocket)
@@ -24,7 +26,7 @@ class BluetoothTransmitter():
 			return self.sendFile(message.fileName, clientSocket)
 		# Entonces se trata de enviar una instancia de mensaje
 		else:
-			return self.sendMessageInstance(message, clientSocket)
+			return self.sendMessageInstance(message, clientSocket, frameCache)
 
 	def sendMessage(self, plainText, clientSocket):
 		try:
@@ -45,28 +47,41 @@ class BluetoothTransmitter():
 			fileObject = open(absoluteFilePath, 'rb')
 			clientSocket.send('START_OF_FILE')
 			clientSocket.recv(BUFFER_SIZE) # ACK
-			clientSocket.send(fileName) # Enviamos el nombre del archivo
-			# Recibe confirmación para comenzar a transmitir (READY)
-			if clientSocket.recv(BUFFER_SIZE) == "READY":
-				# Guardamos la posición inicial del archivo (donde comienza)
-				fileBeginning = fileObject.tell()
-				# Apuntamos al final del archivo
-				fileObject.seek(0, os.SEEK_END)
-				# Obtenemos la posición final del mismo (que sería el tamaño)
-				fileSize = fileObject.tell()
-				# Apuntamos nuevamente al comienzo del archivo, para comenzar a transmitir
-				fileObject.seek(fileBeginning, os.SEEK_SET)
+			fileSize = os.path.getsize(absoluteFilePath)
+			# Si el archivo es grande y compresible, ofrecemos enviarlo comprimido (el receptor decide si acepta)
+			if compression.isEnabled('BLUETOOTH', fileSize) and compression.isCompressible(fileObject.read(compression.PROBE_SIZE)):
+				clientSocket.send('%s\0%s' % (fileName, compression.FILE_OPTION))
+			else:
+				clientSocket.send(fileName) # Enviamos el nombre del archivo
+			fileObject.seek(0, os.SEEK_SET)
+			# Recibe confirmación para comenzar a transmitir (READY o READY-ZLIB)
+			receivedReply = clientSocket.recv(BUFFER_SIZE)
+			if receivedReply.startswith("READY"):
+				# Cada bloque comprimido se cierra con 'Z_SYNC_FLUSH', para que el receptor lo pueda escribir apenas llega
+				compressObject = None
+				readSize = BUFFER_SIZE
+				if receivedReply == 'READY-%s' % compression.FILE_OPTION:
+					compressObject = zlib.compressobj(compression.COMPRESSION_LEVEL)
+					readSize = BUFFER_SIZE / 2
 				# Envio del contenido del archivo
 				bytesSent = 0
+				bytesTransmitted = 0
 				logger.write('DEBUG', '[BLUETOOTH] Transfiriendo archivo \'%s\'...' % fileName)
 				while bytesSent < fileSize:
-					outputData = fileObject.read(BUFFER_SIZE)
-					clientSocket.send(outputData)
+					outputData = fileObject.read(readSize)
+					if not outputData:
+						break
 					bytesSent += len(outputData)
+					if compressObject is not None:
+						outputData = compressObject.compress(outputData) + compressObject.flush(zlib.Z_SYNC_FLUSH)
+					clientSocket.send(outputData)
+					bytesTransmitted += len(outputData)
 					clientSocket.recv(BUFFER_SIZE) # ACK
 				fileObject.close()
 				clientSocket.send('EOF')
 				clientSocket.recv(BUFFER_SIZE) # IMPORTANTE ACK, no borrar.
+				if compressObject is not None:
+					compression.recordSavings('BLUETOOTH', bytesSent, bytesTransmitted)
 				logger.write('INFO', '[BLUETOOTH] Archivo \'%s\' enviado correctamente!' % fileName)
 				return True
 			# Recibe 'FILE_EXISTS'
@@ -80,10 +95,10 @@ class BluetoothTransmitter():
 			# Cierra la conexion del socket cliente
 			clientSocket.close()
 
-	def sendMessageInstance(self, message, clientSocket):
+	def sendMessageInstance(self, message, clientSocket, frameCache = None):
 		try:
 			# Serializamos el objeto para poder transmitirlo
-			serializedMessage = 'INSTANCE' + pickle.dumps(message)
+			serializedMessage = wireCodec.encode(message, 'BLUETOOTH', frameCache)
 			# Transmitimos la instancia serializada al destino correspondiente
 			clientSocket.send(serializedMessage)
 			logger.write('INFO', '[BLUETOOTH] Instancia de mensaje enviada correctamente!')
@@ -4,7 +4,6 @@ import os
 import json
 import shlex
 import email
-import pickle
 import socket
 import inspect
 import smtplib
@@ -23,6 +22,7 @@ from email.mime.audio import MIMEAudio
 from email.mime.image import MIMEImage
 
 import logger
+import wireCodec
 import contactList
 import messageClass
 
@@ -39,6 +39,7 @@ class Email(object):
 
 	successfulConnection = None
 	receptionQueue = None
+	frameDecoder = None # Decodifica los correos recibidos fuera del hilo de IMAP
 	emailAccount = None
 	isActive = False
 
@@ -82,7 +83,7 @@ class Email(object):
 			self.successfulConnection = False
 			return False
 
-	def send(self, message, emailDestination):
+	def send(self, message, emailDestination, frameCache = None):
 		# Comprobación de envío de texto plano
 		if isinstance(message, messageClass.Message) and hasattr(message, 'plainText'):
 			return self.sendMessage(message.plainText, emailDestination)
@@ -91,7 +92,7 @@ class Email(object):
 			return self.sendAttachment(message.fileName, emailDestination)
 		# Entonces se trata de enviar una instancia de mensaje
 		else:
-			return self.sendMessageInstance(message, emailDestination)
+			return self.sendMessageInstance(message, emailDestination, frameCache)
 
 	def sendMessage(self, plainText, emailDestination):
 		try:
@@ -149,10 +150,10 @@ class Email(object):
 			logger.write('WARNING', '[EMAIL] Archivo \'%s\' no enviado: %s' % (fileName, str(errorMessage)))
 			return False
 
-	def sendMessageInstance(self, message, emailDestination):
+	def sendMessageInstance(self, message, emailDestination, frameCache = None):
 		try:
-			# Serializamos el objeto para poder transmitirlo
-			serializedMessage = 'INSTANCE' + pickle.dumps(message)
+			# Serializamos el objeto para poder transmitirlo (en base64, ya que viaja en el cuerpo del correo)
+			serializedMessage = wireCodec.encodeText(message, 'EMAIL', frameCache)
 			# Se construye un mensaje simple
 			mimeText = MIMEText(serializedMessage)
 			mimeText['From'] = '%s <%s>' % (JSON_CONFIG["COMMUNICATOR"]["NAME"], JSON_CONFIG["EMAIL"]["ACCOUNT"])
@@ -199,17 +200,10 @@ class Email(object):
 						emailBody = self.getEmailBody(emailReceived) # Obtenemos el cuerpo del email
 						if emailBody is not None:
 							#self.sendOutput(sourceEmail, emailSubject, emailBody) # -----> SOLO PARA LA DEMO <-----
-							if emailBody.startswith('INSTANCE'):
-								# Quitamos la 'etiqueta' que hace refencia a una instancia de mensaje
-								serializedMessage = emailBody[len('INSTANCE'):]
-								# 'Deserializamos' la instancia de mensaje para obtener el objeto en sí
-								messageInstance = pickle.loads(serializedMessage)
-								self.receptionQueue.put((messageInstance.priority, messageInstance))
-								logger.write('INFO', '[EMAIL] Ha llegado una nueva instancia de mensaje!')
-							else:
+							if not wireCodec.isTextFrame(emailBody):
 								emailBody = emailBody[:emailBody.rfind('\r\n')] # Elimina el salto de línea del final
-								self.receptionQueue.put((10, emailBody))
-								logger.write('INFO', '[EMAIL] Ha llegado un nuevo mensaje!')
+							# La decodificación se hace en otro hilo, para no demorar la lectura de la bandeja de entrada
+							self.frameDecoder.submit('EMAIL', emailBody, True)
 					else:
 						logger.write('WARNING', '[EMAIL] Imposible procesar la solicitud. El correo no se encuentra registrado!')
 						messageToSend = 'Imposible procesar la solicitud. Usted no se encuentra registrado!'
@@ -277,7 +271,7 @@ class Email(object):
 			if emailHeader.get_content_type() == 'text/plain':
 				plainText = emailHeader.get_payload()
 				# Se debe convertir texto de DOS(windows) a UNIX (LINUX) porque 
-				# de la forma que lo devulve email, da errores en pickle
+				# de la forma que lo devulve email, da errores al decodificar
 				plainText = plainText.replace('\r\n', '\n')
 				break
 		# Si el cuerpo del email no está vacío, retornamos el texto plano
@@ -0,0 +1,215 @@
+# coding=utf-8
+
+import os
+import time
+import select
+import inspect
+import threading
+import collections
+
+import logger
+import workerPoolClass
+
+from curses import ascii # Para enviar el Ctrl-Z
+
+FINAL_ERRORS = ('ERROR', '+CME ERROR', '+CMS ERROR')             # Respuestas finales de un comando fallido
+CALL_RESULTS = ('NO CARRIER', 'BUSY', 'NO ANSWER', 'NO DIALTONE') # Respuestas finales de 'ATD' y 'ATA'
+BODY_RESPONSES = ('+CMGL:', '+CMGR:')                             # Respuestas seguidas por el cuerpo de un SMS
+
+class AtError(Exception):
+
+	def __init__(self, atCommand, errorMessage):
+		Exception.__init__(self, '%s - %s' % (atCommand, errorMessage))
+		self.atCommand = atCommand
+		self.errorMessage = errorMessage
+
+class AtCommand(object):
+
+	atCommand = None    # Texto del comando (sin el '\r')
+	smsText = None      # Texto a escribir cuando el módem responde con '> ' (sólo para 'AT+CMGS')
+	timeOut = None      # Segundos que se espera la respuesta final, desde que se escribe el comando
+	deadline = None     # Momento en el que se da por vencido el comando
+	responseList = None # Líneas de respuesta intermedias (sin la respuesta final)
+	errorMessage = None # Respuesta final de error (None si terminó en 'OK')
+
+	def __init__(self, _atCommand, _timeOut, _smsText = None):
+		self.atCommand = _atCommand
+		self.timeOut = _timeOut
+		self.smsText = _smsText
+		self.responseList = list()
+		self.doneEvent = threading.Event()
+
+class AtEngine(threading.Thread):
+
+	serialPort = None     # Puerto serie ya abierto (sólo lo lee este hilo)
+	commandQueue = None   # Comandos esperando su turno, se escriben de a uno
+	currentCommand = None # Comando escrito que todavía no recibió su respuesta final
+	urcHandlers = None    # Prefijo del aviso espontáneo (URC) --> (manejador, lleva línea de cuerpo)
+	pendingUrc = None     # URC cuya línea de cuerpo todavía no llegó
+	expectBody = False    # La próxima línea es el cuerpo de un SMS listado por el comando en curso
+	lineBuffer = ''       # Datos leídos que todavía no completan una línea
+
+	isActive = False
+
+	def __init__(self, _serialPort, _threadName):
+		threading.Thread.__init__(self, name = _threadName)
+		self.serialPort = _serialPort
+		self.commandQueue = collections.deque()
+		self.commandLock = threading.Lock()
+		self.urcHandlers = dict()
+		# Los manejadores corren en su propio hilo (en orden de llegada), así pueden enviar comandos AT
+		self.urcPool = workerPoolClass.WorkerPool(_threadName + 'Urc', 1)
+		self.wakeRead, self.wakeWrite = os.pipe()
+		self.isActive = True
+
+	def addHandler(self, urcPrefix, urcHandler, hasBody = False):
+		# El manejador recibe la línea del URC y, si 'hasBody', la línea siguiente (por ejemplo, el texto de un '+CMT')
+		self.urcHandlers[urcPrefix] = (urcHandler, hasBody)
+
+	def execute(self, atCommand, timeOut, smsText = None):
+		if threading.current_thread() is self:
+			raise AtError(atCommand, 'no se puede esperar una respuesta desde el hilo lector')
+		commandInstance = AtCommand(atCommand, timeOut, smsText)
+		with self.commandLock:
+			if not self.isActive:
+				raise AtError(atCommand, 'el puerto del módem no está siendo atendido')
+			self.commandQueue.append(commandInstance)
+		self.wakeUp()
+		# El lector siempre resuelve el comando (respuesta, vencimiento o cierre del puerto)
+		while not commandInstance.doneEvent.wait(1.5):
+			pass
+		if commandInstance.errorMessage is not None:
+			raise AtError(atCommand, commandInstance.errorMessage)
+		return commandInstance.responseList
+
+	def stop(self):
+		self.isActive = False
+		self.wakeUp()
+		if threading.current_thread() is not self and self.ident is not None:
+			self.join()
+			os.close(self.wakeRead)
+			os.close(self.wakeWrite)
+		self.urcPool.stop()
+
+	def wakeUp(self):
+		try:
+			os.write(self.wakeWrite, '\0')
+		except OSError:
+			pass
+
+	def run(self):
+		self.urcPool.start()
+		while self.isActive:
+			if self.currentCommand is None:
+				self.startNextCommand()
+			waitTime = 1.5
+			if self.currentCommand is not None:
+				waitTime = max(0, min(waitTime, self.currentCommand.deadline - time.time()))
+			try:
+				readyList = select.select([self.serialPort.fileno(), self.wakeRead], [], [], waitTime)[0]
+				if self.wakeRead in readyList:
+					os.read(self.wakeRead, 512)
+				if self.serialPort.fileno() in readyList:
+					receivedData = self.serialPort.read(max(1, self.serialPort.inWaiting()))
+					# Un descriptor listo para leer pero sin datos significa que el dispositivo fue desconectado
+					if not receivedData:
+						raise IOError('el dispositivo no devolvió datos')
+					self.processData(receivedData)
+			except (select.error, IOError, OSError, ValueError) as errorMessage:
+				logger.write('WARNING', '[GSM] Se perdió la comunicación con el módem: %s' % str(errorMessage))
+				self.isActive = False
+				break
+			if self.currentCommand is not None and time.time() >= self.currentCommand.deadline:
+				logger.write('WARNING', '[GSM] %s - Sin respuesta del módem.' % self.currentCommand.atCommand)
+				self.finishCommand('sin respuesta del módem')
+		# Ningún comando pendiente queda esperando una respuesta que ya no va a llegar
+		with self.commandLock:
+			if self.currentCommand is not None:
+				self.finishCommand('el puerto del módem fue cerrado')
+			while self.commandQueue:
+				self.currentCommand = self.commandQueue.popleft()
+				self.finishCommand('el puerto del módem fue cerrado')
+		logger.write('WARNING', '[GSM] Función \'%s\' terminada.' % inspect.stack()[0][3])
+
+	def startNextCommand(self):
+		with self.commandLock:
+			if not self.commandQueue:
+				return
+			self.currentCommand = self.commandQueue.popleft()
+		self.currentCommand.deadline = time.time() + self.currentCommand.timeOut
+		self.expectBody = False
+		try:
+			self.serialPort.write(self.currentCommand.atCommand + '\r')
+		except (IOError, OSError, ValueError) as errorMessage:
+			self.finishCommand(str(errorMessage))
+
+	def finishCommand(self, errorMessage):
+		commandInstance = self.currentCommand
+		self.currentCommand = None
+		commandInstance.errorMessage = errorMessage
+		commandInstance.doneEvent.set()
+
+	def processData(self, receivedData):
+		self.lineBuffer += receivedData
+		while True:
+			currentCommand = self.currentCommand
+			# El pedido de texto de 'AT+CMGS' ('> ') es la única respuesta que no termina en salto de línea
+			if currentCommand is not None and currentCommand.smsText is not None and self.lineBuffer.lstrip('\r\n').startswith('>'):
+				self.lineBuffer = self.lineBuffer.lstrip('\r\n')[1:].lstrip(' ')
+				self.serialPort.write(currentCommand.smsText + ascii.ctrl('z'))
+				currentCommand.smsText = None
+				continue
+			lineEnd = self.lineBuffer.find('\n')
+			if lineEnd < 0:
+				break
+			receivedLine = self.lineBuffer[:lineEnd].strip()
+			self.lineBuffer = self.lineBuffer[lineEnd + 1:]
+			if receivedLine:
+				self.processLine(receivedLine)
+
+	def processLine(self, receivedLine):
+		# Ejemplo de receivedLine (URC)      : +CMT: "+543512641040","","16/01/31,05:00:08-12"
+		# Ejemplo de receivedLine (URC)      : RING
+		# Ejemplo de receivedLine (respuesta): +CMGL: 0,"REC UNREAD","+5493512560536",,"14/10/26,17:12:04-12"
+		# Ejemplo de receivedLine (final)    : OK
+		# El cuerpo de un SMS se toma tal cual, aunque su texto se parezca a una respuesta o a un URC
+		if self.pendingUrc is not None:
+			urcHandler, urcLine = self.pendingUrc
+			self.pendingUrc = None
+			self.urcPool.submit(urcHandler, (urcLine, receivedLine))
+			return
+		currentCommand = self.currentCommand
+		if currentCommand is not None:
+			if self.expectBody:
+				self.expectBody = False
+				currentCommand.responseList.append(receivedLine)
+				return
+			# Eco del comando (después de un 'ATZ' el módem vuelve a tener el eco habilitado)
+			if receivedLine == currentCommand.atCommand:
+				return
+			if receivedLine == 'OK':
+				self.finishCommand(None)
+				return
+			if receivedLine.startswith(FINAL_ERRORS):
+				logger.write('ERROR', '[GSM] %s - %s.' % (currentCommand.atCommand, receivedLine))
+				self.finishCommand(receivedLine)
+				return
+			if receivedLine.startswith(CALL_RESULTS) and currentCommand.atCommand.startswith(('ATD', 'ATA')):
+				self.finishCommand(receivedLine)
+				return
+			# Una respuesta del comando en curso comparte el prefijo del comando (por ejemplo, '+CLIP: 1,1' de 'AT+CLIP?')
+			if receivedLine.startswith('+') and currentCommand.atCommand.startswith('AT' + receivedLine.split(':')[0]):
+				self.expectBody = receivedLine.startswith(BODY_RESPONSES)
+				currentCommand.responseList.append(receivedLine)
+				return
+		for urcPrefix, (urcHandler, hasBody) in self.urcHandlers.items():
+			if receivedLine.startswith(urcPrefix):
+				if hasBody:
+					self.pendingUrc = (urcHandler, receivedLine)
+				else:
+					self.urcPool.submit(urcHandler, (receivedLine, None))
+				return
+		if currentCommand is not None:
+			currentCommand.responseList.append(receivedLine)
+		else:
+			logger.write('DEBUG', '[GSM] Línea inesperada del módem: %s' % receivedLine)
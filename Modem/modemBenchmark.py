@@ -0,0 +1,112 @@
+# coding=utf-8
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+# Se ejecuta desde cualquier directorio: la configuración y los módulos están en la raíz del proyecto
+projectDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(projectDirectory)
+sys.path.insert(0, projectDirectory)
+
+import modemClass
+import messageClass
+import modemSimulator
+
+TELEPHONE_NUMBER = '+5493512560536' # Número (permitido en 'contactList') que usa el simulador para los SMS entrantes
+
+class CountingDecoder(object):
+
+	expectedCount = 0 # Cantidad de mensajes que se espera recibir
+	receivedCount = 0 # Cantidad de mensajes entregados por el módem
+
+	def __init__(self):
+		self.receivedLock = threading.Lock()
+		self.receivedEvent = threading.Event()
+
+	def expect(self, expectedCount):
+		self.expectedCount = expectedCount
+		self.receivedCount = 0
+		self.receivedEvent.clear()
+
+	def submit(self, mediaName, receivedData, isText = False):
+		# Ocupa el lugar del 'FrameDecoder': sólo cuenta lo que entrega el módem
+		with self.receivedLock:
+			self.receivedCount += 1
+			if self.receivedCount >= self.expectedCount:
+				self.receivedEvent.set()
+		return True
+
+def measureConnect(simulatorInstance, repeatCount):
+	elapsedList = list()
+	for repeatIndex in range(repeatCount):
+		gsmInstance = modemClass.Gsm(None)
+		startTime = time.time()
+		successfulConnection = gsmInstance.connect(simulatorInstance.portName)
+		elapsedList.append(time.time() - startTime)
+		gsmInstance.closePort()
+		if not successfulConnection:
+			return None
+	return sum(elapsedList) / len(elapsedList)
+
+def measureSend(gsmInstance, sendFunction, messageCount):
+	# Devuelve (mensajes por segundo, cantidad de envíos fallidos)
+	failedCount = 0
+	startTime = time.time()
+	for messageIndex in range(messageCount):
+		if not sendFunction(messageIndex):
+			failedCount += 1
+	return messageCount / (time.time() - startTime), failedCount
+
+def measureInbound(simulatorInstance, decoderInstance, messageCount, messageSize):
+	# Devuelve los mensajes por segundo, desde el primer '+CMT' hasta que el último llega al decodificador
+	decoderInstance.expect(messageCount)
+	startTime = time.time()
+	for messageIndex in range(messageCount):
+		simulatorInstance.pushSms(TELEPHONE_NUMBER, ('%s ' % messageIndex).ljust(messageSize, 'x'))
+	if not decoderInstance.receivedEvent.wait(60):
+		return None
+	return messageCount / (time.time() - startTime)
+
+def main():
+	argumentParser = argparse.ArgumentParser(description = 'Mide el módem GSM contra un módem simulado (pseudo-terminal).')
+	argumentParser.add_argument('--count', type = int, default = 50, help = 'mensajes por medición')
+	argumentParser.add_argument('--size', type = int, default = 100, help = 'caracteres de cada SMS de texto')
+	argumentParser.add_argument('--response-delay', type = float, default = 0, help = 'demora de cada respuesta (segundos)')
+	argumentParser.add_argument('--send-delay', type = float, default = 0, help = 'demora de la red al enviar (segundos)')
+	argumentParser.add_argument('--error-rate', type = float, default = 0, help = 'probabilidad de rechazo de un SMS')
+	parsedArguments = argumentParser.parse_args()
+
+	simulatorInstance = modemSimulator.ModemSimulator(parsedArguments.response_delay, parsedArguments.send_delay, parsedArguments.error_rate)
+	simulatorInstance.start()
+	decoderInstance = CountingDecoder()
+	gsmInstance = modemClass.Gsm(None)
+	gsmInstance.frameDecoder = decoderInstance
+	try:
+		print '----------- BENCHMARK DEL MÓDEM GSM -----------\n'
+		print 'Puerto simulado      : %s' % simulatorInstance.portName
+		connectTime = measureConnect(simulatorInstance, 5)
+		if connectTime is None or not gsmInstance.connect(simulatorInstance.portName):
+			print 'No se pudo conectar con el módem simulado!'
+			return
+		print 'Conexión             : %.1f ms' % (connectTime * 1000)
+		textMessage = 'x' * parsedArguments.size
+		sendRate, failedCount = measureSend(gsmInstance, lambda messageIndex: gsmInstance.sendMessage(textMessage, TELEPHONE_NUMBER), parsedArguments.count)
+		print 'Envío de texto       : %.1f SMS/s (%s fallidos)' % (sendRate, failedCount)
+		infoMessage = messageClass.InfoMessage('benchmark', 'client02', textMessage)
+		sendRate, failedCount = measureSend(gsmInstance, lambda messageIndex: gsmInstance.sendMessageInstance(infoMessage, TELEPHONE_NUMBER), parsedArguments.count)
+		print 'Envío de instancias  : %.1f mensajes/s (%s fallidos, %s SMS en total)' % (sendRate, failedCount, len(simulatorInstance.sentList))
+		receiveRate = measureInbound(simulatorInstance, decoderInstance, parsedArguments.count, parsedArguments.size)
+		if receiveRate is None:
+			print 'Recepción            : incompleta (%s de %s)' % (decoderInstance.receivedCount, parsedArguments.count)
+		else:
+			print 'Recepción            : %.1f SMS/s' % receiveRate
+		print 'Comandos AT          : %s' % simulatorInstance.commandCount
+	finally:
+		gsmInstance.closePort()
+		simulatorInstance.stop()
+
+if __name__ == '__main__':
+	main()
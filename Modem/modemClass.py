@@ -1,27 +1,43 @@
 # coding=utf-8
 
+import os
 import json
 import time
 import shlex
 import serial
-import pickle
+import struct
+import smsPdu
 import inspect
+import atEngine
+import itertools
+import threading
 import subprocess
 
 import logger
+import wireCodec
 import contactList
 import messageClass
 
-from curses import ascii # Para enviar el Ctrl-Z
+from atEngine import AtError
 
 JSON_FILE = 'config.json'
 JSON_CONFIG = json.load(open(JSON_FILE))
 
+COMMAND_TIMEOUT = JSON_CONFIG["MODEM"]["COMMAND_TIMEOUT"] # Segundos de espera de la respuesta final de un comando
+SMS_TIMEOUT = JSON_CONFIG["MODEM"]["SMS_TIMEOUT"]         # Segundos de espera de la confirmación de la red de un SMS
+PROBE_TIMEOUT = JSON_CONFIG["MODEM"]["PROBE_TIMEOUT"]     # Segundos de espera del primer 'AT' (los puertos sin módem no responden)
+PROBE_RETRY = JSON_CONFIG["MODEM"]["PROBE_RETRY"]         # Segundos hasta volver a probar un puerto que falló (se duplica con cada fallo)
+MAX_PROBE_RETRY = JSON_CONFIG["MODEM"]["MAX_PROBE_RETRY"] # Segundos máximos entre pruebas de un mismo puerto
+DELIVERY_REPORTS = JSON_CONFIG["MODEM"]["DELIVERY_REPORTS"] # Un envío termina cuando llega el informe de entrega del destino
+DELIVERY_TIMEOUT = JSON_CONFIG["MODEM"]["DELIVERY_TIMEOUT"] # Segundos de espera del informe de entrega
+
 class Modem(object):
 
 	successfulConnection = None
 	receptionQueue = None
+	frameDecoder = None # Decodifica los mensajes recibidos fuera del hilo del puerto serie
 	serialPort = None
+	atEngine = None     # Único hilo que lee el puerto serie (respuestas de comandos y avisos espontáneos)
 
 	def __init__(self):
 		self.modemInstance = serial.Serial()
@@ -34,38 +50,38 @@ class Modem(object):
 		self.modemInstance.timeout = JSON_CONFIG["MODEM"]["TIME_OUT"]
 		self.modemInstance.baudrate = JSON_CONFIG["MODEM"]["BAUD_RATE"]
 
-	def sendAT(self, atCommand):
-		self.modemInstance.write(atCommand + '\r')	 # Envio el comando AT al modem
-		modemOutput = self.modemInstance.readlines() # Espero la respuesta
-		# El módem devuelve una respuesta ante el comando AT
-		if len(modemOutput) > 0 and atCommand.startswith('AT'):
-			# Verificamos si se produjo algún tipo de error relacionado con el comando AT
-			for outputElement in modemOutput:
-				# El 'AT+CNMA' sólo es soportado en Dongles USB que requieren confirmación de SMS
-				if outputElement.startswith(('ERROR', '+CME ERROR', '+CMS ERROR')) and atCommand != 'AT+CNMA':
-					errorMessage = outputElement.replace('\r\n', '')
-					logger.write('ERROR', '[GSM] %s - %s.' % (atCommand, errorMessage))
-					raise
-				# El comando AT para llamadas de voz (caracterizado por su terminacion en ';') no es soportado
-				elif outputElement.startswith('NO CARRIER') and atCommand.startswith('ATD') and atCommand.endswith(';'):
-					raise
-		# Esto ocurre cuando el puerto 'ttyUSBx' no es un módem
-		elif len(modemOutput) is 0:
-			raise
-		# Si la respuesta al comando AT no era un mensaje de error, retornamos la salida
-		return modemOutput
+	def sendAT(self, atCommand, timeOut = COMMAND_TIMEOUT, smsText = None):
+		# El comando espera su turno y su respuesta final ('OK', 'ERROR', '+CME ERROR', '+CMS ERROR'), no un tiempo fijo
+		# Un error del módem, la falta de respuesta (el puerto 'ttyUSBx' no es un módem) o el cierre del puerto lanzan 'AtError'
+		if self.atEngine is None:
+			raise AtError(atCommand, 'el puerto del módem no está abierto')
+		# Ejemplo de respuesta para 'AT+CMGS': ['+CMGS: 17']
+		return self.atEngine.execute(atCommand, timeOut, smsText)
 
 	def closePort(self):
+		if self.atEngine is not None:
+			self.atEngine.stop()
+			self.atEngine = None
 		self.modemInstance.close()
 
 class Gsm(Modem):
 
-	successfulSending = None
+	concatReference = 0  # Referencia del último SMS concatenado enviado (identifica a sus partes en el destino)
+	concatBuffer = None  # Partes recibidas de SMS concatenados, a la espera de las restantes
+	callerID = None      # Número de la llamada de voz en curso
+	imei = None          # Identificador del módem (distingue los puertos secundarios de un mismo dongle)
+	pendingSends = 0     # Envíos asignados a este módem por el conjunto que todavía no terminaron
+	reportDict = None    # Referencia del SMS enviado (TP-MR) --> [evento, estado, momento] de su informe de entrega
+
 	isActive = False
 
 	def __init__(self, _receptionQueue):
 		Modem.__init__(self)
 		self.receptionQueue = _receptionQueue
+		self.concatBuffer = smsPdu.ConcatBuffer()
+		self.reportDict = dict()
+		self.reportLock = threading.Lock()
+		self.concatLock = threading.Lock()
 
 	def __del__(self):
 		self.modemInstance.close()
@@ -76,129 +92,161 @@ class Gsm(Modem):
 		try:
 			self.modemInstance.port = _serialPort
 			self.modemInstance.open()
-			time.sleep(1.5)
+			# Los avisos espontáneos del módem (URC) se atienden apenas llegan, sin consultar el puerto periódicamente
+			self.atEngine = atEngine.AtEngine(self.modemInstance, 'gsmReader-' + os.path.basename(_serialPort))
+			self.atEngine.addHandler('+CMT:', self.handleSms, True)
+			self.atEngine.addHandler('+CDS:', self.handleReport, True)
+			self.atEngine.addHandler('+CMS ERROR', self.handleCallEvent)
+			self.atEngine.addHandler('RING', self.handleCallEvent)
+			self.atEngine.addHandler('+CLIP:', self.handleCallEvent)
+			self.atEngine.addHandler('BUSY', self.handleCallEvent)
+			self.atEngine.addHandler('NO ANSWER', self.handleCallEvent)
+			self.atEngine.addHandler('NO CARRIER', self.handleCallEvent)
+			self.atEngine.start()
+			self.sendAT('AT', PROBE_TIMEOUT) # Comprobamos que el puerto responda a los comandos AT
 			self.sendAT('ATZ')				 # Enviamos un reset
-			self.sendAT('ATE1')				 # Habilitamos el echo
+			self.sendAT('ATE0')				 # Deshabilitamos el echo (el texto de un SMS no vuelve por el puerto)
 			self.sendAT('AT+CMEE=2')		 # Habilitamos reporte de error
-			self.sendAT('AT+CMGF=1')		 # Establecemos el modo para SMS
+			self.sendAT('AT+CMGF=0')		 # Establecemos el modo PDU para SMS (binario y concatenado)
 			self.sendAT('AT+CLIP=1')		 # Habilitamos identificador de llamadas
-			self.sendAT('AT+CNMI=1,2,0,0,0') # Habilitamos notificacion de mensaje entrante
+			# Habilitamos notificacion de mensaje entrante (y de los informes de entrega, si se piden)
+			self.sendAT('AT+CNMI=1,2,0,1,0' if DELIVERY_REPORTS else 'AT+CNMI=1,2,0,0,0')
+			# Ejemplo de respuesta: ['356938035643809'] o ['+CGSN: 356938035643809'] (puede traer URC intercalados, como '^RSSI: 15')
+			try:
+				imeiList = [atOutput.split()[-1] for atOutput in self.sendAT('AT+CGSN') if atOutput.strip()]
+				imeiList = [imeiValue for imeiValue in imeiList if imeiValue.isdigit() and len(imeiValue) >= 14]
+				self.imei = imeiList[0] if imeiList else None
+			except AtError:
+				self.imei = None
 			self.successfulConnection = True
 			return True
 		except:
+			# Si no es un módem, dejamos de leer el puerto (lo cierra el controlador cuando el dispositivo desaparece)
+			if self.atEngine is not None:
+				self.atEngine.stop()
+				self.atEngine = None
 			self.successfulConnection = False
 			return False
 
+	def isResponding(self):
+		# El lector del puerto termina si el dispositivo deja de responder (o desaparece)
+		return bool(self.successfulConnection) and self.atEngine is not None and self.atEngine.isActive
+
 	def receive(self):
-		try:
-			smsAmount = 0
-			smsBodyList = list()
-			smsHeaderList = list()
-			unreadList = self.sendAT('AT+CMGL="REC UNREAD"')
-		except:
-			pass
-		# Ejemplo de unreadList[0]: AT+CMGL="REC UNREAD"\r\r\n
-		# Ejemplo de unreadList[1]: +CMGL: 0,"REC UNREAD","+5493512560536",,"14/10/26,17:12:04-12"\r\n
-		# Ejemplo de unreadList[2]: Primer mensaje.\r\n
-		# Ejemplo de unreadList[3]: +CMGL: 1,"REC UNREAD","+5493512560536",,"14/10/26,17:15:10-12"\r\n
-		# Ejemplo de unreadList[4]: Segundo mensaje.\r\n
-		# Ejemplo de unreadList[5]: \r\n
-		# Ejemplo de unreadList[6]: OK\r\n
-		for unreadIndex, unreadData in enumerate(unreadList):
-			if unreadData.startswith('+CMGL'):
-				smsHeaderList.append(unreadList[unreadIndex])
-				smsBodyList.append(unreadList[unreadIndex + 1])
-				smsAmount += 1
-			elif unreadData.startswith('OK'):
-				break
-		# Ejemplo de smsHeaderList[0]: +CMGL: 0,"REC UNREAD","+549351256bluetooth0536",,"14/10/26,17:12:04-12"\r\n
-		# Ejemplo de smsBodyList[0]  : Primer mensaje.\r\n
-		# Ejemplo de smsHeaderList[1]: +CMGL: 1,"REC UNREAD","+5493512560536",,"14/10/26,17:15:10-12"\r\n
-		# Ejemplo de smsBodyList[1]  : Segundo mensaje.\r\n
 		self.isActive = True
-		while self.isActive:
-			try:
-				# Leemos los mensajes de texto recibidos...
-				if smsAmount is not 0:
-					logger.write('DEBUG', '[SMS] Ha(n) llegado ' + str(smsAmount) + ' nuevo(s) mensaje(s) de texto!')
-					for smsHeader, smsBody in zip(smsHeaderList, smsBodyList):
-						# Ejemplo smsHeader: +CMGL: 0,"REC UNREAD","+5493512560536",,"14/10/26,17:12:04-12"\r\n
-						# Ejemplo smsBody  : Primer mensaje.\r\n
-						# Ejemplo smsHeader: +CMT: "+543512641040",,"15/12/29,11:19:38-12"\r\n
-						# Ejemplo smsBody  : Nuevo SMS.\r\n
-						telephoneNumber = self.getTelephoneNumber(smsHeader) # Obtenemos el numero de telefono
-						# Comprobamos si el remitente del mensaje (un teléfono) está registrado...
-						if telephoneNumber in contactList.allowedNumbers.values() or not JSON_CONFIG["COMMUNICATOR"]["RECEPTION_FILTER"]:
-							# Quitamos el '\r\n' del final y obtenemos el mensaje de texto
-							smsMessage = smsBody.replace('\r\n', '')
-							if smsMessage.startswith('INSTANCE'):
-								# Quitamos la 'etiqueta' que hace refencia a una instancia de mensaje
-								serializedMessage = smsMessage[len('INSTANCE'):]
-								# 'Deserializamos' la instancia de mensaje para obtener el objeto en sí
-								messageInstance = pickle.loads(serializedMessage)
-								self.receptionQueue.put((messageInstance.priority, messageInstance))
-							else: 
-								self.receptionQueue.put((10, smsMessage))
-							#self.sendOutput(telephoneNumber, smsMessage) # -----> SOLO PARA LA DEMO <-----
-							logger.write('INFO', '[GSM] Mensaje de ' + str(telephoneNumber) + ' recibido correctamente!')
-						# ... sino, rechazamos el mensaje entrante.
-						else:
-							logger.write('WARNING', '[GSM] Mensaje de ' + str(telephoneNumber) + 'rechazado!')
-						# Si el mensaje fue leído desde la memoria, entonces lo borramos
-						if smsHeader.startswith('+CMGL'):
-							# Obtenemos el índice del mensaje en memoria
-							smsIndex = self.getSmsIndex(smsHeader.split(',')[0])
-							# Eliminamos el mensaje desde la memoria porque ya fue leído
-							self.removeSms(smsIndex)
-						# Eliminamos la cabecera y el cuerpo del mensaje de las listas correspondientes
-						smsHeaderList.remove(smsHeader)
-						smsBodyList.remove(smsBody)
-						# Decrementamos la cantidad de mensajes a procesar
-						smsAmount -= 1
-				elif self.modemInstance.inWaiting() is not 0:
-					bytesToRead = self.modemInstance.inWaiting()
-					receptionList = self.modemInstance.read(bytesToRead).split('\r\n')
-					# Ejemplo receptionList: ['+CMT: "+543512641040","","16/01/31,05:00:08-12"', 'Nuevo SMS.']
-					# Ejemplo receptionList: ['RING', '', '+CLIP: "+543512641040",145,"",0,"",0']
-					# Ejemplo receptionList: ['+CMS ERROR: Requested facility not subscribed']
-					# Ejemplo receptionList: ['NO CARRIER']
-					for index, data in enumerate(receptionList):
-						# Significa un mensaje entrante
-						if receptionList[index].startswith('+CMT'):
-							try:
-								smsHeaderList.append(receptionList[index])
-								smsBodyList.append(receptionList[index + 1])
-								self.sendAT('AT+CNMA') # Enviamos el ACK (ńecesario sólo para los Dongle USB)
-							except:
-								pass # La excepción aparece cuando el módem no soporta (no necesita) el ACK
-							finally:
-								smsAmount += 1
-						# Significa que no se pudo enviar el mensaje
-						elif receptionList[index].startswith('+CMS ERROR'):
-							self.successfulSending = False
-						############################### LLAMADAS DE VOZ ###############################
-						# Significa una llamade entrante
-						elif receptionList[index].startswith('RING'):
-							self.callerID = self.getTelephoneNumber(receptionList[index + 2])
-							logger.write('INFO', '[GSM] El número %s está llamando...' % self.callerID)
-						# Significa que el destino se encuentra en otra llamada
-						elif receptionList[index].startswith('BUSY'):
-							logger.write('WARNING', '[GSM] El télefono destino se encuentra ocupado.')
-						# Significa que la llamada saliente pasó al buzón de voz
-						elif receptionList[index].startswith('NO ANSWER'):
-							logger.write('WARNING', '[GSM] No hubo respuesta durante la llamada de voz.')
-						# Significa que la llamada entrante se perdió (llamada perdida) o que el extremo colgo
-						elif receptionList[index].startswith('NO CARRIER'):
-							self.callerID = None
-							logger.write('WARNING', '[GSM] Se perdió la conexión con el otro extremo.')
-						############################# FIN LLAMADAS DE VOZ #############################
-				else:
-					time.sleep(1.5)
-			except:
-				time.sleep(1.5)
+		# Los mensajes que llegaron mientras no atendíamos el módem quedan en su memoria
+		try:
+			unreadList = self.sendAT('AT+CMGL=0') # Mensajes recibidos no leídos
+		except AtError:
+			unreadList = list()
+		# Ejemplo de unreadList[0]: +CMGL: 0,0,,24
+		# Ejemplo de unreadList[1]: 07915892000000F0040B915892214365F7000021493261740100...
+		# Ejemplo de unreadList[2]: +CMGL: 1,0,,159
+		# Ejemplo de unreadList[3]: 07915892000000F0440B915892214365F7000421493261740100...
+		# Cada cabecera va seguida de su PDU; cualquier otra línea intercalada (un URC sin manejador) se ignora
+		smsList = [(unreadList[lineIndex], unreadList[lineIndex + 1]) for lineIndex in range(len(unreadList) - 1) if unreadList[lineIndex].startswith('+CMGL:')]
+		if smsList:
+			logger.write('DEBUG', '[SMS] Ha(n) llegado ' + str(len(smsList)) + ' nuevo(s) mensaje(s) de texto!')
+		for smsHeader, smsBody in smsList:
+			self.receiveSms(smsBody)
+			# Obtenemos el índice del mensaje en memoria y lo eliminamos porque ya fue leído
+			smsIndex = self.getSmsIndex(smsHeader.split(',')[0])
+			self.removeSms(smsIndex)
+		# Los mensajes nuevos y las llamadas llegan a los manejadores de URC, este hilo sólo espera que termine el lector
+		while self.isActive and self.atEngine is not None and self.atEngine.isActive:
+			self.atEngine.join(1.5)
+		self.isActive = False
 		logger.write('WARNING', '[GSM] Función \'%s\' terminada.' % inspect.stack()[0][3])
 
-	def send(self, message, telephoneNumber):
+	def receiveSms(self, pduData):
+		try:
+			telephoneNumber, dataCoding, smsData, concatInfo = smsPdu.decodeDeliver(pduData)
+		except (ValueError, TypeError, IndexError, KeyError, struct.error) as errorMessage:
+			logger.write('WARNING', '[GSM] PDU recibido inválido, descartado: %s' % str(errorMessage))
+			return
+		telephoneNumber = self.getCountryNumber(telephoneNumber) # Quitamos el código de país
+		# Comprobamos si el remitente del mensaje (un teléfono) está registrado...
+		if telephoneNumber in contactList.allowedNumbers.values() or not JSON_CONFIG["COMMUNICATOR"]["RECEPTION_FILTER"]:
+			# Las partes de un SMS concatenado pueden llegar desordenadas: se entrega el mensaje cuando están todas
+			concatResult = self.concatBuffer.add(telephoneNumber, dataCoding, smsData, concatInfo)
+			if concatResult is None:
+				return
+			dataCoding, smsData = concatResult
+			# La decodificación se hace en otro hilo, para no demorar la lectura del puerto serie
+			# (los datos de 8 bits son tramas binarias del codec; el texto puede traer una trama en base64)
+			if dataCoding == '8BIT':
+				self.frameDecoder.submit('GSM', smsData)
+			else:
+				self.frameDecoder.submit('GSM', smsPdu.decodeText(dataCoding, smsData), True)
+			#self.sendOutput(telephoneNumber, smsData) # -----> SOLO PARA LA DEMO <-----
+			logger.write('INFO', '[GSM] Mensaje de ' + str(telephoneNumber) + ' recibido correctamente!')
+		# ... sino, rechazamos el mensaje entrante.
+		else:
+			logger.write('WARNING', '[GSM] Mensaje de ' + str(telephoneNumber) + 'rechazado!')
+
+	def handleSms(self, smsHeader, smsBody):
+		# Significa un mensaje entrante
+		# Ejemplo smsHeader: +CMT: ,24
+		# Ejemplo smsBody  : 07915892000000F0040B915892214365F7000021493261740100...
+		self.receiveSms(smsBody)
+		try:
+			self.sendAT('AT+CNMA') # Enviamos el ACK (ńecesario sólo para los Dongle USB)
+		except AtError:
+			pass # La excepción aparece cuando el módem no soporta (no necesita) el ACK
+
+	def handleReport(self, reportHeader, reportBody):
+		# Significa un informe de entrega de un SMS enviado
+		# Ejemplo reportHeader: +CDS: 25
+		# Ejemplo reportBody  : 0006110D91453915520635F6612080...
+		try:
+			messageReference, telephoneNumber, reportStatus = smsPdu.decodeStatusReport(reportBody)
+		except (ValueError, TypeError, IndexError, struct.error) as errorMessage:
+			logger.write('WARNING', '[GSM] Informe de entrega inválido, descartado: %s' % str(errorMessage))
+			return
+		finally:
+			try:
+				self.sendAT('AT+CNMA') # Enviamos el ACK (ńecesario sólo para los Dongle USB)
+			except AtError:
+				pass
+		# La red sigue intentando entregar el mensaje: esperamos el informe definitivo
+		if 0x20 <= reportStatus < 0x40:
+			return
+		with self.reportLock:
+			reportEntry = self.reportDict.get(messageReference)
+			# Si nadie espera este informe (o el que había ya fue usado), lo dejamos para el envío que lo reclame
+			if reportEntry is None or reportEntry[0].isSet():
+				reportEntry = [threading.Event(), None, None]
+				self.reportDict[messageReference] = reportEntry
+			reportEntry[1] = reportStatus
+			reportEntry[2] = time.time()
+			reportEntry[0].set()
+
+	def handleCallEvent(self, urcLine, urcBody):
+		# Ejemplo urcLine: +CLIP: "+543512641040",145,"",0,"",0
+		# Ejemplo urcLine: +CMS ERROR: Requested facility not subscribed
+		# Un error de la red fuera de un comando no corresponde a ningún envío (cada 'AT+CMGS' recibe su propia respuesta)
+		if urcLine.startswith('+CMS ERROR'):
+			logger.write('WARNING', '[GSM] Error de la red: %s' % urcLine)
+		############################### LLAMADAS DE VOZ ###############################
+		# Significa una llamada entrante (el número llega a continuación, en el '+CLIP')
+		elif urcLine.startswith('RING'):
+			logger.write('DEBUG', '[GSM] Llamada entrante...')
+		elif urcLine.startswith('+CLIP'):
+			self.callerID = self.getTelephoneNumber(urcLine)
+			logger.write('INFO', '[GSM] El número %s está llamando...' % self.callerID)
+		# Significa que el destino se encuentra en otra llamada
+		elif urcLine.startswith('BUSY'):
+			logger.write('WARNING', '[GSM] El télefono destino se encuentra ocupado.')
+		# Significa que la llamada saliente pasó al buzón de voz
+		elif urcLine.startswith('NO ANSWER'):
+			logger.write('WARNING', '[GSM] No hubo respuesta durante la llamada de voz.')
+		# Significa que la llamada entrante se perdió (llamada perdida) o que el extremo colgo
+		elif urcLine.startswith('NO CARRIER'):
+			self.callerID = None
+			logger.write('WARNING', '[GSM] Se perdió la conexión con el otro extremo.')
+		############################# FIN LLAMADAS DE VOZ #############################
+
+	def send(self, message, telephoneNumber, frameCache = None):
 		# Comprobación de envío de texto plano
 		if isinstance(message, messageClass.Message) and hasattr(message, 'plainText'):
 			return self.sendMessage(message.plainText, telephoneNumber)
@@ -208,35 +256,12 @@ class Gsm(Modem):
 			return False
 		# Entonces se trata de enviar una instancia de mensaje
 		else:
-			return self.sendMessageInstance(message, telephoneNumber)
+			return self.sendMessageInstance(message, telephoneNumber, frameCache)
 
 	def sendMessage(self, plainText, telephoneNumber):
 		try:
-			#############################
-			timeCounter = 0
-			self.successfulSending = None
-			#############################
-			# Enviamos los comandos AT correspondientes para efectuar el envío el mensaje de texto
-			info01 = self.sendAT('AT+CMGS="' + str(telephoneNumber) + '"') # Numero al cual enviar el SMS
-			info02 = self.sendAT(plainText + ascii.ctrl('z'))              # Mensaje de texto terminado en Ctrl+z
-			# ------------------ Caso de envío EXITOSO ------------------
-			# Ejemplo de info02[0]: Mensaje enviado desde el Modem.\x1a\r\n
-			# Ejemplo de info02[1]: +CMGS: 17\r\n
-			# Ejemplo de info02[3]: OK\r\n
-			# Comprobamos si el envío fue exitoso
-			for i in info02:
-				if i.startswith('OK'):
-					self.successfulSending = True
-					break
-				elif i.startswith('+CMS ERROR'):
-					self.successfulSending = False
-					break
-			# Esperamos respuesta de la red si es que no la hubo
-			while self.successfulSending is None and timeCounter < 15:
-				time.sleep(1)
-				timeCounter += 1
-			# Comprobamos si hubo respuesta de la red y cual fue..
-			if self.successfulSending is True:
+			# Enviamos los comandos AT correspondientes y comprobamos la respuesta de la red (o el informe de entrega)
+			if self.sendSms(telephoneNumber, plainText, False):
 				logger.write('INFO', '[GSM] Mensaje de texto enviado a %s.' % str(telephoneNumber))
 				# Borramos el mensaje enviado almacenado en la memoria
 				self.removeAllSms()
@@ -248,35 +273,12 @@ class Gsm(Modem):
 			logger.write('ERROR', '[GSM] Error al enviar el mensaje de texto a %s.' % str(telephoneNumber))
 			return False
 
-	def sendMessageInstance(self, message, telephoneNumber):
+	def sendMessageInstance(self, message, telephoneNumber, frameCache = None):
 		try:
-			#############################
-			timeCounter = 0
-			self.successfulSending = None
-			#############################
-			# Serializamos el objeto para poder transmitirlo
-			serializedMessage = 'INSTANCE' + pickle.dumps(message)
-			# Enviamos los comandos AT correspondientes para efectuar el envío el mensaje de texto
-			info01 = self.sendAT('AT+CMGS="' + str(telephoneNumber) + '"') # Numero al cual enviar el SMS
-			info02 = self.sendAT(serializedMessage + ascii.ctrl('z'))      # Mensaje de texto terminado en Ctrl+Z
-			# ------------------ Caso de envío EXITOSO ------------------
-			# Ejemplo de info02[0]: Mensaje enviado desde el Modem.\x1a\r\n
-			# Ejemplo de info02[1]: +CMGS: 17\r\n
-			# Ejemplo de info02[3]: OK\r\n
-			# Comprobamos si el envío fue exitoso
-			for i in info02:
-				if i.startswith('OK'):
-					self.successfulSending = True
-					break
-				elif i.startswith('+CMS ERROR'):
-					self.successfulSending = False
-					break
-			# Esperamos respuesta de la red si es que no la hubo
-			while self.successfulSending is None and timeCounter < 15:
-				time.sleep(1)
-				timeCounter += 1
-			# Comprobamos si hubo respuesta de la red y cual fue..
-			if self.successfulSending is True:
+			# Serializamos el objeto para poder transmitirlo (en binario, ya que el SMS se envía en modo PDU de 8 bits)
+			serializedMessage = wireCodec.encode(message, 'GSM', frameCache)
+			# Enviamos los comandos AT correspondientes y comprobamos la respuesta de la red (o el informe de entrega)
+			if self.sendSms(telephoneNumber, serializedMessage, True):
 				logger.write('INFO', '[GSM] Instancia de mensaje enviada a %s.' % str(telephoneNumber))
 				# Borramos el mensaje enviado almacenado en la memoria
 				self.removeAllSms()
@@ -288,6 +290,63 @@ class Gsm(Modem):
 			logger.write('ERROR', '[GSM] Error al enviar la instancia de mensaje a %s.' % str(telephoneNumber))
 			return False
 
+	def sendSms(self, telephoneNumber, smsData, isBinary):
+		# Un mensaje que no entra en un SMS se envía concatenado: todas sus partes comparten la referencia
+		# Varios hilos de envío pueden usar el mismo módem: cada mensaje se queda con su propia referencia
+		with self.concatLock:
+			self.concatReference = (self.concatReference + 1) % 256
+			concatReference = self.concatReference
+		try:
+			pduList = smsPdu.encodeSubmit(telephoneNumber, smsData, isBinary, concatReference, DELIVERY_REPORTS)
+		except ValueError as errorMessage:
+			logger.write('ERROR', '[GSM] Mensaje demasiado grande para %s: %s' % (str(telephoneNumber), str(errorMessage)))
+			return False
+		sendTime = time.time()
+		referenceList = list()
+		try:
+			for tpduLength, pduData in pduList:
+				# El PDU se escribe (terminado en Ctrl+Z) cuando el módem lo pide con '> '
+				# La respuesta de la red ('+CMGS: <mr>' y 'OK', o '+CMS ERROR') llega como respuesta de este mismo comando
+				smsOutput = self.sendAT('AT+CMGS=' + str(tpduLength), SMS_TIMEOUT, pduData)
+				# Ejemplo de smsOutput: ['+CMGS: 17'] o ['^RSSI: 15', '+CMGS: 17'] (un URC sin manejador llega intercalado)
+				# La respuesta final fue 'OK', así que el mensaje ya fue aceptado aunque no se pueda leer su referencia
+				for atOutput in smsOutput:
+					if atOutput.startswith('+CMGS:'):
+						try:
+							referenceList.append(self.getSmsIndex(atOutput))
+						except ValueError:
+							logger.write('WARNING', '[GSM] Referencia de envío inválida: %s' % atOutput)
+						break
+		except AtError:
+			return False
+		if DELIVERY_REPORTS:
+			return self.waitDelivery(telephoneNumber, referenceList, sendTime)
+		return True
+
+	def waitDelivery(self, telephoneNumber, referenceList, sendTime):
+		# Cada envío espera sólo los informes de sus propias partes: varios SMS pueden estar en curso a la vez
+		deliveryTimeout = sendTime + DELIVERY_TIMEOUT
+		for messageReference in referenceList:
+			with self.reportLock:
+				reportEntry = self.reportDict.get(messageReference)
+				# Un informe anterior al envío corresponde a otro SMS con la misma referencia (el TP-MR se repite cada 256)
+				if reportEntry is None or (reportEntry[2] is not None and reportEntry[2] < sendTime):
+					reportEntry = [threading.Event(), None, None]
+					self.reportDict[messageReference] = reportEntry
+			reportEntry[0].wait(max(0, deliveryTimeout - time.time()))
+			with self.reportLock:
+				if self.reportDict.get(messageReference) is reportEntry:
+					del self.reportDict[messageReference]
+			# La red aceptó el mensaje pero el informe no llegó a tiempo: no lo volvemos a enviar
+			if reportEntry[1] is None:
+				logger.write('WARNING', '[GSM] Sin informe de entrega de %s (referencia %s).' % (str(telephoneNumber), messageReference))
+				return True
+			elif reportEntry[1] >= 0x40:
+				logger.write('WARNING', '[GSM] El mensaje a %s no fue entregado (estado %s).' % (str(telephoneNumber), hex(reportEntry[1])))
+				return False
+		logger.write('DEBUG', '[GSM] Mensaje entregado a %s en %.1f segundos.' % (str(telephoneNumber), time.time() - sendTime))
+		return True
+
 	def sendVoiceCall(self, telephoneNumber):
 		try:
 			self.sendAT('ATD' + str(telephoneNumber) + ';') # Numero al cual se quiere llamar
@@ -356,6 +415,9 @@ class Gsm(Modem):
 		elif headerList[0].startswith('+CMGL'):
 			# Ejemplo de headerList[2]: "+5493512560536" | "876966" | "100" | "PromRecarga"
 			telephoneNumber = headerList[2].replace('"', '') # Quitamos las comillas
+		return self.getCountryNumber(telephoneNumber)
+
+	def getCountryNumber(self, telephoneNumber):
 		############################### QUITAMOS EL CODIGO DE PAIS ###############################
 		# Ejemplo de telephoneNumber: +543512641040 | +5493512560536 | 876966 | 100 | PromRecarga
 		if telephoneNumber.startswith('+549'):
@@ -382,4 +444,148 @@ class Gsm(Modem):
 			smsMessage = 'El comando es incorrecto! No se encontró el ejecutable.'
 		finally:
 			#self.send(telephoneNumber, smsMessage)
-			pass
\ No newline at end of file
+			pass
+class GsmPool(object):
+
+	receptionQueue = None
+	frameDecoder = None # Se asigna a cada módem que se agrega al conjunto
+	modemDict = None    # Puerto serie --> instancia Gsm (incluye los puertos descartados, hasta que desaparezcan)
+	probeDict = None    # Puerto serie --> [pruebas fallidas seguidas, momento de la próxima prueba]
+	voiceModem = None   # Módem que está cursando la llamada de voz
+
+	isActive = False
+
+	def __init__(self, _receptionQueue):
+		self.receptionQueue = _receptionQueue
+		self.modemDict = dict()
+		self.probeDict = dict()
+		self.modemLock = threading.Lock()
+		self.modemCounter = itertools.count()
+
+	def __del__(self):
+		for serialPort in self.getSerialPorts():
+			self.removeModem(serialPort)
+		logger.write('INFO', '[GSM] Conjunto de módems destruido.')
+
+	def getSerialPorts(self):
+		with self.modemLock:
+			return self.modemDict.keys()
+
+	def getModem(self, serialPort):
+		with self.modemLock:
+			return self.modemDict.get(serialPort)
+
+	def getActiveModems(self):
+		with self.modemLock:
+			return [gsmInstance for gsmInstance in self.modemDict.values() if gsmInstance.isActive]
+
+	def needsProbe(self, serialPort):
+		# Un puerto se vuelve a probar si no respondió (un dongle que todavía está arrancando) o si su lector terminó,
+		# esperando cada vez más entre una prueba y la siguiente
+		with self.modemLock:
+			gsmInstance = self.modemDict.get(serialPort)
+			if gsmInstance is None:
+				return True
+			if gsmInstance.isResponding():
+				return False
+			# El puerto secundario de un módem que sigue funcionando no se vuelve a probar
+			for modemInstance in self.modemDict.values():
+				if modemInstance is not gsmInstance and gsmInstance.imei is not None and modemInstance.imei == gsmInstance.imei and modemInstance.isResponding():
+					return False
+			probeEntry = self.probeDict.get(serialPort)
+			return probeEntry is None or time.time() >= probeEntry[1]
+
+	def addModem(self, serialPort):
+		# Si el puerto ya se había probado, se descarta la instancia anterior (que no responde)
+		self.removeModem(serialPort, False)
+		gsmInstance = Gsm(self.receptionQueue)
+		gsmInstance.frameDecoder = self.frameDecoder
+		if gsmInstance.connect(serialPort):
+			# Un dongle puede ofrecer más de un puerto con comandos AT: se usa sólo el primero que encontramos
+			with self.modemLock:
+				imeiList = [modemInstance.imei for modemInstance in self.modemDict.values() if modemInstance.isResponding()]
+			if gsmInstance.imei is not None and gsmInstance.imei in imeiList:
+				logger.write('DEBUG', '[GSM] %s es un puerto secundario de un módem ya conectado, descartado.' % serialPort)
+				gsmInstance.successfulConnection = False
+		if not gsmInstance.successfulConnection:
+			gsmInstance.isActive = False
+			gsmInstance.closePort()
+		with self.modemLock:
+			self.modemDict[serialPort] = gsmInstance
+			if gsmInstance.successfulConnection:
+				self.probeDict.pop(serialPort, None)
+			else:
+				probeEntry = self.probeDict.setdefault(serialPort, [0, 0])
+				probeEntry[1] = time.time() + min(MAX_PROBE_RETRY, PROBE_RETRY * 2 ** probeEntry[0])
+				probeEntry[0] += 1
+		return gsmInstance
+
+	def removeModem(self, serialPort, portRemoved = True):
+		with self.modemLock:
+			gsmInstance = self.modemDict.pop(serialPort, None)
+			# Si el dispositivo desapareció, cuando vuelva a aparecer se lo prueba enseguida
+			if portRemoved:
+				self.probeDict.pop(serialPort, None)
+		if gsmInstance is not None:
+			gsmInstance.isActive = False
+			gsmInstance.closePort()
+			if self.voiceModem is gsmInstance:
+				self.voiceModem = None
+
+	def updateStatus(self):
+		# El transmisor y el comunicador consultan 'isActive' como en cualquier otro medio
+		self.isActive = len(self.getActiveModems()) > 0
+		return self.isActive
+
+	def acquireModem(self):
+		# Elegimos el módem activo con menos envíos en curso (ante un empate, se van turnando)
+		with self.modemLock:
+			modemList = [gsmInstance for gsmInstance in self.modemDict.values() if gsmInstance.isActive]
+			if len(modemList) == 0:
+				return None
+			startIndex = self.modemCounter.next() % len(modemList)
+			modemList = modemList[startIndex:] + modemList[:startIndex]
+			gsmInstance = min(modemList, key = lambda modemInstance: modemInstance.pendingSends)
+			gsmInstance.pendingSends += 1
+			return gsmInstance
+
+	def releaseModem(self, gsmInstance):
+		with self.modemLock:
+			gsmInstance.pendingSends -= 1
+
+	def send(self, message, telephoneNumber, frameCache = None):
+		gsmInstance = self.acquireModem()
+		if gsmInstance is None:
+			logger.write('WARNING', '[GSM] No hay ningún módem disponible para el envío!')
+			return False
+		try:
+			return gsmInstance.send(message, telephoneNumber, frameCache)
+		finally:
+			self.releaseModem(gsmInstance)
+
+	def sendVoiceCall(self, telephoneNumber):
+		gsmInstance = self.acquireModem()
+		if gsmInstance is None:
+			return False
+		try:
+			self.voiceModem = gsmInstance
+			return gsmInstance.sendVoiceCall(telephoneNumber)
+		finally:
+			self.releaseModem(gsmInstance)
+
+	def answerVoiceCall(self):
+		# Atendemos en el módem que recibió la llamada
+		for gsmInstance in self.getActiveModems():
+			if gsmInstance.callerID is not None:
+				self.voiceModem = gsmInstance
+				return gsmInstance.answerVoiceCall()
+		return False
+
+	def hangUpVoiceCall(self):
+		if self.voiceModem is not None:
+			gsmInstance = self.voiceModem
+			self.voiceModem = None
+			return gsmInstance.hangUpVoiceCall()
+		# Si no hay una llamada registrada (por ejemplo, una entrante sin atender), colgamos en los módems que la reciben
+		modemList = [gsmInstance for gsmInstance in self.getActiveModems() if gsmInstance.callerID is not None]
+		return all([gsmInstance.hangUpVoiceCall() for gsmInstance in modemList]) and len(modemList) > 0
@@ -0,0 +1,264 @@
+# coding=utf-8
+
+import os
+import pty
+import tty
+import time
+import random
+import select
+import smsPdu
+import inspect
+import binascii
+import threading
+
+import logger
+
+from curses import ascii # Para reconocer el Ctrl-Z
+
+class ModemSimulator(threading.Thread):
+
+	portName = None       # Pseudo-terminal que se le pasa a 'Gsm.connect' (por ejemplo, '/dev/pts/3')
+	responseDelay = 0     # Segundos que demora cada respuesta final
+	sendDelay = 0         # Segundos que demora la red en confirmar un SMS enviado
+	errorRate = 0         # Probabilidad de que la red rechace un SMS enviado ('+CMS ERROR')
+	dialResult = None     # Resultado de una llamada saliente (None --> atendida, 'BUSY', 'NO ANSWER', 'NO CARRIER')
+	reportDelay = 0       # Segundos que demora el informe de entrega ('+CDS') de un SMS que lo pidió
+	reportStatus = 0      # Estado del informe de entrega (0 --> entregado, 0x40 o más --> no entregado)
+	imei = None           # Respuesta a 'AT+CGSN'
+
+	echoEnabled = True    # 'ATE1' / 'ATE0'
+	smsMode = 1           # 'AT+CMGF' (0 --> PDU, 1 --> texto)
+	reportMode = False    # 'AT+CNMI' con informes de entrega habilitados (cuarto parámetro en 1)
+	smsDestination = None # Argumento del 'AT+CMGS' en curso (el texto o PDU llega después del '> ')
+	callState = None      # None, 'RINGING' (entrante), 'ACTIVE' (en curso)
+	sentList = None       # Texto o PDU de cada SMS enviado, en orden
+	storedDict = None     # Índice --> [estado (0 --> no leído, 1 --> leído), PDU] de los SMS en memoria
+	failDict = None       # Prefijo de comando --> respuesta de error que se devuelve una única vez
+	messageReference = 0  # Último TP-MR asignado a un SMS enviado
+	commandCount = 0      # Cantidad de comandos AT recibidos
+
+	isActive = False
+
+	def __init__(self, _responseDelay = 0, _sendDelay = 0, _errorRate = 0, _imei = '356938035643809'):
+		threading.Thread.__init__(self, name = 'ModemSimulator')
+		self.responseDelay = _responseDelay
+		self.sendDelay = _sendDelay
+		self.errorRate = _errorRate
+		self.imei = _imei
+		self.sentList = list()
+		self.storedDict = dict()
+		self.failDict = dict()
+		self.writeLock = threading.Lock()
+		# El extremo esclavo queda abierto, para que el maestro no falle mientras ningún cliente usa el puerto
+		self.masterDescriptor, self.slaveDescriptor = pty.openpty()
+		tty.setraw(self.slaveDescriptor)
+		self.portName = os.ttyname(self.slaveDescriptor)
+
+	def stop(self):
+		self.isActive = False
+		if self.ident is not None:
+			self.join()
+		os.close(self.masterDescriptor)
+		os.close(self.slaveDescriptor)
+
+	def run(self):
+		self.isActive = True
+		inputBuffer = ''
+		while self.isActive:
+			if not select.select([self.masterDescriptor], [], [], 0.5)[0]:
+				continue
+			try:
+				inputBuffer += os.read(self.masterDescriptor, 4096)
+			except OSError:
+				break
+			inputBuffer = self.processInput(inputBuffer)
+		logger.write('DEBUG', '[SIMULATOR] Función \'%s\' terminada.' % inspect.stack()[0][3])
+
+	def write(self, outputData):
+		# Las respuestas y los URC que se envían desde otros hilos no se mezclan dentro de una línea
+		with self.writeLock:
+			os.write(self.masterDescriptor, outputData)
+
+	def reply(self, lineList, finalResult = 'OK'):
+		time.sleep(self.responseDelay)
+		self.write(''.join('\r\n%s\r\n' % outputLine for outputLine in lineList + [finalResult]))
+
+	def failNext(self, commandPrefix, errorLine = 'ERROR'):
+		# Ejemplo: failNext('AT+CMGS', '+CMS ERROR: 38') --> el próximo envío falla por la red
+		self.failDict[commandPrefix.upper()] = errorLine
+
+	def processInput(self, inputBuffer):
+		while True:
+			# Luego del '> ', el texto (o PDU) termina en Ctrl-Z; un ESC cancela el envío
+			if self.smsDestination is not None:
+				endIndex = inputBuffer.find(ascii.ctrl('z'))
+				escapeIndex = inputBuffer.find(chr(ascii.ESC))
+				if escapeIndex >= 0 and (endIndex < 0 or escapeIndex < endIndex):
+					inputBuffer = inputBuffer[escapeIndex + 1:]
+					self.smsDestination = None
+					self.reply([])
+					continue
+				if endIndex < 0:
+					return inputBuffer
+				smsData = inputBuffer[:endIndex]
+				inputBuffer = inputBuffer[endIndex + 1:]
+				if self.echoEnabled:
+					self.write(smsData + ascii.ctrl('z'))
+				self.completeSms(smsData)
+				continue
+			lineEnd = inputBuffer.find('\r')
+			if lineEnd < 0:
+				return inputBuffer
+			commandLine = inputBuffer[:lineEnd].strip()
+			inputBuffer = inputBuffer[lineEnd + 1:]
+			if self.echoEnabled:
+				self.write(commandLine + '\r')
+			if commandLine:
+				self.processCommand(commandLine)
+
+	def processCommand(self, commandLine):
+		self.commandCount += 1
+		upperCommand = commandLine.upper()
+		for commandPrefix in self.failDict.keys():
+			if upperCommand.startswith(commandPrefix):
+				self.reply([], self.failDict.pop(commandPrefix))
+				return
+		if not upperCommand.startswith('AT'):
+			self.reply([], 'ERROR')
+			return
+		atCommand, atArgument = upperCommand[2:].partition('=')[0], commandLine[2:].partition('=')[2]
+		if atCommand in ('', 'Z'):
+			self.echoEnabled = True if atCommand == 'Z' else self.echoEnabled
+			self.reply([])
+		elif atCommand in ('E0', 'E1'):
+			self.echoEnabled = atCommand == 'E1'
+			self.reply([])
+		elif atCommand in ('+CMEE', '+CLIP', '+CSMP', '+CNMA'):
+			self.reply([])
+		elif atCommand == '+CNMI':
+			self.reportMode = atArgument.split(',')[3:4] == ['1']
+			self.reply([])
+		elif atCommand == '+CMGF':
+			self.smsMode = int(atArgument)
+			self.reply([])
+		elif atCommand == '+CGSN':
+			self.reply([self.imei])
+		elif atCommand == '+CMGS':
+			self.smsDestination = atArgument
+			time.sleep(self.responseDelay)
+			self.write('\r\n> ')
+		elif atCommand == '+CMGL':
+			self.listSms(atArgument)
+		elif atCommand == '+CMGD':
+			self.deleteSms(atArgument)
+		elif atCommand.startswith('D') and atCommand.endswith(';'):
+			self.reply([])
+			# La llamada saliente se atiende enseguida, salvo que se haya configurado otro resultado
+			if self.dialResult is None:
+				self.callState = 'ACTIVE'
+			else:
+				self.write('\r\n%s\r\n' % self.dialResult)
+		elif atCommand == 'A':
+			if self.callState == 'RINGING':
+				self.callState = 'ACTIVE'
+				self.reply([])
+			else:
+				self.reply([], 'NO CARRIER')
+		elif atCommand == 'H':
+			self.callState = None
+			self.reply([])
+		else:
+			self.reply([], 'ERROR')
+
+	def completeSms(self, smsData):
+		smsDestination = self.smsDestination
+		self.smsDestination = None
+		reportRequest = False
+		# En modo PDU, el largo declarado en el 'AT+CMGS' es el del TPDU (sin el centro de mensajes)
+		if self.smsMode == 0:
+			try:
+				pduData = binascii.unhexlify(smsData.strip())
+				tpduOffset = ord(pduData[0]) + 1
+				if len(pduData) - tpduOffset != int(smsDestination):
+					raise ValueError(smsDestination)
+				reportRequest = ord(pduData[tpduOffset]) & smsPdu.REPORT_REQUEST
+				smsDestination = smsPdu.decodeAddress(pduData, tpduOffset + 2)[0]
+			except (TypeError, ValueError, IndexError):
+				self.reply([], '+CMS ERROR: 304')
+				return
+		time.sleep(self.sendDelay)
+		if random.random() < self.errorRate:
+			self.reply([], '+CMS ERROR: 500')
+			return
+		self.messageReference = (self.messageReference + 1) % 256
+		self.sentList.append(smsData)
+		self.reply(['+CMGS: %s' % self.messageReference])
+		# El informe de entrega llega más tarde, como URC, sin demorar los comandos siguientes
+		if reportRequest and self.reportMode:
+			reportTimer = threading.Timer(self.reportDelay, self.pushReport, (self.messageReference, smsDestination, self.reportStatus))
+			reportTimer.daemon = True
+			reportTimer.start()
+
+	def listSms(self, atArgument):
+		# PDU: 0 --> no leídos, 1 --> leídos, 4 --> todos (en modo texto se lista con el PDU ya decodificado)
+		listStatus = {'0' : 0, '1' : 1, '"REC UNREAD"' : 0, '"REC READ"' : 1}.get(atArgument.strip().upper(), None)
+		lineList = list()
+		for smsIndex in sorted(self.storedDict):
+			smsStatus, pduData = self.storedDict[smsIndex]
+			if listStatus is not None and smsStatus != listStatus:
+				continue
+			if self.smsMode == 0:
+				lineList.append('+CMGL: %s,%s,,%s' % (smsIndex, smsStatus, len(pduData) / 2 - 1))
+				lineList.append(pduData)
+			else:
+				telephoneNumber, dataCoding, smsData, concatInfo = smsPdu.decodeDeliver(pduData)
+				statusName = ('"REC UNREAD"', '"REC READ"')[smsStatus]
+				lineList.append('+CMGL: %s,%s,"%s",,"%s"' % (smsIndex, statusName, telephoneNumber, time.strftime('%y/%m/%d,%H:%M:%S')))
+				lineList.append(smsPdu.decodeText(dataCoding, smsData))
+			self.storedDict[smsIndex][0] = 1
+		self.reply(lineList)
+
+	def deleteSms(self, atArgument):
+		argumentList = atArgument.split(',')
+		# Con un segundo argumento distinto de 0 se borran varios mensajes (todos los leídos, en este simulador)
+		if len(argumentList) > 1 and int(argumentList[1]) > 0:
+			for smsIndex in self.storedDict.keys():
+				if self.storedDict[smsIndex][0] == 1 or int(argumentList[1]) == 4:
+					del self.storedDict[smsIndex]
+			self.reply([])
+		elif int(argumentList[0]) in self.storedDict:
+			del self.storedDict[int(argumentList[0])]
+			self.reply([])
+		else:
+			self.reply([], '+CMS ERROR: 321')
+
+	def pushSms(self, telephoneNumber, messageData, isBinary = False):
+		# Llega un '+CMT' por cada parte (modo PDU), o el texto tal cual (modo texto)
+		self.messageReference = (self.messageReference + 1) % 256
+		if self.smsMode == 0:
+			for tpduLength, pduData in smsPdu.encodeDeliver(telephoneNumber, messageData, isBinary, self.messageReference):
+				self.write('\r\n+CMT: ,%s\r\n%s\r\n' % (tpduLength, pduData))
+		else:
+			self.write('\r\n+CMT: "%s",,"%s"\r\n%s\r\n' % (telephoneNumber, time.strftime('%y/%m/%d,%H:%M:%S'), messageData))
+
+	def storeSms(self, telephoneNumber, messageData, isBinary = False):
+		# Mensajes que llegaron mientras el módem no estaba atendido (se leen con 'AT+CMGL')
+		self.messageReference = (self.messageReference + 1) % 256
+		for tpduLength, pduData in smsPdu.encodeDeliver(telephoneNumber, messageData, isBinary, self.messageReference):
+			smsIndex = max(self.storedDict.keys() + [-1]) + 1
+			self.storedDict[smsIndex] = [0, pduData]
+
+	def pushReport(self, messageReference, telephoneNumber, reportStatus = 0):
+		if self.isActive:
+			tpduLength, pduData = smsPdu.encodeStatusReport(messageReference, telephoneNumber, reportStatus)
+			self.write('\r\n+CDS: %s\r\n%s\r\n' % (tpduLength, pduData))
+
+	def pushRing(self, telephoneNumber):
+		self.callState = 'RINGING'
+		self.write('\r\nRING\r\n\r\n+CLIP: "%s",145,"",0,"",0\r\n' % telephoneNumber)
+
+	def hangUpRemote(self):
+		# El otro extremo corta la llamada (entrante o en curso)
+		if self.callState is not None:
+			self.callState = None
+			self.write('\r\nNO CARRIER\r\n')
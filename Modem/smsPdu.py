@@ -0,0 +1,307 @@
+# coding=utf-8
+
+import json
+import time
+import struct
+import binascii
+import threading
+
+import logger
+
+JSON_FILE = 'config.json'
+JSON_CONFIG = json.load(open(JSON_FILE))
+
+CONCAT_TIMEOUT = JSON_CONFIG["MODEM"]["CONCAT_TIMEOUT"] # Segundos que se esperan las partes faltantes de un SMS concatenado
+
+# Alfabeto por defecto GSM 03.38 (el índice es el septeto) y su tabla de extensión (precedida por el escape 0x1B)
+GSM7_BASIC = (u'@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !"#¤%&\'()*+,-./0123456789:;<=>?'
+              u'¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà')
+GSM7_EXTENSION = {u'\f' : 0x0A, u'^' : 0x14, u'{' : 0x28, u'}' : 0x29, u'\\' : 0x2F,
+                  u'[' : 0x3C, u'~' : 0x3D, u']' : 0x3E, u'|' : 0x40, u'€' : 0x65}
+
+GSM7_ESCAPE = 0x1B
+GSM7_SEPTETS = dict((gsmChar, septet) for septet, gsmChar in enumerate(GSM7_BASIC) if septet != GSM7_ESCAPE)
+GSM7_CHARS = dict((septet, gsmChar) for gsmChar, septet in GSM7_EXTENSION.items())
+
+# Codificación del texto --> (TP-DCS, capacidad de un SMS simple, capacidad de cada parte de un SMS concatenado)
+# (7 bits en septetos; 8 bits y UCS2 en octetos: la cabecera de concatenación ocupa 6 octetos)
+DATA_CODINGS = {
+	'7BIT' : (0x00, 160, 153),
+	'8BIT' : (0x04, 140, 134),
+	'UCS2' : (0x08, 140, 134)
+}
+
+SUBMIT_TYPE = 0x11      # SMS-SUBMIT con período de validez relativo
+DELIVER_TYPE = 0x04     # SMS-DELIVER sin más mensajes en espera
+REPORT_TYPE = 0x06      # SMS-STATUS-REPORT
+REPORT_REQUEST = 0x20   # El remitente pide el informe de entrega (TP-SRR)
+UDH_INDICATOR = 0x40    # El campo de datos comienza con una cabecera (UDH)
+VALIDITY_PERIOD = 0xA7  # Período de validez relativo: 24 horas
+CONCAT_8BIT_IEI = 0x00  # Elemento de la cabecera para concatenación con referencia de 8 bits
+CONCAT_16BIT_IEI = 0x08 # Elemento de la cabecera para concatenación con referencia de 16 bits
+
+def packSeptets(septetList, fillBits = 0):
+	# Los septetos se empaquetan de a 8 bits, comenzando por el bit menos significativo
+	# ('fillBits' alinea el texto con el final de la cabecera, cuando la hay)
+	packedData = bytearray()
+	bitBuffer = 0
+	bitCount = fillBits
+	for septet in septetList:
+		bitBuffer |= septet << bitCount
+		bitCount += 7
+		while bitCount >= 8:
+			packedData.append(bitBuffer & 0xFF)
+			bitBuffer >>= 8
+			bitCount -= 8
+	if bitCount > 0:
+		packedData.append(bitBuffer & 0xFF)
+	return str(packedData)
+
+def unpackSeptets(packedData, septetCount, fillBits = 0):
+	septetList = list()
+	bitBuffer = 0
+	bitCount = -fillBits
+	for packedByte in bytearray(packedData):
+		if bitCount < 0:
+			packedByte >>= fillBits
+		bitBuffer |= packedByte << max(0, bitCount)
+		bitCount += 8
+		while bitCount >= 7 and len(septetList) < septetCount:
+			septetList.append(bitBuffer & 0x7F)
+			bitBuffer >>= 7
+			bitCount -= 7
+	return septetList
+
+def isGsm7(unicodeText):
+	return all(textChar in GSM7_SEPTETS or textChar in GSM7_EXTENSION for textChar in unicodeText)
+
+def encodeGsm7(unicodeText):
+	# Cada carácter es una lista de septetos, para no separar un escape de su carácter al dividir el texto en partes
+	charList = list()
+	for textChar in unicodeText:
+		if textChar in GSM7_SEPTETS:
+			charList.append([GSM7_SEPTETS[textChar]])
+		else:
+			charList.append([GSM7_ESCAPE, GSM7_EXTENSION[textChar]])
+	return charList
+
+def decodeGsm7(septetList):
+	unicodeText = list()
+	isEscaped = False
+	for septet in septetList:
+		if isEscaped:
+			unicodeText.append(GSM7_CHARS.get(septet, u' '))
+			isEscaped = False
+		elif septet == GSM7_ESCAPE:
+			isEscaped = True
+		else:
+			unicodeText.append(GSM7_BASIC[septet])
+	return u''.join(unicodeText)
+
+def encodeAddress(telephoneNumber):
+	# Ejemplo: '+5493512560536' --> '0D91' + '453915520635F6' (dígitos invertidos de a pares, completando con 'F')
+	telephoneNumber = str(telephoneNumber)
+	addressType = 0x81
+	if telephoneNumber.startswith('+'):
+		telephoneNumber = telephoneNumber[1:]
+		addressType = 0x91
+	paddedNumber = telephoneNumber + 'F' * (len(telephoneNumber) % 2)
+	swappedNumber = ''.join(paddedNumber[index + 1] + paddedNumber[index] for index in range(0, len(paddedNumber), 2))
+	return chr(len(telephoneNumber)) + chr(addressType) + binascii.unhexlify(swappedNumber)
+
+def decodeAddress(pduData, offset):
+	# Devuelve el número (o el nombre alfanumérico del remitente) y la posición del campo siguiente
+	digitCount, addressType = struct.unpack_from('BB', pduData, offset)
+	addressLength = (digitCount + 1) / 2
+	addressData = pduData[offset + 2:offset + 2 + addressLength]
+	if addressType & 0x70 == 0x50:
+		telephoneNumber = decodeGsm7(unpackSeptets(addressData, digitCount * 4 / 7)).encode('utf-8')
+	else:
+		swappedNumber = binascii.hexlify(addressData).upper()
+		telephoneNumber = ''.join(swappedNumber[index + 1] + swappedNumber[index] for index in range(0, len(swappedNumber), 2))
+		telephoneNumber = telephoneNumber[:digitCount]
+		if addressType & 0x70 == 0x10:
+			telephoneNumber = '+' + telephoneNumber
+	return telephoneNumber, offset + 2 + addressLength
+
+def getDataCoding(dataCodingScheme):
+	# Grupo de codificación general (00xx) y grupo de clase de mensaje (1111)
+	if dataCodingScheme & 0xC0 == 0x00:
+		return ('7BIT', '8BIT', 'UCS2', '7BIT')[(dataCodingScheme >> 2) & 0x03]
+	elif dataCodingScheme & 0xF0 == 0xF0:
+		return '8BIT' if dataCodingScheme & 0x04 else '7BIT'
+	elif dataCodingScheme & 0xF0 == 0xE0:
+		return 'UCS2'
+	return '7BIT'
+
+def encodeUserData(messageData, isBinary, concatReference):
+	# Devuelve la lista de (TP-DCS, TP-UDL, TP-UD con su cabecera), una por cada SMS necesario
+	# Las tramas del codec viajan en 8 bits; el texto en 7 bits si el alfabeto GSM alcanza, sino en UCS2
+	if isBinary:
+		dataCoding = '8BIT'
+		unitList = [messageData[index] for index in range(len(messageData))]
+	else:
+		unicodeText = messageData if isinstance(messageData, unicode) else messageData.decode('utf-8', 'replace')
+		if isGsm7(unicodeText):
+			dataCoding = '7BIT'
+			unitList = encodeGsm7(unicodeText)
+		else:
+			dataCoding = 'UCS2'
+			utf16Text = unicodeText.encode('utf-16-be')
+			unitList = [utf16Text[index:index + 2] for index in range(0, len(utf16Text), 2)]
+	dataCodingScheme, singleCapacity, partCapacity = DATA_CODINGS[dataCoding]
+	# Un mensaje que no entra en un SMS se divide en la menor cantidad posible de partes
+	partList = [list()]
+	partSize = 0
+	totalSize = sum(len(unitData) for unitData in unitList)
+	capacity = singleCapacity if totalSize <= singleCapacity else partCapacity
+	for unitData in unitList:
+		if partSize + len(unitData) > capacity:
+			partList.append(list())
+			partSize = 0
+		partList[-1].append(unitData)
+		partSize += len(unitData)
+	if len(partList) > 255:
+		raise ValueError('el mensaje necesita %s partes (el máximo es 255)' % len(partList))
+	userDataList = list()
+	for partNumber, unitList in enumerate(partList, 1):
+		userHeader = ''
+		if len(partList) > 1:
+			userHeader = struct.pack('BBBBBB', 5, CONCAT_8BIT_IEI, 3, concatReference & 0xFF, len(partList), partNumber)
+		if dataCoding == '7BIT':
+			septetList = [septet for septetData in unitList for septet in septetData]
+			headerSeptets = (len(userHeader) * 8 + 6) / 7
+			fillBits = headerSeptets * 7 - len(userHeader) * 8
+			userDataLength = headerSeptets + len(septetList)
+			userData = userHeader + packSeptets(septetList, fillBits)
+		else:
+			userData = userHeader + ''.join(unitList)
+			userDataLength = len(userData)
+		userDataList.append((dataCodingScheme, userDataLength, userData))
+	return userDataList
+
+def encodeSubmit(telephoneNumber, messageData, isBinary, concatReference, reportRequest = False):
+	# Devuelve la lista de (longitud del TPDU para 'AT+CMGS', PDU en hexadecimal), una por cada SMS a enviar
+	pduList = list()
+	userDataList = encodeUserData(messageData, isBinary, concatReference)
+	for dataCodingScheme, userDataLength, userData in userDataList:
+		firstOctet = SUBMIT_TYPE | (UDH_INDICATOR if len(userDataList) > 1 else 0) | (REPORT_REQUEST if reportRequest else 0)
+		# TP-MR en 0: el módem asigna la referencia del mensaje
+		tpduData = struct.pack('BB', firstOctet, 0) + encodeAddress(telephoneNumber)
+		tpduData += struct.pack('BBBB', 0, dataCodingScheme, VALIDITY_PERIOD, userDataLength) + userData
+		# El '00' inicial indica que se usa el centro de mensajes configurado en la SIM
+		pduList.append((len(tpduData), '00' + binascii.hexlify(tpduData).upper()))
+	return pduList
+
+def encodeTimeStamp():
+	# Fecha y hora actual en semi-octetos invertidos, con zona horaria 0
+	timeStamp = time.strftime('%y%m%d%H%M%S') + '00'
+	return binascii.unhexlify(''.join(timeStamp[index + 1] + timeStamp[index] for index in range(0, len(timeStamp), 2)))
+
+def encodeDeliver(telephoneNumber, messageData, isBinary, concatReference):
+	# SMS-DELIVER tal como lo entrega el módem (lo usa el simulador para generar los mensajes entrantes)
+	pduList = list()
+	timeStamp = encodeTimeStamp()
+	userDataList = encodeUserData(messageData, isBinary, concatReference)
+	for dataCodingScheme, userDataLength, userData in userDataList:
+		firstOctet = DELIVER_TYPE | (UDH_INDICATOR if len(userDataList) > 1 else 0)
+		tpduData = chr(firstOctet) + encodeAddress(telephoneNumber) + struct.pack('BB', 0, dataCodingScheme)
+		tpduData += timeStamp + chr(userDataLength) + userData
+		pduList.append((len(tpduData), '00' + binascii.hexlify(tpduData).upper()))
+	return pduList
+
+def encodeStatusReport(messageReference, telephoneNumber, reportStatus):
+	# SMS-STATUS-REPORT tal como lo entrega el módem (lo usa el simulador para confirmar las entregas)
+	tpduData = struct.pack('BB', REPORT_TYPE, messageReference) + encodeAddress(telephoneNumber)
+	tpduData += encodeTimeStamp() + encodeTimeStamp() + chr(reportStatus)
+	return len(tpduData), '00' + binascii.hexlify(tpduData).upper()
+
+def decodeStatusReport(pduHex):
+	# Devuelve (referencia del mensaje enviado, destinatario, estado)
+	# Estado: 0x00-0x1F --> entregado, 0x20-0x3F --> la red sigue intentando, 0x40 o más --> no se entregó
+	pduData = binascii.unhexlify(pduHex.strip())
+	offset = ord(pduData[0]) + 1 # Salteamos la dirección del centro de mensajes
+	messageReference = ord(pduData[offset + 1])
+	telephoneNumber, offset = decodeAddress(pduData, offset + 2)
+	reportStatus = ord(pduData[offset + 14]) # Salteamos la fecha de envío y la de entrega
+	return messageReference, telephoneNumber, reportStatus
+
+def decodeDeliver(pduHex):
+	# Devuelve (remitente, codificación, datos, (referencia, partes, número de parte) o None si no es concatenado)
+	# Los datos de 7 bits se devuelven ya como texto UTF-8; los de 8 bits y UCS2, tal cual llegaron
+	pduData = binascii.unhexlify(pduHex.strip())
+	offset = ord(pduData[0]) + 1 # Salteamos la dirección del centro de mensajes
+	firstOctet = ord(pduData[offset])
+	telephoneNumber, offset = decodeAddress(pduData, offset + 1)
+	protocolId, dataCodingScheme = struct.unpack_from('BB', pduData, offset)
+	offset += 2 + 7 # Salteamos la fecha y hora del centro de mensajes
+	userDataLength = ord(pduData[offset])
+	userData = pduData[offset + 1:]
+	dataCoding = getDataCoding(dataCodingScheme)
+	concatInfo = None
+	headerLength = 0
+	if firstOctet & UDH_INDICATOR:
+		headerLength = ord(userData[0]) + 1
+		elementOffset = 1
+		while elementOffset < headerLength:
+			elementId, elementLength = struct.unpack_from('BB', userData, elementOffset)
+			elementData = userData[elementOffset + 2:elementOffset + 2 + elementLength]
+			if elementId == CONCAT_8BIT_IEI and elementLength == 3:
+				concatInfo = struct.unpack('BBB', elementData)
+			elif elementId == CONCAT_16BIT_IEI and elementLength == 4:
+				concatInfo = struct.unpack('>HBB', elementData)
+			elementOffset += 2 + elementLength
+	if dataCoding == '7BIT':
+		headerSeptets = (headerLength * 8 + 6) / 7
+		fillBits = headerSeptets * 7 - headerLength * 8
+		septetList = unpackSeptets(userData[headerLength:], userDataLength - headerSeptets, fillBits)
+		messageData = decodeGsm7(septetList).encode('utf-8')
+	else:
+		messageData = userData[headerLength:userDataLength]
+	return telephoneNumber, dataCoding, messageData, concatInfo
+
+def decodeText(dataCoding, messageData):
+	# Los datos de 7 bits ya son texto UTF-8; los de UCS2 se decodifican recién con el mensaje completo
+	if dataCoding == 'UCS2':
+		return messageData.decode('utf-16-be', 'replace').encode('utf-8')
+	return messageData
+
+class ConcatBuffer(object):
+
+	partsDict = None # (remitente, referencia, partes) --> [momento de la primera parte, codificación, {número de parte: datos}]
+	expiredCount = 0 # Cantidad de mensajes concatenados descartados porque no llegaron todas sus partes
+
+	def __init__(self, _timeOut = CONCAT_TIMEOUT):
+		self.timeOut = _timeOut
+		self.partsDict = dict()
+		self.partsLock = threading.Lock()
+
+	def add(self, telephoneNumber, dataCoding, messageData, concatInfo):
+		# Devuelve (codificación, datos) cuando el mensaje está completo, o None mientras falten partes
+		# (las partes pueden llegar en cualquier orden; una parte repetida reemplaza a la anterior)
+		if concatInfo is None:
+			return dataCoding, messageData
+		concatReference, partCount, partNumber = concatInfo
+		if partCount <= 1:
+			return dataCoding, messageData
+		if not 1 <= partNumber <= partCount:
+			logger.write('WARNING', '[SMS] Parte %s de %s inválida, descartada!' % (partNumber, partCount))
+			return None
+		with self.partsLock:
+			self.expire()
+			partsKey = (telephoneNumber, concatReference, partCount)
+			partsEntry = self.partsDict.setdefault(partsKey, [time.time(), dataCoding, dict()])
+			partsEntry[2][partNumber] = messageData
+			if len(partsEntry[2]) < partCount:
+				return None
+			del self.partsDict[partsKey]
+		messageData = ''.join(partsEntry[2][partNumber] for partNumber in sorted(partsEntry[2]))
+		return partsEntry[1], messageData
+
+	def expire(self):
+		expiredTime = time.time() - self.timeOut
+		for partsKey, partsEntry in self.partsDict.items():
+			if partsEntry[0] < expiredTime:
+				del self.partsDict[partsKey]
+				self.expiredCount += 1
+				logger.write('WARNING', '[SMS] Mensaje concatenado de %s incompleto (%s de %s partes), descartado!' % (partsKey[0], len(partsEntry[2]), partsKey[2]))
@@ -2,12 +2,14 @@
 
 import os
 import json
-import pickle
+import zlib
 import socket
 import inspect
 import threading
 
 import logger
+import wireCodec
+import compression
 import contactList
 import messageClass
 
@@ -31,6 +33,7 @@ class Network(object):
 
 	successfulConnection = None
 	receptionQueue = None
+	frameDecoder = None # Decodifica los datos recibidos fuera del hilo del socket
 	isActive = False
 
 	def __init__(self, _receptionQueue, _MEDIA_NAME):
@@ -71,7 +74,7 @@ class Network(object):
 			self.successfulConnection = False
 			return False
 
-	def send(self, message, destinationHost, destinationTcpPort, destinationUdpPort):
+	def send(self, message, destinationHost, destinationTcpPort, destinationUdpPort, frameCache = None):
 		# Comprobamos si el host destino es alcanzable, es decir, si existe
 		pingResponse = os.system('ping -c 3 ' + destinationHost + ' >/dev/null 2>&1') # El '>/dev/null 2>&1' silencia stdout y stderr
 		if pingResponse is 0:
@@ -89,7 +92,7 @@ class Network(object):
 					return self.sendMessage(message.plainText, destinationHost, destinationUdpPort)
 				# Entonces se trata de enviar una instancia de mensaje
 				else:
-					return self.sendMessageInstance(message, destinationHost, destinationUdpPort)
+					return self.sendMessageInstance(message, destinationHost, destinationUdpPort, frameCache)
 			except socket.error as errorMessage:
 				logger.write('WARNING', '[%s] %s.' % (self.MEDIA_NAME, errorMessage))
 				return False
@@ -102,27 +105,40 @@ class Network(object):
 			absoluteFilePath = os.path.abspath(fileName)
 			fileDirectory, fileName = os.path.split(absoluteFilePath)
 			fileObject = open(absoluteFilePath, 'rb')
-			clientSocket.send(fileName) # Enviamos el nombre del archivo
-			# Recibe confirmación para comenzar a transmitir (READY)
-			if clientSocket.recv(self.BUFFER_SIZE) == "READY":
-				# Guardamos la posición inicial del archivo (donde comienza)
-				fileBeginning = fileObject.tell()
-				# Apuntamos al final del archivo
-				fileObject.seek(0, os.SEEK_END)
-				# Obtenemos la posición final del mismo (que sería el tamaño)
-				fileSize = fileObject.tell()
-				# Apuntamos nuevamente al comienzo del archivo, para comenzar a transmitir
-				fileObject.seek(fileBeginning, os.SEEK_SET)
+			fileSize = os.path.getsize(absoluteFilePath)
+			# Si el archivo es grande y compresible, ofrecemos enviarlo comprimido (el receptor decide si acepta)
+			if compression.isEnabled(self.MEDIA_NAME, fileSize) and compression.isCompressible(fileObject.read(compression.PROBE_SIZE)):
+				clientSocket.send('%s\0%s' % (fileName, compression.FILE_OPTION))
+			else:
+				clientSocket.send(fileName) # Enviamos el nombre del archivo
+			fileObject.seek(0, os.SEEK_SET)
+			# Recibe confirmación para comenzar a transmitir (READY o READY-ZLIB)
+			receivedReply = clientSocket.recv(self.BUFFER_SIZE)
+			if receivedReply.startswith("READY"):
+				# Cada bloque comprimido se cierra con 'Z_SYNC_FLUSH', para que el receptor lo pueda escribir apenas llega
+				compressObject = None
+				readSize = self.BUFFER_SIZE
+				if receivedReply == 'READY-%s' % compression.FILE_OPTION:
+					compressObject = zlib.compressobj(compression.COMPRESSION_LEVEL)
+					readSize = self.BUFFER_SIZE / 2
 				# Envio del contenido del archivo
 				bytesSent = 0
+				bytesTransmitted = 0
 				logger.write('DEBUG', '[%s-TCP] Transfiriendo archivo \'%s\'...' % (self.MEDIA_NAME, fileName))
 				while bytesSent < fileSize:
-					outputData = fileObject.read(self.BUFFER_SIZE)
-					clientSocket.send(outputData)
+					outputData = fileObject.read(readSize)
+					if not outputData:
+						break
 					bytesSent += len(outputData)
+					if compressObject is not None:
+						outputData = compressObject.compress(outputData) + compressObject.flush(zlib.Z_SYNC_FLUSH)
+					clientSocket.send(outputData)
+					bytesTransmitted += len(outputData)
 					clientSocket.recv(self.BUFFER_SIZE) # ACK
 				fileObject.close()
 				clientSocket.send('EOF')
+				if compressObject is not None:
+					compression.recordSavings(self.MEDIA_NAME, bytesSent, bytesTransmitted)
 				logger.write('INFO', '[%s-TCP] Archivo \'%s\' enviado correctamente!' % (self.MEDIA_NAME, fileName))
 				return True
 			# Recibe 'FILE_EXISTS'
@@ -150,10 +166,10 @@ class Network(object):
 			# Cerramos el socket que permitió la conexión con el cliente
 			transmissionSocket.close()
 
-	def sendMessageInstance(self, message, destinationHost, destinationUdpPort):
+	def sendMessageInstance(self, message, destinationHost, destinationUdpPort, frameCache = None):
 		try:
-			# Serializamos el objeto para poder transmitirlo
-			serializedMessage = 'INSTANCE' + pickle.dumps(message)
+			# Serializamos el objeto para poder transmitirlo (una trama binaria compacta, en un solo datagrama)
+			serializedMessage = wireCodec.encode(message, self.MEDIA_NAME, frameCache)
 			# Transmitimos la instancia serializada al destino correspondiente
 			transmissionSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 			transmissionSocket.sendto(serializedMessage, (destinationHost, destinationUdpPort))
@@ -222,16 +238,8 @@ class Network(object):
 				# El filtro está activado y el cliente fue encontrado, o el filtro no está habilitado
 				if not enabledFilter:
 					#logger.write('DEBUG', '[NETWORK-UDP] Conexión desde \'%s\' aceptada.' % ipAddress)
-					if receivedData.startswith('INSTANCE'):
-						# Quitamos la 'etiqueta' que hace refencia a una instancia de mensaje
-						serializedMessage = receivedData[len('INSTANCE'):]
-						# 'Deserializamos' la instancia de mensaje para obtener el objeto en sí
-						messageInstance = pickle.loads(serializedMessage)
-						self.receptionQueue.put((messageInstance.priority, messageInstance))
-						logger.write('INFO', '[%s-UDP] Ha llegado una nueva instancia de mensaje!' % self.MEDIA_NAME)
-					else:
-						self.receptionQueue.put((10, receivedData))
-						logger.write('INFO', '[%s-UDP] Ha llegado un nuevo mensaje!' % self.MEDIA_NAME)
+					# La decodificación se hace en otro hilo, para volver cuanto antes a vaciar el socket
+					self.frameDecoder.submit('%s-UDP' % self.MEDIA_NAME, receivedData)
 				# El cliente no fue encontrado, por lo que debemos rechazar su mensaje
 				else:
 					logger.write('WARNING', '[%s-UDP] Mensaje de \'%s\' rechazado!' % (self.MEDIA_NAME, ipAddress))
@@ -245,6 +253,8 @@ class Network(object):
 		try:
 			currentDirectory = os.getcwd()                 # Obtenemos el directorio actual de trabajo
 			fileName = remoteSocket.recv(self.BUFFER_SIZE) # Obtenemos el nombre del archivo a recibir
+			# El transmisor puede ofrecer, a continuación del nombre, enviar el archivo comprimido
+			fileName, fileOption = (fileName.split('\0', 1) + [None])[:2]
 			# Obtenemos el path relativo del archivo a descargar
 			relativeFilePath = os.path.join(currentDirectory, DOWNLOADS, fileName)
 			# Verificamos si el directorio 'DOWNLOADS' no está creado en el directorio actual
@@ -254,14 +264,24 @@ class Network(object):
 			if not os.path.isfile(relativeFilePath):
 				fileObject = open(relativeFilePath, 'w+')
 				logger.write('DEBUG', '[%s-TCP] Descargando archivo \'%s\'...' % (self.MEDIA_NAME, fileName))
-				remoteSocket.send('READY')
+				decompressObject = None
+				if fileOption == compression.FILE_OPTION:
+					decompressObject = compression.FileDecompressor()
+					remoteSocket.send('READY-%s' % compression.FILE_OPTION)
+				else:
+					remoteSocket.send('READY')
 				# Comenzamos a descargar el archivo
 				while True:
 					inputData = remoteSocket.recv(self.BUFFER_SIZE)
 					if inputData != 'EOF':
-						fileObject.write(inputData)
+						if decompressObject is not None:
+							decompressObject.decompress(inputData, fileObject)
+						else:
+							fileObject.write(inputData)
 						remoteSocket.send('ACK')
 					else: 
+						if decompressObject is not None:
+							decompressObject.flush(fileObject)
 						fileObject.close()
 						break
 				self.receptionQueue.put((10, fileName))
@@ -272,7 +292,7 @@ class Network(object):
 				remoteSocket.send('FILE_EXISTS') # Comunicamos al transmisor que el archivo ya existe
 				logger.write('WARNING', '[%s-TCP] El archivo \'%s\' ya existe! Imposible descargar.' % (self.MEDIA_NAME, fileName))
 				return False
-		except socket.error as errorMessage:
+		except (socket.error, zlib.error) as errorMessage:
 			logger.write('WARNING', '[%s-TCP] Error al intentar descargar el archivo \'%s\': %s' % (self.MEDIA_NAME, fileName, str(errorMessage)))
 			return False
 		finally:
@@ -4,8 +4,11 @@ import os
 import io
 import sys
 import time
+import uuid
+import itertools
 import json
 import Queue
+import threading
 import subprocess
 
 currentDirectory = os.getcwd() 
@@ -23,16 +26,26 @@ import networkClass
 import bluetoothClass
 
 import logger
+import futureClass
 import contactList
+import compression
 import messageClass
+import envelopeClass
+import dispatcherClass
+import frameDecoderClass
 import controllerClass
 import transmitterClass
+import spillRingClass
+import receptionQueueClass
+import transmissionLogClass
+import transmissionQueueClass
 
 os.chdir(currentDirectory)
 
 alreadyOpen = False
+transmissionLog = None # Registro persistente de la cola de transmisión (None --> deshabilitado)
 
-gsmInstance = modemClass.Gsm
+gsmInstance = modemClass.GsmPool
 emailInstance = emailClass.Email
 gprsInstance = networkClass.Network
 wifiInstance = networkClass.Network
@@ -51,9 +64,15 @@ FILE_LOGGING_LEVEL = JSON_CONFIG["LOGGER"]["FILE_LOGGING_LEVEL"]
 CONSOLE_LOGGING_LEVEL = JSON_CONFIG["LOGGER"]["CONSOLE_LOGGING_LEVEL"]
 logger.set(FILE_LOG, FILE_LOGGING_LEVEL, CONSOLE_LOGGING_LEVEL)
 
+# Identificador de esta ejecución (el nombre no alcanza, porque la secuencia vuelve a empezar con cada arranque)
+originId = '%s-%s' % (str(JSON_CONFIG["COMMUNICATOR"]["NAME"]), uuid.uuid4().hex[:8])
+# La secuencia es propia de cada receptor: así, cada uno recibe números consecutivos y su ventana de duplicados no tiene huecos
+sequenceNumbers = dict() # receptor --> contador de secuencia
+sequenceLock = threading.Lock()
+
 def open():
 	global alreadyOpen
-	global receptionQueue, transmissionQueue
+	global receptionQueue, transmissionQueue, transmissionLog, dispatcherInstance, frameDecoderInstance
 	global controllerInstance, transmitterInstance
 	global gsmInstance, gprsInstance, wifiInstance, ethernetInstance, bluetoothInstance, emailInstance
 
@@ -62,33 +81,78 @@ def open():
 		# Creamos las colas de recepción y transmisión, respectivamente
 		RECEPTION_QSIZE = JSON_CONFIG["COMMUNICATOR"]["RECEPTION_QSIZE"]
 		TRANSMISSION_QSIZE = JSON_CONFIG["COMMUNICATOR"]["TRANSMISSION_QSIZE"]
-		receptionQueue = Queue.PriorityQueue(RECEPTION_QSIZE)
-		transmissionQueue = Queue.PriorityQueue(TRANSMISSION_QSIZE)
+		DEDUP_SENDERS = JSON_CONFIG["COMMUNICATOR"]["DEDUP_SENDERS"]
+		DEDUP_WINDOW = JSON_CONFIG["COMMUNICATOR"]["DEDUP_WINDOW"]
+		# Los medios nunca esperan a la aplicación: si la cola de recepción está llena, se aplica la política configurada
+		OVERFLOW_POLICY = str(JSON_CONFIG["RECEPTION_OVERFLOW"]["POLICY"]).upper()
+		if OVERFLOW_POLICY not in receptionQueueClass.OVERFLOW_POLICIES:
+			logger.write('WARNING', '[COMMUNICATOR] Política de desborde \'%s\' desconocida, se usará \'DROP_LOWEST\'.' % OVERFLOW_POLICY)
+			OVERFLOW_POLICY = 'DROP_LOWEST'
+		spillRing = None
+		if OVERFLOW_POLICY == 'SPILL':
+			SPILL_FILE = str(JSON_CONFIG["RECEPTION_OVERFLOW"]["SPILL_FILE"])
+			SPILL_SIZE = JSON_CONFIG["RECEPTION_OVERFLOW"]["SPILL_SIZE"]
+			spillRing = spillRingClass.SpillRing(SPILL_FILE, SPILL_SIZE)
+		receptionQueue = receptionQueueClass.ReceptionQueue(RECEPTION_QSIZE, DEDUP_SENDERS, DEDUP_WINDOW, OVERFLOW_POLICY, spillRing)
+		# Creamos la instancia que entrega los mensajes recibidos a los manejadores suscriptos
+		HANDLER_THREADS = JSON_CONFIG["COMMUNICATOR"]["HANDLER_THREADS"]
+		HANDLER_QSIZE = JSON_CONFIG["COMMUNICATOR"]["HANDLER_QSIZE"]
+		dispatcherInstance = dispatcherClass.Dispatcher(HANDLER_THREADS, HANDLER_QSIZE)
+		receptionQueue.dispatcher = dispatcherInstance
+		# Creamos la etapa que decodifica lo recibido, para que los hilos de los medios sólo lean datos crudos
+		RAW_BUFFER_SIZE = JSON_CONFIG["COMMUNICATOR"]["RAW_BUFFER_SIZE"]
+		frameDecoderInstance = frameDecoderClass.FrameDecoder(receptionQueue, RAW_BUFFER_SIZE)
+		RECEIVER_SHARE = JSON_CONFIG["TRANSMITTER"]["RECEIVER_SHARE"]
+		AGING_TIME = JSON_CONFIG["TRANSMITTER"]["AGING_TIME"]
+		transmissionQueue = transmissionQueueClass.TransmissionQueue(TRANSMISSION_QSIZE, RECEIVER_SHARE, AGING_TIME)
+		# Creamos la instancia para la transmisión de paquetes antes de recuperar el registro: así, los mensajes
+		# recuperados que expiren en la cola se informan al transmisor y se dan por terminados en el registro
+		transmitterInstance = transmitterClass.Transmitter(transmissionQueue)
+		# Si está habilitado, recuperamos los mensajes que quedaron sin enviar en la ejecución anterior
+		if JSON_CONFIG["TRANSMISSION_LOG"]["ENABLED"]:
+			LOG_FILE = JSON_CONFIG["TRANSMISSION_LOG"]["LOG_FILE"]
+			LOG_SIZE = JSON_CONFIG["TRANSMISSION_LOG"]["LOG_SIZE"]
+			FLUSH_INTERVAL = JSON_CONFIG["TRANSMISSION_LOG"]["FLUSH_INTERVAL"]
+			transmissionLog = transmissionLogClass.TransmissionLog(LOG_FILE, LOG_SIZE, FLUSH_INTERVAL)
+			transmitterInstance.transmissionLog = transmissionLog
+			for envelope in transmissionLog.open():
+				# Conservan su marca de tiempo original, por lo que sólo les queda el resto de su tiempo de vida
+				if time.time() >= envelope.timeStamp + envelope.timeToLive:
+					transmissionLog.complete(envelope.logRecord)
+					logger.write('WARNING', '[COMMUNICATOR] Mensaje recuperado para \'%s\' descartado (el tiempo expiró).' % envelope.receiver)
+					continue
+				try:
+					transmissionQueue.put_nowait((envelope.priority, envelope))
+				except Queue.Full:
+					transmissionLog.complete(envelope.logRecord)
+					logger.write('WARNING', '[COMMUNICATOR] Mensaje recuperado para \'%s\' descartado (cola llena).' % envelope.receiver)
 		# Creamos las instancias de los periféricos
-		gsmInstance = modemClass.Gsm(receptionQueue)
+		gsmInstance = modemClass.GsmPool(receptionQueue)
 		gprsInstance = networkClass.Network(receptionQueue, 'GPRS')
 		wifiInstance = networkClass.Network(receptionQueue, 'WIFI')
 		ethernetInstance = networkClass.Network(receptionQueue, 'ETHERNET')
 		bluetoothInstance = bluetoothClass.Bluetooth(receptionQueue)
 		emailInstance = emailClass.Email(receptionQueue)
+		for mediaInstance in (gsmInstance, gprsInstance, wifiInstance, ethernetInstance, bluetoothInstance, emailInstance):
+			mediaInstance.frameDecoder = frameDecoderInstance
 		# Creamos la instancia que levantará las conexiones
 		REFRESH_TIME = JSON_CONFIG["COMMUNICATOR"]["REFRESH_TIME"]
 		controllerInstance = controllerClass.Controller(REFRESH_TIME)
-		controllerInstance.gsmInstance = gsmInstance
+		controllerInstance.gsmPool = gsmInstance
 		controllerInstance.gprsInstance = gprsInstance
 		controllerInstance.wifiInstance = wifiInstance
 		controllerInstance.ethernetInstance = ethernetInstance
 		controllerInstance.bluetoothInstance = bluetoothInstance
 		controllerInstance.emailInstance = emailInstance
-		# Creamos la instancia para la transmisión de paquetes
-		transmitterInstance = transmitterClass.Transmitter(transmissionQueue)
+		# Asignamos los medios a la instancia que transmite los paquetes
 		transmitterInstance.gsmInstance = gsmInstance
 		transmitterInstance.gprsInstance = gprsInstance
 		transmitterInstance.wifiInstance = wifiInstance
 		transmitterInstance.ethernetInstance = ethernetInstance
 		transmitterInstance.bluetoothInstance = bluetoothInstance
 		transmitterInstance.emailInstance = emailInstance
-		# Ponemos en marcha el controlador de medios de comunicación y la transmisión de mensajes
+		# Ponemos en marcha la decodificación, el controlador de medios de comunicación y la transmisión de mensajes
+		frameDecoderInstance.start()
 		controllerInstance.start()
 		transmitterInstance.start()
 		logger.write('INFO', 'Comunicador abierto exitosamente!')
@@ -101,7 +165,7 @@ def open():
 
 def close():
 	global alreadyOpen
-	global receptionQueue, transmissionQueue
+	global receptionQueue, transmissionQueue, transmissionLog, dispatcherInstance, frameDecoderInstance
 	global controllerInstance, transmitterInstance
 	global gsmInstance, gprsInstance, wifiInstance, ethernetInstance, bluetoothInstance, emailInstance
 
@@ -112,6 +176,10 @@ def close():
 		# Frenamos la transmisión de mensajes
 		transmitterInstance.isActive = False
 		transmitterInstance.join()
+		# Los mensajes que siguen pendientes quedan en el registro, para ser enviados en la próxima apertura
+		if transmissionLog is not None:
+			transmissionLog.close()
+			transmissionLog = None
 		# Frenamos la verificación de las conexiones
 		controllerInstance.isActive = False
 		controllerInstance.join()
@@ -122,7 +190,15 @@ def close():
 		del ethernetInstance
 		del bluetoothInstance
 		del emailInstance
+		# Frenamos la decodificación de los datos recibidos
+		frameDecoderInstance.isActive = False
+		frameDecoderInstance.join()
+		del frameDecoderInstance
+		# Frenamos la entrega de mensajes a los manejadores suscriptos
+		dispatcherInstance.stop()
+		del dispatcherInstance
 		# Destruimos las colas de recepción y transmisión
+		receptionQueue.close()
 		del receptionQueue
 		del transmissionQueue
 		# Destruimos las instancias de manejo del comunicador
@@ -136,52 +212,121 @@ def close():
 		logger.write('WARNING', 'El Comunicador ya se encuentra cerrado!')
 		return False
 
-def send(message, receiver = None, media = None):
+def send(message, receiver = None, media = None, timeout = None):
+	# Con 'timeout' se espera (como máximo esa cantidad de segundos) a que haya lugar en la cola
+	return enqueueMessage(message, receiver, media, timeout, None)
+
+def sendAsync(message, receiver = None, media = None, timeout = None):
+	# Devuelve un 'Future' que se resuelve con el medio usado y la demora, o con el motivo de la falla
+	future = futureClass.Future()
+	if not enqueueMessage(message, receiver, media, timeout, future):
+		future.setFailure('no se pudo almacenar en la cola de transmisión')
+	return future
+
+def sendMany(messageList, receiver = None, media = None, timeout = None):
+	# Las instancias para un mismo receptor se envían agrupadas, si está habilitado (como máximo 'MAX_BUNDLE_SIZE' por envío)
 	if alreadyOpen:
-		if not transmissionQueue.full():
-			# Si el mensaje no es una instancia, la creamos para poder hacer el manejo de transmisión con prioridad
-			if not isinstance(message, messageClass.Message):
-				# Al no tratarse de una instancia, no podemos conocer el destino salvo que el usuario lo especifique
-				if receiver is not None:
-					tmpMessage = message
-					# Creamos la instancia general de un mensaje
-					message = messageClass.Message('', receiver, 10)
-					# Verificamos si el mensaje es una ruta a un archivo (path relativo o path absoluto)...
-					if os.path.isfile(tmpMessage):
-						# Insertamos el campo 'fileName'
-						setattr(message, 'fileName', tmpMessage)
-					# Entonces es un mensaje de texto plano
-					else:
-						# Insertamos el campo 'plainText'
-						setattr(message, 'plainText', tmpMessage)
+		MAX_BUNDLE_SIZE = max(1, JSON_CONFIG["TRANSMITTER"]["MAX_BUNDLE_SIZE"])
+		successfulSending = True
+		bundleDict = dict() # receptor --> mensajes a agrupar
+		for message in messageList:
+			message = createMessage(message, receiver)
+			if message is None:
+				successfulSending = False
+			elif transmitterClass.isCoalescible(message):
+				bundleDict.setdefault(message.receiver, list()).append(message)
+			else:
+				successfulSending = enqueueMessage(message, None, media, timeout, None) and successfulSending
+		for bundleReceiver, bundledList in bundleDict.items():
+			# La verificación de contacto se hace una única vez por receptor
+			if not isRegistered(bundleReceiver):
+				logger.write('WARNING', '[COMMUNICATOR] \'%s\' no registrado! %s mensajes descartados...' % (bundleReceiver, len(bundledList)))
+				successfulSending = False
+				continue
+			for bundleIndex in range(0, len(bundledList), MAX_BUNDLE_SIZE):
+				bundleSlice = bundledList[bundleIndex:bundleIndex + MAX_BUNDLE_SIZE]
+				if len(bundleSlice) == 1:
+					message = bundleSlice[0]
 				else:
-					logger.write('ERROR', '[COMMUNICATOR] No se especificó un destino para el mensaje!')
-					return False
+					message = messageClass.BundleMessage(bundleSlice[0].sender, bundleReceiver, bundleSlice)
+				successfulSending = enqueueMessage(message, None, media, timeout, None) and successfulSending
+		return successfulSending
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return False
+
+def createMessage(message, receiver):
+	# Si el mensaje no es una instancia, la creamos para poder hacer el manejo de transmisión con prioridad
+	if not isinstance(message, messageClass.Message):
+		# Al no tratarse de una instancia, no podemos conocer el destino salvo que el usuario lo especifique
+		if receiver is not None:
+			tmpMessage = message
+			# Creamos la instancia general de un mensaje
+			message = messageClass.Message('', receiver, 10)
+			# Verificamos si el mensaje es una ruta a un archivo (path relativo o path absoluto)...
+			if os.path.isfile(tmpMessage):
+				# Insertamos el campo 'fileName'
+				setattr(message, 'fileName', tmpMessage)
+			# Entonces es un mensaje de texto plano
+			else:
+				# Insertamos el campo 'plainText'
+				setattr(message, 'plainText', tmpMessage)
+		else:
+			logger.write('ERROR', '[COMMUNICATOR] No se especificó un destino para el mensaje!')
+			return None
+	return message
+
+def getSequenceNumber(receiver):
+	with sequenceLock:
+		return next(sequenceNumbers.setdefault(receiver, itertools.count(1)))
+
+def isRegistered(receiver):
+	# Buscamos el cliente directamente en cada diccionario, sin armar una lista con todos los contactos
+	for contactDict in (contactList.allowedHosts, contactList.allowedBtAddress, contactList.allowedEmails, contactList.allowedNumbers):
+		if receiver in contactDict:
+			return True
+	return False
+
+def enqueueMessage(message, receiver, media, timeout, future):
+	if alreadyOpen:
+		if timeout is not None or not transmissionQueue.full():
+			message = createMessage(message, receiver)
+			if message is None:
+				return False
 			################################## VERIFICACIÓN DE CONTACTO ##################################
 			# Antes de poner el mensaje en la cola, comprobamos que el cliente esté en algún diccionario
-			clientList = list() + contactList.allowedHosts.keys()
-			clientList += contactList.allowedBtAddress.keys()
-			clientList += contactList.allowedEmails.keys()
-			clientList += contactList.allowedNumbers.keys()
-			# Quitamos los clientes repetidos
-			clientList = list(set(clientList))
-			# Buscamos por lo menos una coincidencia, para luego intentar hacer el envío
-			if message.receiver not in clientList:
-				# El cliente fue encontrado como entrada de un diccionario
+			if not isRegistered(message.receiver):
 				logger.write('WARNING', '[COMMUNICATOR] \'%s\' no registrado! Mensaje descartado...' % message.receiver)
 				return False
 			################################ FIN VERIFICACIÓN DE CONTACTO ################################
+			# Las instancias llevan un identificador único (origen y número de secuencia), para que el receptor descarte las copias
+			messageId = None
+			if not hasattr(message, 'plainText') and not hasattr(message, 'fileName'):
+				messageId = (originId, getSequenceNumber(message.receiver))
 			# Ponemos en maýusculas el dispositivo preferido, si es que se estableció alguno
 			if media is not None:
 				media = media.upper()
-			# Damos mayor prioridad al dispositivo referenciado por 'media' (si es que hay alguno)
-			setattr(message, 'media', media)
-			# Indicamos con una marca de tiempo, la hora exacta en la que se almacenó el mensaje en la cola de transmisión
-			setattr(message, 'timeStamp', time.time())
-			# Establecemos el tiempo que permanecerá el mensaje en la cola antes de ser desechado en caso de no ser enviado
-			setattr(message, 'timeToLive', JSON_CONFIG["COMMUNICATOR"]["TIME_TO_LIVE"])
+			# El sobre lleva los datos de transmisión, para que el mensaje del usuario no se modifique:
+			# el dispositivo preferido (si es que hay alguno), la hora exacta en la que se almacenó el mensaje en la
+			# cola de transmisión, el tiempo que permanecerá en ella antes de ser desechado en caso de no ser enviado,
+			# quien espera el resultado del envío (si es que hay alguien) y el identificador del mensaje
+			TIME_TO_LIVE = JSON_CONFIG["COMMUNICATOR"]["TIME_TO_LIVE"]
+			envelope = envelopeClass.Envelope(message, media, time.time(), TIME_TO_LIVE, future, None, messageId)
+			# Registramos el mensaje en disco (si está habilitado), para recuperarlo si el programa termina antes de enviarlo
+			if transmissionLog is not None:
+				envelope.logRecord = transmissionLog.append(envelope)
 			# Almacenamos el mensaje en la cola de transmisión, con la prioridad correspondiente
-			transmissionQueue.put((message.priority, message))
+			try:
+				if timeout is None:
+					transmissionQueue.put_nowait((envelope.priority, envelope))
+				else:
+					transmissionQueue.put((envelope.priority, envelope), True, timeout)
+			# La cola (o la parte que le corresponde al receptor) sigue llena
+			except Queue.Full:
+				if transmissionLog is not None:
+					transmissionLog.complete(envelope.logRecord)
+				logger.write('WARNING', '[COMMUNICATOR] La cola de transmisión para \'%s\' esta llena, imposible enviar!' % message.receiver)
+				return False
 			logger.write('INFO', '[COMMUNICATOR] Mensaje almacenado en la cola esperando ser enviado...')
 			return True
 		else:
@@ -191,18 +336,75 @@ def send(message, receiver = None, media = None):
 		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
 		return False
 
-def receive():
+def receive(timeout = None):
+	# Con 'timeout' se espera (como máximo esa cantidad de segundos) a que llegue un mensaje, sin sondear la cola
 	if alreadyOpen:
-		if receptionQueue.qsize() > 0:
+		try:
 			# El elemento 0 es la prioridad, por eso sacamos el 1 porque es el mensaje
-			return receptionQueue.get_nowait()[1]
-		else:
-			logger.write('INFO', '[COMMUNICATOR] La cola de mensajes esta vacía!')
+			if timeout is None:
+				return receptionQueue.get_nowait()[1]
+			else:
+				return receptionQueue.get(True, timeout)[1]
+		except Queue.Empty:
+			logger.write('DEBUG', '[COMMUNICATOR] La cola de mensajes esta vacía!')
 			return None
 	else:
 		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
 		return False
 
+def receiveMany(maxCount, timeout = None):
+	# Devuelve hasta 'maxCount' mensajes de una sola vez (esperando a que llegue al menos uno, si se indica 'timeout')
+	if alreadyOpen:
+		itemList = receptionQueue.getMany(maxCount, timeout is not None, timeout)
+		return [item[1] for item in itemList]
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return False
+
+def messages():
+	# Generador que entrega cada mensaje a medida que llega, bloqueándose mientras tanto (termina al cerrar el Comunicador)
+	if not alreadyOpen:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return
+	# Guardamos la referencia, ya que al cerrar el Comunicador la cola deja de existir
+	currentQueue = receptionQueue
+	while alreadyOpen:
+		try:
+			# Despertamos periódicamente sólo para comprobar que el Comunicador siga abierto
+			yield currentQueue.get(True, 1.5)[1]
+		except Queue.Empty:
+			pass
+
+def subscribe(handler, messageType = None, sender = None):
+	# 'messageType' puede ser 'PLAINTEXT', 'FILE' o una clase de mensaje (None --> cualquier tipo)
+	if alreadyOpen:
+		return dispatcherInstance.subscribe(handler, messageType, sender)
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return False
+
+def unsubscribe(handler):
+	if alreadyOpen:
+		return dispatcherInstance.unsubscribe(handler)
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return False
+
+def reloadContacts():
+	# Vuelve a leer 'contactList.py' (por ejemplo, luego de editarlo) y las rutas se reconstruyen en el próximo envío
+	reload(contactList)
+	if alreadyOpen and transmitterInstance.routeTable is not None:
+		transmitterInstance.routeTable.invalidate()
+	return True
+
+def fileno():
+	# Descriptor que queda legible mientras haya mensajes recibidos, para integrarse a 'select' o a un bucle de eventos
+	if alreadyOpen:
+		return receptionQueue.fileno()
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return None
+
 def length():
 	if alreadyOpen:
 		if receptionQueue.qsize() == None:
@@ -213,6 +415,22 @@ def length():
 		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
 		return False
 
+def getReceptionStatistics():
+	# Mensajes perdidos o demorados en la recepción, según el motivo
+	if alreadyOpen:
+		spilledCount = receptionQueue.spillRing.itemCount if receptionQueue.spillRing is not None else 0
+		return {'DUPLICATED' : receptionQueue.duplicateCount,
+				'OVERFLOWED' : receptionQueue.droppedCount,
+				'SPILLED' : spilledCount,
+				'OVERRUN' : frameDecoderInstance.droppedCount}
+	else:
+		logger.write('WARNING', 'El Comunicador no se encuentra abierto!')
+		return None
+
+def getCompressionSavings():
+	# Medio --> bytes ahorrados por la compresión de instancias y archivos
+	return compression.getSavings()
+
 def sendVoiceCall(telephoneNumber):
 	if gsmInstance.isActive:
 		return gsmInstance.sendVoiceCall(telephoneNumber)
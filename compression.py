@@ -0,0 +1,90 @@
+# coding=utf-8
+
+import os
+import json
+import zlib
+import threading
+
+JSON_FILE = 'config.json'
+JSON_CONFIG = json.load(open(JSON_FILE))
+
+COMPRESSION_LEVEL = JSON_CONFIG["COMPRESSION"]["LEVEL"]
+PROBE_SIZE = JSON_CONFIG["COMPRESSION"]["PROBE_SIZE"]
+MAX_RATIO = JSON_CONFIG["COMPRESSION"]["MAX_RATIO"]
+MAX_FILE_SIZE = JSON_CONFIG["COMPRESSION"]["MAX_FILE_SIZE"]
+THRESHOLDS = JSON_CONFIG["COMPRESSION"]["THRESHOLDS"]
+
+FILE_OPTION = 'ZLIB' # Opción que ofrece el transmisor de un archivo (y que el receptor confirma) para enviarlo comprimido
+CHUNK_SIZE = 65536   # Bytes descomprimidos que se escriben de una vez al recibir un archivo
+
+# Medio --> [bytes originales, bytes transmitidos], de todo lo que pasó por la etapa de compresión
+mediaSavings = dict()
+savingsLock = threading.Lock()
+
+def isEnabled(mediaName, payloadSize):
+	# Un umbral 0 deshabilita la compresión en ese medio
+	payloadThreshold = THRESHOLDS.get(mediaName, 0)
+	return payloadThreshold > 0 and payloadSize >= payloadThreshold
+
+def isCompressible(sampleData):
+	# Se comprime sólo una muestra: los datos ya comprimidos (imágenes, archivos empaquetados) casi no se reducen
+	probeData = sampleData[:PROBE_SIZE]
+	return len(probeData) > 0 and len(zlib.compress(probeData, 1)) <= len(probeData) * MAX_RATIO
+
+def compress(payloadData):
+	# Devuelve los datos comprimidos, o None si no conviene comprimirlos (el umbral de cada medio se verifica aparte)
+	if not isCompressible(payloadData):
+		return None
+	compressedData = zlib.compress(payloadData, COMPRESSION_LEVEL)
+	if len(compressedData) > len(payloadData) * MAX_RATIO:
+		return None
+	return compressedData
+
+def decompress(compressedData, maxSize):
+	# Se acota el tamaño resultante, para que una trama maliciosa no agote la memoria
+	decompressObject = zlib.decompressobj()
+	payloadData = decompressObject.decompress(compressedData, maxSize)
+	if decompressObject.unconsumed_tail or decompressObject.flush():
+		raise zlib.error('los datos descomprimidos superan los %s bytes' % maxSize)
+	return payloadData
+
+class FileDecompressor(object):
+
+	maxSize = 0     # Tamaño máximo del archivo descomprimido (en bytes)
+	writtenSize = 0 # Bytes descomprimidos escritos hasta el momento
+
+	def __init__(self, _maxSize = MAX_FILE_SIZE):
+		self.maxSize = _maxSize
+		self.decompressObject = zlib.decompressobj()
+
+	def decompress(self, compressedData, fileObject):
+		# Unos pocos bytes comprimidos pueden expandirse a gigabytes: se escribe por tramos y se corta al superar el máximo
+		while True:
+			outputData = self.decompressObject.decompress(compressedData, CHUNK_SIZE)
+			self.write(outputData, fileObject)
+			compressedData = self.decompressObject.unconsumed_tail
+			if not compressedData and len(outputData) < CHUNK_SIZE:
+				break
+
+	def flush(self, fileObject):
+		self.write(self.decompressObject.flush(), fileObject)
+
+	def write(self, outputData, fileObject):
+		self.writtenSize += len(outputData)
+		if self.writtenSize > self.maxSize:
+			# El archivo incompleto se borra, para que no ocupe lugar ni impida recibirlo de nuevo
+			fileObject.close()
+			os.remove(fileObject.name)
+			raise zlib.error('el archivo descomprimido supera los %s bytes' % self.maxSize)
+		fileObject.write(outputData)
+
+def recordSavings(mediaName, originalSize, transmittedSize):
+	with savingsLock:
+		mediaEntry = mediaSavings.setdefault(mediaName, [0, 0])
+		mediaEntry[0] += originalSize
+		mediaEntry[1] += transmittedSize
+
+def getSavings():
+	# Medio --> bytes ahorrados
+	with savingsLock:
+		return dict((mediaName, mediaEntry[0] - mediaEntry[1]) for mediaName, mediaEntry in mediaSavings.items())
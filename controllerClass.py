@@ -28,7 +28,7 @@ class Controller(threading.Thread):
 	availableBluetooth = False # Indica si el modo BLUTOOTH está disponible
 	availableEmail = False     # Indica si el modo EMAIL está disponible
 
-	gsmInstance = None
+	gsmPool = None # Un módem por cada puerto 'ttyUSBx' que responda a los comandos AT
 	gprsInstance = None
 	wifiInstance = None
 	ethernetInstance = None
@@ -42,7 +42,8 @@ class Controller(threading.Thread):
 		self.REFRESH_TIME = _REFRESH_TIME
 
 	def __del__(self):
-		self.gsmInstance.isActive = False
+		for gsmInstance in self.gsmPool.getActiveModems():
+			gsmInstance.isActive = False
 		self.gprsInstance.isActive = False
 		self.wifiInstance.isActive = False
 		self.ethernetInstance.isActive = False
@@ -71,33 +72,22 @@ class Controller(threading.Thread):
 		ttyUSBPattern = re.compile('ttyUSB[0-9]+')
 		lsDevProcess = subprocess.Popen(['ls', '/dev/'], stdout = subprocess.PIPE, stderr = subprocess.PIPE)
 		lsDevOutput, lsDevError = lsDevProcess.communicate()
-		ttyUSBDevices = ttyUSBPattern.findall(lsDevOutput)
-		# Se detectaron dispositivos USB conectados
-		for ttyUSBx in reversed(ttyUSBDevices):
-			# Si el puerto serie nunca fue establecido, entonces la instancia no esta siendo usada
-			if self.gsmInstance.serialPort is None:
+		serialPortList = ['/dev/' + ttyUSBx for ttyUSBx in ttyUSBPattern.findall(lsDevOutput)]
+		# Se detectaron dispositivos USB conectados: probamos los puertos nuevos y los que dejaron de responder
+		for serialPort in serialPortList:
+			if self.gsmPool.needsProbe(serialPort):
+				gsmInstance = self.gsmPool.addModem(serialPort)
 				# Si no se produce ningún error durante la configuración, ponemos al módem a recibir SMS y llamadas
-				if self.gsmInstance.connect('/dev/' + ttyUSBx):
-					gsmThread = threading.Thread(target = self.gsmInstance.receive, name = gsmThreadName)
-					logger.write('INFO', '[GSM] Listo para usarse (' + ttyUSBx + ').')
+				if gsmInstance.successfulConnection:
+					gsmThread = threading.Thread(target = gsmInstance.receive, name = gsmThreadName)
+					logger.write('INFO', '[GSM] Listo para usarse (' + os.path.basename(serialPort) + ').')
 					gsmThread.start()
-					return True
-				# Si se produce un error durante la configuración, devolvemos 'False'
-				else:
-					return False
-			# Si el módem ya está en modo activo (funcionando), devolvemos 'True'
-			elif self.gsmInstance.isActive:
-				return True
-			# Llegamos acá si se produce un error en el 'connect' del módem (y todavía está conectado)
-			else:
-				return False
-		# Si anteriormente hubo un intento de 'connect()' con o sin éxito, debemos limpiar el puerto
-		if self.gsmInstance.serialPort is not None:
-			self.gsmInstance.successfulConnection = None
-			self.gsmInstance.serialPort = None
-			self.gsmInstance.isActive = False
-			self.gsmInstance.closePort()
-		return False
+		# Si anteriormente hubo un intento de 'connect()' con o sin éxito, debemos limpiar los puertos que desaparecieron
+		for serialPort in self.gsmPool.getSerialPorts():
+			if serialPort not in serialPortList:
+				self.gsmPool.removeModem(serialPort)
+		# Hay GSM disponible mientras al menos uno de los módems esté funcionando
+		return self.gsmPool.updateStatus()
 
 	def verifyGprsConnection(self):
 		# Generamos la expresión regular
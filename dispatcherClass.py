@@ -0,0 +1,119 @@
+# coding=utf-8
+
+import os
+import inspect
+import threading
+
+import logger
+import messageClass
+import workerPoolClass
+
+# Tipos de mensaje que no son instancias (los archivos se reconocen igual que al enviarlos, por su ruta)
+MESSAGE_TYPES = ('PLAINTEXT', 'FILE')
+
+class Dispatcher(object):
+
+	poolSize = 1            # Cantidad de hilos que atienden cada categoría de mensaje
+	queueSize = 0           # Cantidad de mensajes que pueden esperar a los manejadores de cada categoría (0 --> sin límite)
+	subscriptionList = None # Tupla de suscripciones (manejador, tipo de mensaje, emisor)
+	workerPools = None      # Categoría de mensaje --> hilos que ejecutan sus manejadores
+
+	isActive = False
+
+	def __init__(self, _poolSize, _queueSize = 0):
+		self.poolSize = _poolSize
+		self.queueSize = _queueSize
+		# Las suscripciones se reemplazan completas al modificarse, por lo que leerlas no requiere 'lock'
+		self.subscriptionList = tuple()
+		self.workerPools = dict()
+		self.dispatcherLock = threading.Lock()
+		self.isActive = True
+
+	def stop(self):
+		with self.dispatcherLock:
+			self.isActive = False
+			for workerPool in self.workerPools.values():
+				workerPool.stop()
+			self.workerPools = dict()
+
+	def subscribe(self, handler, messageType = None, sender = None):
+		if isinstance(messageType, basestring):
+			messageType = messageType.upper()
+			if messageType not in MESSAGE_TYPES:
+				logger.write('ERROR', '[COMMUNICATOR] Tipo de mensaje \'%s\' desconocido para la suscripción!' % messageType)
+				return False
+		elif messageType is not None and not (inspect.isclass(messageType) and issubclass(messageType, messageClass.Message)):
+			logger.write('ERROR', '[COMMUNICATOR] El tipo de mensaje de la suscripción debe ser una clase derivada de \'Message\'!')
+			return False
+		with self.dispatcherLock:
+			self.subscriptionList = self.subscriptionList + ((handler, messageType, sender),)
+		return True
+
+	def unsubscribe(self, handler):
+		with self.dispatcherLock:
+			subscriptionList = tuple(subscription for subscription in self.subscriptionList if subscription[0] != handler)
+			wasSubscribed = len(subscriptionList) != len(self.subscriptionList)
+			self.subscriptionList = subscriptionList
+		return wasSubscribed
+
+	def getCategory(self, message):
+		if isinstance(message, messageClass.Message):
+			return message.__class__.__name__
+		# El texto recibido puede contener cualquier cosa: sólo una ruta válida (sin caracteres nulos) puede ser un archivo
+		elif isinstance(message, basestring) and '\0' not in message and self.isFile(message):
+			return 'FILE'
+		else:
+			return 'PLAINTEXT'
+
+	def isFile(self, message):
+		try:
+			return os.path.isfile(message)
+		except (TypeError, ValueError, UnicodeError):
+			return False
+
+	def isMatching(self, subscription, message, messageCategory):
+		handler, messageType, sender = subscription
+		# El emisor sólo se conoce en las instancias de mensaje
+		if sender is not None and getattr(message, 'sender', None) != sender:
+			return False
+		if messageType is None:
+			return True
+		elif messageType in MESSAGE_TYPES:
+			return messageType == messageCategory
+		else:
+			return isinstance(message, messageType)
+
+	def dispatch(self, message):
+		# Devuelve True si algún manejador se hizo cargo del mensaje (en ese caso no pasa por la cola de recepción)
+		subscriptionList = self.subscriptionList
+		if len(subscriptionList) == 0 or not self.isActive:
+			return False
+		messageCategory = self.getCategory(message)
+		handlerList = [subscription[0] for subscription in subscriptionList if self.isMatching(subscription, message, messageCategory)]
+		if len(handlerList) == 0:
+			return False
+		# Cada categoría tiene sus propios hilos, para que un manejador lento no demore a los de otro tipo
+		workerPool = self.getWorkerPool(messageCategory)
+		if workerPool is None:
+			return False
+		# Si los manejadores no dan abasto, el mensaje vuelve a la cola de recepción (con su política de desborde)
+		acceptedCount = 0
+		for handler in handlerList:
+			if workerPool.submit(handler, (message,)):
+				acceptedCount += 1
+		if acceptedCount == 0:
+			logger.write('WARNING', '[COMMUNICATOR] Manejadores de \'%s\' ocupados, el mensaje pasa a la cola de recepción.' % messageCategory)
+			return False
+		elif acceptedCount < len(handlerList):
+			logger.write('WARNING', '[COMMUNICATOR] Manejadores de \'%s\' ocupados, %s de ellos no recibirán el mensaje.' % (messageCategory, len(handlerList) - acceptedCount))
+		return True
+
+	def getWorkerPool(self, messageCategory):
+		with self.dispatcherLock:
+			if not self.isActive:
+				return None
+			if messageCategory not in self.workerPools:
+				workerPool = workerPoolClass.WorkerPool('%s-HANDLER' % messageCategory, self.poolSize, self.queueSize)
+				workerPool.start()
+				self.workerPools[messageCategory] = workerPool
+			return self.workerPools[messageCategory]
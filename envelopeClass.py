@@ -0,0 +1,32 @@
+# coding=utf-8
+
+import wireCodec
+
+class Envelope(object):
+
+	# Datos que acompañan al mensaje mientras espera su envío; el mensaje viaja sin ellos
+	__slots__ = ('message',    # Mensaje a transmitir (instancia de 'Message' o de una clase derivada)
+	             'receiver',   # Receptor del mensaje (copiado del mensaje, lo usan las colas)
+	             'priority',   # Prioridad del mensaje (copiada del mensaje, la usan las colas)
+	             'media',      # Medio preferido para el envío (None --> cualquiera)
+	             'timeStamp',  # Hora exacta en la que se almacenó el mensaje en la cola de transmisión
+	             'timeToLive', # Tiempo que el mensaje puede esperar a ser enviado (en segundos)
+	             'future',     # Quien espera el resultado del envío (None --> nadie)
+	             'logRecord',  # Registros del mensaje en el registro de transmisión (None --> no registrado)
+	             'messageId',  # Identificador único (origen, número de secuencia) que viaja en la trama (None --> sin identificar)
+	             'frameCache') # Tramas ya codificadas del mensaje, reutilizadas en cada reintento y en cada medio
+
+	def __init__(self, _message, _media, _timeStamp, _timeToLive, _future = None, _logRecord = None, _messageId = None):
+		self.message = _message
+		self.receiver = _message.receiver
+		self.priority = _message.priority
+		self.media = _media
+		self.timeStamp = _timeStamp
+		self.timeToLive = _timeToLive
+		self.future = _future
+		self.logRecord = _logRecord
+		self.messageId = _messageId
+		self.frameCache = wireCodec.FrameCache()
+		# El identificador se agrega al codificar la trama, así el mensaje del usuario no se modifica
+		if _messageId is not None:
+			self.frameCache.messageIds[id(_message)] = _messageId
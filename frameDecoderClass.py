@@ -0,0 +1,67 @@
+# coding=utf-8
+
+import Queue
+import inspect
+import threading
+
+import logger
+import wireCodec
+
+class FrameDecoder(threading.Thread):
+
+	receptionQueue = None # Cola donde se almacenan los mensajes ya decodificados
+	frameBuffer = None    # Datos crudos recibidos, esperando ser decodificados (acotado)
+	droppedCount = 0      # Cantidad de datos descartados porque el buffer estaba lleno
+	failedCount = 0       # Cantidad de datos descartados por un error inesperado al procesarlos
+
+	isActive = False
+
+	def __init__(self, _receptionQueue, _bufferSize):
+		threading.Thread.__init__(self, name = 'DecoderThread')
+		self.receptionQueue = _receptionQueue
+		self.frameBuffer = Queue.Queue(_bufferSize)
+		self.droppedLock = threading.Lock()
+
+	def submit(self, mediaName, receivedData, isText = False):
+		# Lo llaman los hilos de entrada/salida: nunca espera, para que sigan vaciando sus sockets y puertos
+		# ('isText' indica que el medio transporta las instancias en base64)
+		try:
+			self.frameBuffer.put_nowait((mediaName, receivedData, isText))
+			return True
+		except Queue.Full:
+			with self.droppedLock:
+				self.droppedCount += 1
+			logger.write('WARNING', '[%s] Buffer de recepción lleno, mensaje descartado!' % mediaName)
+			return False
+
+	def run(self):
+		self.isActive = True
+		while self.isActive:
+			try:
+				mediaName, receivedData, isText = self.frameBuffer.get(True, 1.5)
+			# Para que el bloque 'try' (en la funcion 'get') no se quede esperando indefinidamente
+			except Queue.Empty:
+				continue
+			# Este es el único hilo que decodifica: un dato que no se pudo procesar se descarta, pero el hilo sigue
+			try:
+				self.decode(mediaName, receivedData, isText)
+			except Exception as errorMessage:
+				self.failedCount += 1
+				logger.write('ERROR', '[%s] Error inesperado al procesar lo recibido, descartado: %s' % (mediaName, str(errorMessage)))
+		logger.write('WARNING', '[DECODER] Función \'%s\' terminada.' % inspect.stack()[0][3])
+
+	def decode(self, mediaName, receivedData, isText):
+		# Si la cola de recepción está llena, aplica su política de desborde (sin ella, es este hilo el que espera)
+		if wireCodec.isTextFrame(receivedData) if isText else wireCodec.isFrame(receivedData):
+			try:
+				# Decodificamos la trama para obtener el objeto en sí (sólo se crean clases de mensaje registradas)
+				messageInstance = wireCodec.decodeText(receivedData) if isText else wireCodec.decode(receivedData)
+			except wireCodec.CodecError as errorMessage:
+				logger.write('WARNING', '[%s] Instancia de mensaje descartada: %s' % (mediaName, str(errorMessage)))
+				return
+			self.receptionQueue.put((messageInstance.priority, messageInstance))
+			logger.write('INFO', '[%s] Ha llegado una nueva instancia de mensaje!' % mediaName)
+		# Se trata de un texto plano, sólo se lo almacena
+		else:
+			self.receptionQueue.put((10, receivedData))
+			logger.write('INFO', '[%s] Ha llegado un nuevo mensaje!' % mediaName)
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+import threading
+
+import logger
+
+class Future(object):
+
+	successfulSending = None # Resultado final del envío (None --> todavía en curso)
+	media = None             # Medio por el cual se entregó el mensaje
+	latency = None           # Tiempo desde que se almacenó en la cola hasta que se entregó (en segundos)
+	failureReason = None     # Motivo por el cual no se pudo entregar el mensaje
+
+	def __init__(self):
+		self.doneEvent = threading.Event()
+		self.callbackList = list()
+		self.callbackLock = threading.Lock()
+
+	def done(self):
+		return self.doneEvent.isSet()
+
+	def wait(self, timeout = None):
+		self.doneEvent.wait(timeout)
+		return self.doneEvent.isSet()
+
+	def result(self, timeout = None):
+		# Devuelve True si fue entregado, False si falló y None si no se resolvió dentro de 'timeout'
+		if self.wait(timeout):
+			return self.successfulSending
+		return None
+
+	def addDoneCallback(self, callback):
+		with self.callbackLock:
+			if not self.doneEvent.isSet():
+				self.callbackList.append(callback)
+				return
+		# Si ya estaba resuelto, se notifica en este mismo momento
+		self.notify(callback)
+
+	def setResult(self, media, latency):
+		self.resolve(True, media, latency, None)
+
+	def setFailure(self, failureReason):
+		self.resolve(False, None, None, failureReason)
+
+	def resolve(self, successfulSending, media, latency, failureReason):
+		with self.callbackLock:
+			# Sólo cuenta el primer resultado (los siguientes se ignoran)
+			if self.doneEvent.isSet():
+				return False
+			self.successfulSending = successfulSending
+			self.media = media
+			self.latency = latency
+			self.failureReason = failureReason
+			self.doneEvent.set()
+			callbackList, self.callbackList = self.callbackList, list()
+		for callback in callbackList:
+			self.notify(callback)
+		return True
+
+	def notify(self, callback):
+		try:
+			callback(self)
+		except Exception as errorMessage:
+			logger.write('ERROR', '[COMMUNICATOR] Error al notificar el resultado del envío: %s' % str(errorMessage))
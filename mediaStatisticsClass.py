@@ -0,0 +1,79 @@
+# coding=utf-8
+
+import json
+import time
+import threading
+
+import logger
+
+JSON_FILE = 'config.json'
+JSON_CONFIG = json.load(open(JSON_FILE))
+
+class MediaStatistics(object):
+
+	EWMA_ALPHA = None        # Peso de la última muestra en los promedios (0 < alfa <= 1)
+	FAILURE_THRESHOLD = None # Fallos consecutivos que abren el 'circuit breaker' de un enlace
+	COOL_DOWN = None         # Tiempo que se saltea un enlace degradado (en segundos)
+
+	linkStatistics = None  # (medio, receptor) --> [tasa de éxito, latencia, fallos consecutivos, cerrado hasta]
+	mediaStatistics = None # medio --> [tasa de éxito, latencia]
+
+	def __init__(self, _EWMA_ALPHA, _FAILURE_THRESHOLD, _COOL_DOWN):
+		self.EWMA_ALPHA = _EWMA_ALPHA
+		self.FAILURE_THRESHOLD = _FAILURE_THRESHOLD
+		self.COOL_DOWN = _COOL_DOWN
+		self.linkStatistics = dict()
+		self.mediaStatistics = dict()
+		self.statisticsLock = threading.Lock()
+
+	def record(self, mediaName, receiver, successfulSending, latency):
+		successSample = 1.0 if successfulSending else 0.0
+		with self.statisticsLock:
+			linkEntry = self.linkStatistics.setdefault((mediaName, receiver), [1.0, None, 0, 0])
+			mediaEntry = self.mediaStatistics.setdefault(mediaName, [1.0, None])
+			# Actualizamos los promedios con decaimiento exponencial (enlace y medio en general)
+			for statisticsEntry in (linkEntry, mediaEntry):
+				statisticsEntry[0] += self.EWMA_ALPHA * (successSample - statisticsEntry[0])
+				if statisticsEntry[1] is None:
+					statisticsEntry[1] = latency
+				else:
+					statisticsEntry[1] += self.EWMA_ALPHA * (latency - statisticsEntry[1])
+			if successfulSending:
+				linkEntry[2] = 0
+				linkEntry[3] = 0
+			else:
+				linkEntry[2] += 1
+				# Superado el umbral, el enlace se saltea durante 'COOL_DOWN' (pasado ese tiempo, se lo vuelve a probar una vez)
+				if linkEntry[2] >= self.FAILURE_THRESHOLD:
+					linkEntry[3] = time.time() + self.COOL_DOWN
+					logger.write('DEBUG', '[TRANSMITTER] %s degradado para \'%s\', se lo saltea por %s segundos.' % (mediaName, receiver, self.COOL_DOWN))
+
+	def getScore(self, mediaName, receiver, priorFactor = None):
+		# Sin muestras del enlace usamos las del medio, y sin ninguna muestra usamos un factor neutro
+		statisticsEntry = self.linkStatistics.get((mediaName, receiver), self.mediaStatistics.get(mediaName))
+		mediaPriority = JSON_CONFIG["PRIORITY_LEVELS"][mediaName]
+		if statisticsEntry is None or statisticsEntry[1] is None:
+			if priorFactor is None:
+				priorFactor = self.getPriorFactor()
+			return mediaPriority * priorFactor
+		return mediaPriority * statisticsEntry[0] / (1.0 + statisticsEntry[1])
+
+	def getPriorFactor(self):
+		# Un medio nunca probado se compara como si rindiera igual que el mejor medio medido (así no queda
+		# siempre por encima de los que sí tienen muestras); sin ninguna medición, sólo cuenta la prioridad
+		factorList = [successRate / (1.0 + latency) for successRate, latency in self.mediaStatistics.values() if latency is not None]
+		return max(factorList) if factorList else 1.0
+
+	def sortRoute(self, messageRoute, receiver, media = None):
+		currentTime = time.time()
+		priorFactor = self.getPriorFactor()
+		availableRoutes = list()
+		for mediaName, destination in messageRoute:
+			linkEntry = self.linkStatistics.get((mediaName, receiver))
+			# Salteamos los enlaces con el 'circuit breaker' abierto
+			if linkEntry is not None and linkEntry[3] > currentTime:
+				continue
+			availableRoutes.append((mediaName != media, -self.getScore(mediaName, receiver, priorFactor), mediaName, destination))
+		# El medio preferido sigue primero; el resto se ordena por su puntaje actual (el orden es estable ante empates)
+		availableRoutes.sort(key = lambda routeEntry: routeEntry[:2])
+		return tuple((mediaName, destination) for notPreferred, score, mediaName, destination in availableRoutes)
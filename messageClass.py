@@ -2,9 +2,14 @@
 
 class Message(object):
 
-	sender = None	# Emisor del mensaje, la fuente
-	receiver= None	# Receptor del mensaje, a quien esta destinado
-	priority = None	# Prioridad del mensaje para envio
+	# Los campos se declaran en '__slots__': las instancias no llevan '__dict__', y un campo no asignado no existe
+	# (por eso 'hasattr(message, 'plainText')' sigue distinguiendo los mensajes de texto plano)
+	__slots__ = ('sender',    # Emisor del mensaje, la fuente
+	             'receiver',  # Receptor del mensaje, a quien esta destinado
+	             'priority',  # Prioridad del mensaje para envio
+	             'messageId', # Identificador único (origen, número de secuencia), lo agrega el Comunicador a la trama
+	             'plainText', # Texto a transmitir, sólo en los mensajes de texto plano
+	             'fileName')  # Ruta del archivo a transmitir, sólo en los mensajes de archivo
 
 	def __init__(self, _sender, _receiver, _priority):
 		self.sender = _sender
@@ -13,7 +18,7 @@ class Message(object):
 
 class InfoMessage(Message):
 
-	infoText = None # Información a transmitir
+	__slots__ = ('infoText',) # Información a transmitir
 
 	def __init__(self, _sender, _receiver, _infoText):
 		Message.__init__(self, _sender, _receiver, 10)
@@ -21,10 +26,19 @@ class InfoMessage(Message):
 
 class ConfigMessage(Message):
 
-	startService = None # Servicio a iniciar
-	stopService = None  # Servicio a detener
+	__slots__ = ('startService', # Servicio a iniciar
+	             'stopService')  # Servicio a detener
 
 	def __init__(self, _sender, _receiver, _startService, _stopService):
 		Message.__init__(self, _sender, _receiver, 5)
 		self.startService = _startService
-		self.stopService = _stopService
\ No newline at end of file
+		self.stopService = _stopService
+
+class BundleMessage(Message):
+
+	__slots__ = ('messageList',) # Textos planos e instancias de mensaje para un mismo receptor, enviados juntos
+
+	def __init__(self, _sender, _receiver, _messageList):
+		Message.__init__(self, _sender, _receiver, min(message.priority for message in _messageList))
+		# Los mensajes de texto plano viajan sólo con su texto, tal como si se enviaran por separado
+		self.messageList = [getattr(message, 'plainText', message) for message in _messageList]
@@ -0,0 +1,225 @@
+# coding=utf-8
+
+import os
+import time
+import heapq
+import fcntl
+import Queue
+import struct
+import itertools
+import threading
+import collections
+
+import logger
+import wireCodec
+import messageClass
+
+# Qué hacer cuando llega un mensaje y la cola está llena (None --> quien lo entrega espera a que haya lugar)
+OVERFLOW_POLICIES = ('DROP_LOWEST', 'REJECT', 'SPILL')
+
+SPILL_HEADER = struct.Struct('<ic') # Prioridad y tipo ('M' --> instancia, 'T' --> texto plano o archivo) de un elemento volcado a disco
+
+class ReceptionQueue(Queue.PriorityQueue):
+
+	isSignaled = False # Indica si el 'pipe' de notificación tiene un byte pendiente de lectura
+	dedupSenders = 0   # Cantidad de emisores cuyo historial se recuerda (0 --> sin descarte de duplicados)
+	dedupWindow = 0    # Cantidad de números de secuencia recordados por cada emisor
+	duplicateCount = 0 # Cantidad de mensajes descartados por haber llegado más de una vez
+	dispatcher = None  # Entrega los mensajes con suscriptores a sus manejadores, en lugar de encolarlos
+	overflowPolicy = None # Comportamiento ante una cola llena (alguna de 'OVERFLOW_POLICIES', o None)
+	spillRing = None      # Archivo circular donde se vuelcan los mensajes que no entran (sólo con 'SPILL')
+	droppedCount = 0      # Cantidad de mensajes descartados (o rechazados) por encontrar la cola llena
+
+	def __init__(self, maxsize = 0, _dedupSenders = 0, _dedupWindow = 0, _overflowPolicy = None, _spillRing = None):
+		Queue.PriorityQueue.__init__(self, maxsize)
+		self.dedupSenders = _dedupSenders
+		self.dedupWindow = _dedupWindow
+		self.overflowPolicy = _overflowPolicy
+		self.spillRing = _spillRing
+		# Orden de llegada, para que los mensajes de igual prioridad salgan (y se descarten) en orden
+		self.itemOrder = itertools.count()
+		self.windowMask = (1 << _dedupWindow) - 1
+		# Por emisor, la mayor secuencia recibida y un mapa de bits (el bit i indica si llegó la secuencia 'mayor - i')
+		self.senderWindows = collections.OrderedDict() # origen --> [mayor secuencia, mapa de bits], del menos al más reciente
+		self.dedupLock = threading.Lock()
+		# El extremo de lectura queda legible mientras la cola tenga elementos (para 'select' o un bucle de eventos)
+		self.readDescriptor, self.writeDescriptor = os.pipe()
+		for fileDescriptor in (self.readDescriptor, self.writeDescriptor):
+			fileFlags = fcntl.fcntl(fileDescriptor, fcntl.F_GETFL)
+			fcntl.fcntl(fileDescriptor, fcntl.F_SETFL, fileFlags | os.O_NONBLOCK)
+
+	def fileno(self):
+		return self.readDescriptor
+
+	def close(self):
+		os.close(self.readDescriptor)
+		os.close(self.writeDescriptor)
+		if self.spillRing is not None:
+			self.spillRing.close()
+
+	def qsize(self):
+		# Incluye los mensajes volcados a disco, que vuelven a memoria a medida que se consume
+		spilledCount = self.spillRing.itemCount if self.spillRing is not None else 0
+		return Queue.PriorityQueue.qsize(self) + spilledCount
+
+	def put(self, item, block = True, timeout = None):
+		# Una misma instancia puede llegar por varios medios (envío simultáneo) o repetirse en un reintento
+		if self.isDuplicate(item[1]):
+			return
+		# Un grupo de mensajes se desarma, para que cada uno ocupe su lugar en la cola como si hubiera llegado solo
+		if isinstance(item[1], messageClass.BundleMessage):
+			for bundledMessage in item[1].messageList:
+				if isinstance(bundledMessage, messageClass.Message):
+					if not self.isDuplicate(bundledMessage):
+						self.deliver((bundledMessage.priority, bundledMessage), block, timeout)
+				else:
+					self.deliver((10, bundledMessage), block, timeout)
+		else:
+			self.deliver(item, block, timeout)
+
+	def deliver(self, item, block, timeout):
+		# Los mensajes que tienen algún suscriptor van directamente a sus manejadores, sin pasar por la cola
+		if self.dispatcher is not None and self.dispatcher.dispatch(item[1]):
+			return
+		if self.overflowPolicy is None:
+			Queue.PriorityQueue.put(self, item, block, timeout)
+			return
+		# Con una política de desborde, quien entrega el mensaje (un medio) nunca espera a la aplicación
+		with self.not_full:
+			if 0 < self.maxsize <= self._qsize():
+				item = self.overflowLocked(item)
+				if item is None:
+					return
+			self._put(item)
+			self.unfinished_tasks += 1
+			self.not_empty.notify()
+
+	def overflowLocked(self, item):
+		# Devuelve el elemento que ocupa el lugar en memoria, o None si no hay lugar para el que llega
+		if self.overflowPolicy == 'REJECT':
+			self.droppedCount += 1
+			return None
+		# El que sale es el de menor prioridad: al descartar, el más antiguo; al volcar a disco, el más reciente
+		# (que de todos modos sería el último en ser consumido)
+		if self.overflowPolicy == 'SPILL':
+			worstIndex = max(xrange(len(self.queue)), key = lambda queueIndex: self.queue[queueIndex][:2])
+			isIncomingWorst = item[0] >= self.queue[worstIndex][0]
+		else:
+			worstIndex = max(xrange(len(self.queue)), key = lambda queueIndex: (self.queue[queueIndex][0], -self.queue[queueIndex][1]))
+			isIncomingWorst = item[0] > self.queue[worstIndex][0]
+		if isIncomingWorst:
+			worstItem, item = item, None
+		else:
+			worstItem = self.queue[worstIndex][2]
+			self.queue[worstIndex] = self.queue[-1]
+			self.queue.pop()
+			heapq.heapify(self.queue)
+		if self.overflowPolicy != 'SPILL' or not self.spillItem(worstItem):
+			self.droppedCount += 1
+			logger.write('WARNING', '[COMMUNICATOR] Cola de recepción llena, mensaje de prioridad %s descartado!' % worstItem[0])
+		return item
+
+	def spillItem(self, item):
+		if isinstance(item[1], messageClass.Message):
+			try:
+				spillData = SPILL_HEADER.pack(item[0], 'M') + wireCodec.encode(item[1])
+			except wireCodec.CodecError:
+				return False
+		else:
+			itemData = item[1].encode('utf-8') if isinstance(item[1], unicode) else item[1]
+			spillData = SPILL_HEADER.pack(item[0], 'T') + itemData
+		return self.spillRing.push(spillData)
+
+	def unspillItem(self):
+		# Devuelve el elemento más antiguo volcado a disco, o None si no hay ninguno
+		while True:
+			spillData = self.spillRing.pop()
+			if spillData is None:
+				return None
+			itemPriority, itemType = SPILL_HEADER.unpack_from(spillData)
+			itemData = spillData[SPILL_HEADER.size:]
+			if itemType == 'T':
+				return (itemPriority, itemData)
+			try:
+				return (itemPriority, wireCodec.decode(itemData))
+			except wireCodec.CodecError as errorMessage:
+				logger.write('WARNING', '[COMMUNICATOR] Mensaje volcado a disco ilegible: %s' % str(errorMessage))
+
+	def getMany(self, maxCount, block = True, timeout = None):
+		# Retira hasta 'maxCount' elementos tomando el 'lock' de la cola una sola vez (lista vacía si no llegó nada)
+		with self.not_empty:
+			if block:
+				endTime = None if timeout is None else time.time() + timeout
+				while self._qsize() == 0:
+					if endTime is None:
+						self.not_empty.wait()
+					else:
+						remainingTime = endTime - time.time()
+						if remainingTime <= 0:
+							break
+						self.not_empty.wait(remainingTime)
+			itemList = list()
+			while self._qsize() > 0 and len(itemList) < maxCount:
+				itemList.append(self._get())
+			if len(itemList) > 0:
+				self.not_full.notify(len(itemList))
+			return itemList
+
+	def isDuplicate(self, messageInstance):
+		messageId = getattr(messageInstance, 'messageId', None)
+		if messageId is None or self.dedupSenders <= 0:
+			return False
+		# El identificador llega del emisor: uno mal formado no se puede verificar, y el mensaje se descarta
+		if not isinstance(messageId, tuple) or len(messageId) != 2 or not isinstance(messageId[0], basestring) \
+				or not isinstance(messageId[1], (int, long)) or isinstance(messageId[1], bool) or messageId[1] < 0:
+			logger.write('WARNING', '[COMMUNICATOR] Identificador de mensaje inválido, mensaje descartado: %r' % (messageId,))
+			return True
+		originId, sequenceNumber = messageId
+		with self.dedupLock:
+			senderWindow = self.senderWindows.pop(originId, None)
+			isDuplicate = False
+			if senderWindow is None:
+				senderWindow = [sequenceNumber, 1]
+			else:
+				sequenceOffset = senderWindow[0] - sequenceNumber
+				# Una secuencia nueva desplaza la ventana (si salta más allá de ella, la ventana vuelve a empezar, sin
+				# construir un mapa de bits del tamaño del salto); las anteriores se buscan en el mapa de bits
+				if -sequenceOffset >= self.dedupWindow:
+					senderWindow = [sequenceNumber, 1]
+				elif sequenceOffset < 0:
+					senderWindow[1] = ((senderWindow[1] << -sequenceOffset) | 1) & self.windowMask
+					senderWindow[0] = sequenceNumber
+				# Lo que quedó fuera de la ventana ya no se puede verificar: se lo acepta, ya que un mensaje demorado
+				# (por envejecimiento, reintentos o un tiempo de vida largo) vale más que una eventual copia
+				elif sequenceOffset >= self.dedupWindow:
+					pass
+				elif senderWindow[1] >> sequenceOffset & 1:
+					isDuplicate = True
+				else:
+					senderWindow[1] |= 1 << sequenceOffset
+			# El emisor pasa a ser el más reciente, y se olvida al que lleva más tiempo sin enviar
+			self.senderWindows[originId] = senderWindow
+			if len(self.senderWindows) > self.dedupSenders:
+				self.senderWindows.popitem(False)
+			if isDuplicate:
+				self.duplicateCount += 1
+			return isDuplicate
+
+	# Las funciones '_put' y '_get' se ejecutan con el 'mutex' de la cola tomado
+	def _put(self, item):
+		heapq.heappush(self.queue, (item[0], next(self.itemOrder), item))
+		if not self.isSignaled:
+			os.write(self.writeDescriptor, '\0')
+			self.isSignaled = True
+
+	def _get(self):
+		item = heapq.heappop(self.queue)[2]
+		# Lo volcado a disco vuelve a memoria a medida que la aplicación consume
+		if self.spillRing is not None and self.spillRing.itemCount > 0:
+			spilledItem = self.unspillItem()
+			if spilledItem is not None:
+				self._put(spilledItem)
+		if self.isSignaled and self._qsize() == 0:
+			os.read(self.readDescriptor, 1)
+			self.isSignaled = False
+		return item
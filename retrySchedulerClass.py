@@ -0,0 +1,71 @@
+# coding=utf-8
+
+import time
+import heapq
+import random
+import itertools
+import threading
+
+class RetryScheduler(object):
+
+	RETRY_TIME = None     # Espera base antes del primer reintento (en segundos)
+	MAX_RETRY_TIME = None # Espera máxima entre reintentos (en segundos)
+	RETRY_JITTER = None   # Variación aleatoria relativa de la espera (0.2 --> ±20%)
+
+	retryHeap = None    # Montículo de (instante de reintento, orden, sobre con el mensaje, instante de expiración)
+	failureCount = None # Cantidad de fallos consecutivos por cada receptor
+
+	def __init__(self, _RETRY_TIME, _MAX_RETRY_TIME, _RETRY_JITTER):
+		self.RETRY_TIME = _RETRY_TIME
+		self.MAX_RETRY_TIME = _MAX_RETRY_TIME
+		self.RETRY_JITTER = _RETRY_JITTER
+		self.retryHeap = list()
+		self.failureCount = dict()
+		self.retryOrder = itertools.count()
+		self.schedulerLock = threading.Lock()
+
+	def __len__(self):
+		return len(self.retryHeap)
+
+	def schedule(self, envelope, expirationTime):
+		with self.schedulerLock:
+			failures = self.failureCount.get(envelope.receiver, 0)
+			self.failureCount[envelope.receiver] = failures + 1
+			# La espera crece exponencialmente con los fallos del receptor, con una variación para no sincronizar reintentos
+			retryDelay = min(self.RETRY_TIME * 2 ** min(failures, 16), self.MAX_RETRY_TIME)
+			retryDelay *= random.uniform(1 - self.RETRY_JITTER, 1 + self.RETRY_JITTER)
+			retryTime = time.time() + retryDelay
+			# Si el mensaje expira antes del reintento, se cancela en este mismo momento
+			if retryTime >= expirationTime:
+				return False
+			heapq.heappush(self.retryHeap, (retryTime, next(self.retryOrder), envelope, expirationTime))
+			return True
+
+	def reset(self, receiver):
+		# El envío al receptor tuvo éxito, por lo que la próxima espera vuelve a ser la base
+		with self.schedulerLock:
+			self.failureCount.pop(receiver, None)
+
+	def timeToNextRetry(self, currentTime):
+		with self.schedulerLock:
+			if len(self.retryHeap) > 0:
+				return max(0, self.retryHeap[0][0] - currentTime)
+			return None
+
+	def popDue(self, currentTime):
+		dueList = list()
+		expiredList = list()
+		with self.schedulerLock:
+			while len(self.retryHeap) > 0 and self.retryHeap[0][0] <= currentTime:
+				retryTime, retryOrder, envelope, expirationTime = heapq.heappop(self.retryHeap)
+				# Separamos los mensajes cuyo tiempo de vida ya se agotó, para cancelar su reintento
+				if expirationTime > currentTime:
+					dueList.append((envelope, expirationTime))
+				else:
+					expiredList.append(envelope)
+		return dueList, expiredList
+
+	def postpone(self, envelope, expirationTime, retryDelay):
+		# Se usa cuando la cola de transmisión está llena y el mensaje no pudo volver a ella
+		with self.schedulerLock:
+			heapq.heappush(self.retryHeap, (time.time() + retryDelay, next(self.retryOrder), envelope, expirationTime))
@@ -0,0 +1,77 @@
+# coding=utf-8
+
+import json
+import threading
+
+import logger
+import contactList
+
+JSON_FILE = 'config.json'
+JSON_CONFIG = json.load(open(JSON_FILE))
+
+# Medios y la lista de contactos de la que obtienen su destino, en el orden de desempate histórico
+MEDIA_CONTACTS = (('GSM', 'allowedNumbers'),
+				  ('GPRS', 'allowedHosts'),
+				  ('EMAIL', 'allowedEmails'),
+				  ('WIFI', 'allowedHosts'),
+				  ('ETHERNET', 'allowedHosts'),
+				  ('BLUETOOTH', 'allowedBtAddress'))
+
+class RouteTable(object):
+
+	mediaInstances = None # Instancias de los medios de comunicación, indexadas por nombre
+	routeState = None     # Tupla (disponibilidad de los medios, versión de los contactos, rutas por receptor)
+	contactVersion = 0    # Se incrementa con cada 'invalidate' (por ejemplo, al recargar 'contactList')
+
+	def __init__(self, _mediaInstances):
+		self.mediaInstances = _mediaInstances
+		self.rebuildLock = threading.Lock()
+
+	def getRoute(self, receiver, media = None):
+		availability = self.getAvailability()
+		# Leemos el estado una sola vez, por lo que no hace falta tomar un 'lock' si no cambió nada
+		routeState = self.routeState
+		# Las rutas se reconstruyen si cambió la disponibilidad o si cambiaron los contactos (sin recorrer sus listas)
+		if routeState is None or routeState[0] != availability or routeState[1] != self.getContactVersion():
+			routeState = self.rebuild(availability)
+		messageRoute = routeState[2].get(receiver, ())
+		# El medio preferido (si está disponible) pasa a ser el primero en intentarse
+		if media is not None:
+			preferredRoute = tuple(mediaRoute for mediaRoute in messageRoute if mediaRoute[0] == media)
+			otherRoutes = tuple(mediaRoute for mediaRoute in messageRoute if mediaRoute[0] != media)
+			messageRoute = preferredRoute + otherRoutes
+		return messageRoute
+
+	def invalidate(self):
+		# Debe llamarse si se modifica el destino de un contacto existente (lo hace 'communicator.reloadContacts')
+		self.contactVersion += 1
+
+	def getAvailability(self):
+		return tuple(self.mediaInstances[mediaName].isActive for mediaName, contactName in MEDIA_CONTACTS)
+
+	def getContactVersion(self):
+		# Agregar o quitar un contacto (o reemplazar una lista completa) se detecta solo, con la identidad y el largo
+		# de cada lista; cualquier otro cambio requiere 'invalidate'
+		contactLists = [getattr(contactList, contactName) for mediaName, contactName in MEDIA_CONTACTS]
+		return (self.contactVersion, [(id(contactDict), len(contactDict)) for contactDict in contactLists])
+
+	def rebuild(self, availability):
+		with self.rebuildLock:
+			routeDict = dict()
+			contactVersion = self.getContactVersion()
+			for mediaIndex, (mediaName, contactName) in enumerate(MEDIA_CONTACTS):
+				mediaPriority = JSON_CONFIG["PRIORITY_LEVELS"][mediaName]
+				# Un medio inactivo o con prioridad 0 (inhabilitado) no forma parte de ninguna ruta
+				if not availability[mediaIndex] or mediaPriority == 0:
+					continue
+				for receiver, destination in getattr(contactList, contactName).items():
+					# El destino se guarda siempre como tupla, para pasarlo directamente a 'send'
+					if not isinstance(destination, tuple):
+						destination = (destination,)
+					routeDict.setdefault(receiver, list()).append((-mediaPriority, mediaIndex, mediaName, destination))
+			# Ordenamos por prioridad descendente (a igual prioridad, se respeta el orden de 'MEDIA_CONTACTS')
+			for receiver, routeList in routeDict.items():
+				routeDict[receiver] = tuple((mediaName, destination) for priority, index, mediaName, destination in sorted(routeList))
+			self.routeState = (availability, contactVersion, routeDict)
+			logger.write('DEBUG', '[TRANSMITTER] Tabla de rutas reconstruida (%s receptores).' % len(routeDict))
+			return self.routeState
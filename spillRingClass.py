@@ -0,0 +1,73 @@
+# coding=utf-8
+
+import os
+import mmap
+import struct
+import threading
+
+RECORD_HEADER = struct.Struct('<I') # Longitud del contenido de cada registro
+
+class SpillRing(object):
+
+	fileName = None   # Archivo donde se vuelcan los elementos que no entran en memoria
+	fileSize = None   # Tamaño fijo del archivo (en bytes)
+	readOffset = 0    # Posición del registro más antiguo
+	writeOffset = 0   # Posición donde se escribirá el próximo registro
+	wrapOffset = None # Fin de los registros al final del archivo, si la escritura ya volvió al comienzo (None --> no volvió)
+	itemCount = 0     # Cantidad de registros almacenados
+
+	def __init__(self, _fileName, _fileSize):
+		self.fileName = _fileName
+		self.fileSize = _fileSize
+		self.ringLock = threading.Lock()
+		# El contenido no sobrevive a un reinicio: es una extensión de la cola en memoria, no un registro persistente
+		fileDescriptor = os.open(self.fileName, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644)
+		try:
+			os.ftruncate(fileDescriptor, self.fileSize)
+			self.ringMap = mmap.mmap(fileDescriptor, self.fileSize)
+		finally:
+			os.close(fileDescriptor)
+
+	def close(self):
+		with self.ringLock:
+			if self.ringMap is not None:
+				self.ringMap.close()
+				self.ringMap = None
+				os.remove(self.fileName)
+
+	def push(self, recordData):
+		# Devuelve False si el registro no entra (el archivo está lleno)
+		recordLength = RECORD_HEADER.size + len(recordData)
+		with self.ringLock:
+			if self.ringMap is None:
+				return False
+			# Los registros ocupan el intervalo [lectura, escritura), o bien [lectura, fin) y [0, escritura)
+			if self.wrapOffset is None:
+				if self.writeOffset + recordLength > self.fileSize:
+					if recordLength > self.readOffset:
+						return False
+					# El resto del final queda sin usar, y se continúa desde el comienzo del archivo
+					self.wrapOffset = self.writeOffset
+					self.writeOffset = 0
+			elif self.writeOffset + recordLength > self.readOffset:
+				return False
+			self.ringMap[self.writeOffset:self.writeOffset + recordLength] = RECORD_HEADER.pack(len(recordData)) + recordData
+			self.writeOffset += recordLength
+			self.itemCount += 1
+			return True
+
+	def pop(self):
+		# Devuelve el registro más antiguo, o None si no hay ninguno
+		with self.ringLock:
+			if self.ringMap is None or self.itemCount == 0:
+				return None
+			dataLength = RECORD_HEADER.unpack_from(self.ringMap, self.readOffset)[0]
+			dataOffset = self.readOffset + RECORD_HEADER.size
+			recordData = self.ringMap[dataOffset:dataOffset + dataLength]
+			self.readOffset = dataOffset + dataLength
+			self.itemCount -= 1
+			if self.itemCount == 0:
+				self.readOffset, self.writeOffset, self.wrapOffset = 0, 0, None
+			elif self.wrapOffset is not None and self.readOffset >= self.wrapOffset:
+				self.readOffset, self.wrapOffset = 0, None
+			return recordData
@@ -0,0 +1,195 @@
+# coding=utf-8
+
+import os
+import mmap
+import zlib
+import struct
+import cPickle
+import threading
+
+import logger
+import envelopeClass
+
+RECORD_HEADER = struct.Struct('<BQII') # Tipo, identificador, longitud del contenido y CRC32 del registro
+
+ADD_RECORD = 1  # Mensaje almacenado en la cola de transmisión
+DONE_RECORD = 2 # Mensaje entregado o descartado (ya no hace falta recuperarlo)
+
+class TransmissionLog(object):
+
+	fileName = None      # Archivo donde se registran los mensajes pendientes
+	fileSize = None      # Tamaño fijo del archivo (en bytes)
+	flushInterval = None # Tiempo máximo que una escritura espera a ser sincronizada con el disco (en segundos)
+	writeOffset = 0      # Posición donde se escribirá el próximo registro
+	deadBytes = 0        # Bytes ocupados por registros que ya no hace falta recuperar
+	isDirty = False      # Indica si hay escrituras todavía no sincronizadas con el disco
+	lastFlush = 0        # Instante de la última sincronización
+
+	def __init__(self, _fileName, _fileSize, _flushInterval):
+		self.fileName = _fileName
+		self.fileSize = _fileSize
+		self.flushInterval = _flushInterval
+		self.liveRecords = dict() # identificador --> (posición, longitud) de los mensajes todavía pendientes
+		self.recordId = 0
+		self.logLock = threading.Lock()
+		self.logFile = None
+		self.logMap = None
+
+	def open(self):
+		# Devuelve los sobres de los mensajes que quedaron pendientes de la ejecución anterior
+		with self.logLock:
+			if not os.path.isfile(self.fileName):
+				self.createFile(self.fileName, '')
+			self.mapFile()
+			pendingList = self.scanLocked()
+			# Reescribimos el archivo sólo con los registros pendientes, y a partir de acá se escribe en orden
+			self.compactLocked()
+			logger.write('INFO', '[COMMUNICATOR] %s mensajes pendientes recuperados del registro de transmisión.' % len(pendingList))
+			return pendingList
+
+	def close(self):
+		with self.logLock:
+			if self.logMap is not None:
+				self.logMap.flush()
+				self.logMap.close()
+				self.logFile.close()
+				self.logMap = None
+				self.logFile = None
+
+	def append(self, envelope):
+		# El 'future' no sobrevive a un reinicio, por eso no se guarda (y la serialización se hace fuera del 'lock')
+		recordContent = (envelope.message, envelope.media, envelope.timeStamp, envelope.timeToLive, envelope.messageId)
+		recordPayload = cPickle.dumps(recordContent, cPickle.HIGHEST_PROTOCOL)
+		with self.logLock:
+			if self.logMap is None:
+				return None
+			self.recordId += 1
+			recordData = self.packRecord(ADD_RECORD, self.recordId, recordPayload)
+			# Sólo vale la pena compactar si hay registros innecesarios que liberen lugar
+			if not self.hasRoomLocked(len(recordData)) and self.deadBytes > 0:
+				self.compactLocked()
+			if not self.hasRoomLocked(len(recordData)):
+				logger.write('WARNING', '[COMMUNICATOR] Registro de transmisión lleno, el mensaje para \'%s\' no se podrá recuperar.' % envelope.receiver)
+				return None
+			self.liveRecords[self.recordId] = (self.writeOffset, len(recordData))
+			self.writeLocked(recordData)
+			# Se devuelve una tupla porque un grupo de mensajes puede abarcar varios registros
+			return (self.recordId,)
+
+	def complete(self, logRecord):
+		if logRecord is None:
+			return
+		with self.logLock:
+			if self.logMap is None:
+				return
+			for recordId in logRecord:
+				recordLocation = self.liveRecords.pop(recordId, None)
+				if recordLocation is None:
+					continue
+				self.deadBytes += recordLocation[1]
+				recordData = self.packRecord(DONE_RECORD, recordId, '')
+				# Si no hay lugar para la marca, la compactación ya deja afuera al registro completado
+				if not self.hasRoomLocked(len(recordData)):
+					self.compactLocked()
+				else:
+					self.deadBytes += len(recordData)
+					self.writeLocked(recordData)
+
+	def flush(self, currentTime):
+		# Sincronización agrupada: una sola escritura a disco cubre todos los registros del último intervalo
+		with self.logLock:
+			if self.logMap is None:
+				return
+			if self.isDirty and currentTime - self.lastFlush >= self.flushInterval:
+				self.logMap.flush()
+				self.isDirty = False
+				self.lastFlush = currentTime
+			# Compactamos periódicamente, cuando los registros innecesarios ocupan más de la mitad del archivo
+			if self.deadBytes > self.fileSize / 2:
+				self.compactLocked()
+
+	def packRecord(self, recordType, recordId, recordPayload):
+		recordChecksum = zlib.crc32(struct.pack('<BQI', recordType, recordId, len(recordPayload)))
+		recordChecksum = zlib.crc32(recordPayload, recordChecksum) & 0xffffffff
+		return RECORD_HEADER.pack(recordType, recordId, len(recordPayload), recordChecksum) + recordPayload
+
+	def hasRoomLocked(self, recordLength):
+		return self.writeOffset + recordLength <= len(self.logMap)
+
+	def writeLocked(self, recordData):
+		# Escribir en el mapa de memoria es una copia en RAM; el sistema operativo la persiste aunque el proceso termine
+		self.logMap[self.writeOffset:self.writeOffset + len(recordData)] = recordData
+		self.writeOffset += len(recordData)
+		self.isDirty = True
+
+	def scanLocked(self):
+		recordDict = dict()
+		scanOffset = 0
+		# La lectura termina en la zona sin escribir (tipo 0) o en el primer registro incompleto o corrupto
+		while scanOffset + RECORD_HEADER.size <= len(self.logMap):
+			recordType, recordId, payloadLength, recordChecksum = RECORD_HEADER.unpack_from(self.logMap, scanOffset)
+			payloadOffset = scanOffset + RECORD_HEADER.size
+			if recordType not in (ADD_RECORD, DONE_RECORD) or payloadOffset + payloadLength > len(self.logMap):
+				break
+			recordData = self.logMap[scanOffset:payloadOffset + payloadLength]
+			if self.packRecord(recordType, recordId, recordData[RECORD_HEADER.size:]) != recordData:
+				logger.write('WARNING', '[COMMUNICATOR] Registro de transmisión corrupto, se descarta a partir de la posición %s.' % scanOffset)
+				break
+			if recordType == ADD_RECORD:
+				recordDict[recordId] = (scanOffset, len(recordData))
+			else:
+				recordDict.pop(recordId, None)
+			self.recordId = max(self.recordId, recordId)
+			scanOffset = payloadOffset + payloadLength
+		pendingList = list()
+		for recordId in sorted(recordDict):
+			recordOffset, recordLength = recordDict[recordId]
+			try:
+				recordContent = cPickle.loads(self.logMap[recordOffset + RECORD_HEADER.size:recordOffset + recordLength])
+				# Los registros de versiones anteriores no guardan el identificador (lo llevaba el propio mensaje)
+				message, media, timeStamp, timeToLive, messageId = (tuple(recordContent) + (None,))[:5]
+			except Exception as errorMessage:
+				logger.write('WARNING', '[COMMUNICATOR] Mensaje del registro de transmisión ilegible: %s' % str(errorMessage))
+				continue
+			self.liveRecords[recordId] = recordDict[recordId]
+			pendingList.append(envelopeClass.Envelope(message, media, timeStamp, timeToLive, None, (recordId,), messageId))
+		return pendingList
+
+	def compactLocked(self):
+		compactData = list()
+		compactRecords = dict()
+		compactOffset = 0
+		for recordId in sorted(self.liveRecords):
+			recordOffset, recordLength = self.liveRecords[recordId]
+			compactData.append(self.logMap[recordOffset:recordOffset + recordLength])
+			compactRecords[recordId] = (compactOffset, recordLength)
+			compactOffset += recordLength
+		# Se escribe un archivo nuevo y se lo reemplaza de una vez, para no perder registros si se corta la ejecución
+		temporaryName = self.fileName + '.tmp'
+		self.createFile(temporaryName, ''.join(compactData))
+		self.logMap.close()
+		self.logFile.close()
+		os.rename(temporaryName, self.fileName)
+		self.mapFile()
+		self.liveRecords = compactRecords
+		self.writeOffset = compactOffset
+		self.deadBytes = 0
+		self.isDirty = False
+
+	def createFile(self, fileName, fileData):
+		fileDescriptor = os.open(fileName, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0644)
+		try:
+			os.write(fileDescriptor, fileData)
+			# El resto del archivo queda en cero, que es lo que marca el final de los registros
+			os.ftruncate(fileDescriptor, max(self.fileSize, len(fileData)))
+			os.fsync(fileDescriptor)
+		finally:
+			os.close(fileDescriptor)
+
+	def mapFile(self):
+		self.logFile = os.fdopen(os.open(self.fileName, os.O_RDWR), 'r+b')
+		fileSize = os.fstat(self.logFile.fileno()).st_size
+		if fileSize < self.fileSize:
+			self.logFile.truncate(self.fileSize)
+			fileSize = self.fileSize
+		self.logMap = mmap.mmap(self.logFile.fileno(), fileSize)
@@ -0,0 +1,244 @@
+# coding=utf-8
+
+import time
+import heapq
+import Queue
+import itertools
+import threading
+import collections
+
+class TransmissionQueue(object):
+
+	maxSize = 0               # Cantidad máxima de mensajes (0 --> sin límite)
+	receiverShare = 1.0       # Fracción máxima de la cola que puede ocupar un mismo receptor
+	agingTime = 0             # Espera que hace subir un nivel de prioridad a una clase postergada (0 --> sin envejecimiento)
+	liveCount = 0             # Cantidad de mensajes válidos (no despachados ni expirados)
+	expiredCount = 0          # Cantidad de mensajes descartados por superar su tiempo de vida
+	expirationCallback = None # Función a la que se le informa cada mensaje expirado (se llama sin tener tomada la cola)
+	expiredItems = None       # Mensajes expirados que todavía no se informaron a 'expirationCallback'
+
+	def __init__(self, _maxSize = 0, _receiverShare = 1.0, _agingTime = 0):
+		self.maxSize = _maxSize
+		self.receiverShare = _receiverShare
+		self.agingTime = _agingTime
+		# Cada entrada es una lista [elemento, vigente], compartida por su carril y el montículo de vencimientos
+		self.laneHeaps = dict()       # (prioridad, receptor) --> montículo de (vencimiento, orden, entrada)
+		self.laneCount = dict()       # (prioridad, receptor) --> cantidad de mensajes vigentes en el carril
+		self.receiverRounds = dict()  # prioridad --> receptores con mensajes, en orden de atención (round-robin)
+		self.classCount = dict()      # prioridad --> cantidad de mensajes vigentes en la clase
+		self.waitingSince = dict()    # prioridad --> instante desde el cual la clase espera ser atendida
+		self.receiverCount = dict()   # receptor --> cantidad de mensajes vigentes (todas las prioridades)
+		self.deadlineHeap = list()    # (vencimiento, orden, entrada) --> orden de expiración
+		self.entryOrder = itertools.count()
+		self.expiredItems = list()
+		self.queueMutex = threading.Lock()
+		self.notEmpty = threading.Condition(self.queueMutex)
+		self.notFull = threading.Condition(self.queueMutex)
+
+	def qsize(self):
+		with self.queueMutex:
+			return self.liveCount
+
+	def empty(self):
+		with self.queueMutex:
+			return self.liveCount == 0
+
+	def full(self):
+		try:
+			with self.queueMutex:
+				# Antes de informar que está llena, liberamos el lugar de los mensajes vencidos
+				self.sweepLocked(time.time())
+				return 0 < self.maxSize <= self.liveCount
+		finally:
+			self.notifyExpired()
+
+	def put(self, item, block = True, timeout = None):
+		try:
+			with self.notFull:
+				if self.maxSize > 0:
+					endTime = None if timeout is None else time.time() + timeout
+					self.sweepLocked(time.time())
+					# Un receptor inalcanzable no puede ocupar más que su parte de la cola
+					while self.liveCount >= self.maxSize or not self.hasRoomLocked(item[1].receiver):
+						if not block:
+							raise Queue.Full
+						remainingTime = 1.0 if endTime is None else endTime - time.time()
+						if remainingTime <= 0:
+							raise Queue.Full
+						# Despertamos al menos una vez por segundo, ya que la expiración de un mensaje también libera lugar
+						self.notFull.wait(min(remainingTime, 1.0))
+						self.sweepLocked(time.time())
+				self.pushLocked(item)
+				self.notEmpty.notify()
+		finally:
+			self.notifyExpired()
+
+	def put_nowait(self, item):
+		return self.put(item, False)
+
+	def get(self, block = True, timeout = None):
+		try:
+			with self.notEmpty:
+				self.sweepLocked(time.time())
+				if not block:
+					if self.liveCount == 0:
+						raise Queue.Empty
+				elif timeout is None:
+					while self.liveCount == 0:
+						self.notEmpty.wait()
+				else:
+					endTime = time.time() + timeout
+					while self.liveCount == 0:
+						remainingTime = endTime - time.time()
+						if remainingTime <= 0:
+							raise Queue.Empty
+						self.notEmpty.wait(remainingTime)
+				item = self.popLocked()
+				# Se liberó lugar, aunque quizás sólo para el receptor del mensaje despachado
+				self.notFull.notifyAll()
+				return item
+		finally:
+			self.notifyExpired()
+
+	def get_nowait(self):
+		return self.get(False)
+
+	def getFollowing(self, item, maxCount, acceptFunction):
+		# Retira del carril de 'item' los mensajes siguientes que acepte 'acceptFunction' (para agruparlos con él)
+		with self.queueMutex:
+			laneKey = (item[0], item[1].receiver)
+			followingList = list()
+			while laneKey in self.laneHeaps and len(followingList) < maxCount:
+				laneHeap = self.laneHeaps[laneKey]
+				queueEntry = laneHeap[0][2]
+				# Las entradas expiradas se descartan; ante el primer mensaje no aceptado se respeta el orden y se termina
+				if queueEntry[1] and not acceptFunction(queueEntry[0]):
+					break
+				heapq.heappop(laneHeap)
+				if queueEntry[1]:
+					self.removeLocked(queueEntry)
+					followingList.append(queueEntry[0])
+			if len(followingList) > 0:
+				self.compactLocked()
+				self.notFull.notifyAll()
+			return followingList
+
+	def sweep(self):
+		try:
+			with self.queueMutex:
+				return self.sweepLocked(time.time())
+		finally:
+			self.notifyExpired()
+
+	def notifyExpired(self):
+		# El aviso se da fuera de la cola: quien lo recibe puede volver a usarla (por ejemplo, para encolar otro mensaje)
+		with self.queueMutex:
+			if len(self.expiredItems) == 0:
+				return
+			expiredItems = self.expiredItems
+			self.expiredItems = list()
+		if self.expirationCallback is not None:
+			for item in expiredItems:
+				self.expirationCallback(item)
+
+	def getDeadline(self, item):
+		# Los elementos son tuplas (prioridad, sobre con el mensaje)
+		envelope = item[1]
+		return envelope.timeStamp + envelope.timeToLive
+
+	def hasRoomLocked(self, receiver):
+		receiverLimit = max(1, int(self.maxSize * self.receiverShare))
+		return self.receiverCount.get(receiver, 0) < receiverLimit
+
+	def pushLocked(self, item):
+		itemPriority, itemReceiver = item[0], item[1].receiver
+		laneKey = (itemPriority, itemReceiver)
+		itemDeadline = self.getDeadline(item)
+		itemOrder = next(self.entryOrder)
+		queueEntry = [item, True, laneKey]
+		# Un carril nuevo se agrega al final de la ronda de su clase de prioridad
+		if laneKey not in self.laneHeaps:
+			self.laneHeaps[laneKey] = list()
+			self.laneCount[laneKey] = 0
+			self.receiverRounds.setdefault(itemPriority, collections.deque()).append(itemReceiver)
+		# Dentro del carril se respeta el orden de llegada (el vencimiento se cuenta desde la creación del mensaje)
+		heapq.heappush(self.laneHeaps[laneKey], (itemDeadline, itemOrder, queueEntry))
+		heapq.heappush(self.deadlineHeap, (itemDeadline, itemOrder, queueEntry))
+		self.laneCount[laneKey] += 1
+		if self.classCount.get(itemPriority, 0) == 0:
+			self.waitingSince[itemPriority] = time.time()
+		self.classCount[itemPriority] = self.classCount.get(itemPriority, 0) + 1
+		self.receiverCount[itemReceiver] = self.receiverCount.get(itemReceiver, 0) + 1
+		self.liveCount += 1
+
+	def selectPriorityLocked(self, currentTime):
+		selectedPriority, selectedRank = None, None
+		for classPriority, classCount in self.classCount.items():
+			if classCount == 0:
+				continue
+			# Cuanto más espera una clase, mejor (menor) es su prioridad efectiva
+			classRank = classPriority
+			if self.agingTime > 0:
+				classRank -= (currentTime - self.waitingSince[classPriority]) / float(self.agingTime)
+			if selectedRank is None or (classRank, classPriority) < (selectedRank, selectedPriority):
+				selectedPriority, selectedRank = classPriority, classRank
+		return selectedPriority
+
+	def popLocked(self):
+		currentTime = time.time()
+		selectedPriority = self.selectPriorityLocked(currentTime)
+		receiverRound = self.receiverRounds[selectedPriority]
+		# Atendemos al primer receptor de la ronda y lo pasamos al final (round-robin entre receptores)
+		selectedReceiver = receiverRound.popleft()
+		laneKey = (selectedPriority, selectedReceiver)
+		laneHeap = self.laneHeaps[laneKey]
+		queueEntry = heapq.heappop(laneHeap)[2]
+		# Las entradas expiradas se quitan del carril recién cuando llegan al frente
+		while not queueEntry[1]:
+			queueEntry = heapq.heappop(laneHeap)[2]
+		self.removeLocked(queueEntry)
+		if self.laneCount.get(laneKey, 0) > 0:
+			receiverRound.append(selectedReceiver)
+		# La clase atendida vuelve a esperar desde ahora (su envejecimiento se reinicia)
+		self.waitingSince[selectedPriority] = currentTime
+		self.compactLocked()
+		return queueEntry[0]
+
+	def removeLocked(self, queueEntry):
+		queueEntry[1] = False
+		laneKey = queueEntry[2]
+		itemPriority, itemReceiver = laneKey
+		self.laneCount[laneKey] -= 1
+		self.classCount[itemPriority] -= 1
+		self.receiverCount[itemReceiver] -= 1
+		self.liveCount -= 1
+		if self.receiverCount[itemReceiver] == 0:
+			del self.receiverCount[itemReceiver]
+		# Un carril vacío deja de existir (y sale de la ronda, si todavía estaba en ella)
+		if self.laneCount[laneKey] == 0:
+			del self.laneCount[laneKey]
+			del self.laneHeaps[laneKey]
+			receiverRound = self.receiverRounds[itemPriority]
+			if itemReceiver in receiverRound:
+				receiverRound.remove(itemReceiver)
+
+	def sweepLocked(self, currentTime):
+		expiredList = list()
+		# Cada mensaje vencido se retira en O(log n) desde el montículo de vencimientos
+		while len(self.deadlineHeap) > 0 and self.deadlineHeap[0][0] <= currentTime:
+			queueEntry = heapq.heappop(self.deadlineHeap)[2]
+			if queueEntry[1]:
+				self.removeLocked(queueEntry)
+				self.expiredCount += 1
+				expiredList.append(queueEntry[0])
+		if len(expiredList) > 0:
+			self.compactLocked()
+			self.notFull.notifyAll()
+			self.expiredItems.extend(expiredList)
+		return len(expiredList)
+
+	def compactLocked(self):
+		# Las entradas despachadas siguen en el montículo de vencimientos; se lo reconstruye cuando superan a las vigentes
+		if len(self.deadlineHeap) > 2 * self.liveCount + 32:
+			self.deadlineHeap = [heapEntry for heapEntry in self.deadlineHeap if heapEntry[2][1]]
+			heapq.heapify(self.deadlineHeap)
@@ -7,19 +7,32 @@ import inspect
 import threading
 
 import logger
-import contactList
+import futureClass
+import messageClass
+import envelopeClass
+import routeTableClass
+import workerPoolClass
+import retrySchedulerClass
+import mediaStatisticsClass
 
 JSON_FILE = 'config.json'
 JSON_CONFIG = json.load(open(JSON_FILE))
 
-class Transmitter(threading.Thread):
+def isCoalescible(messageInstance):
+	# Sólo las instancias pueden agruparse: un texto plano debe llegar tal cual (por ejemplo, a un teléfono o a un
+	# correo comunes), y los archivos y los grupos viajan por separado
+	if isinstance(messageInstance, basestring) or hasattr(messageInstance, 'plainText') or hasattr(messageInstance, 'fileName'):
+		return False
+	return not isinstance(messageInstance, messageClass.BundleMessage)
+
+def isIdentified(envelope):
+	# Sólo un mensaje identificado (o un grupo de ellos) puede enviarse repetido, porque el receptor descarta las copias
+	messageIds = envelope.frameCache.messageIds
+	if isinstance(envelope.message, messageClass.BundleMessage) and id(envelope.message) not in messageIds:
+		return all(id(bundledMessage) in messageIds for bundledMessage in envelope.message.messageList)
+	return id(envelope.message) in messageIds
 
-	gsmPriority = 0
-	gprsPriority = 0
-	wifiPriority = 0
-	ethernetPriority = 0
-	emailPriority = 0
-	bluetoothPriority = 0
+class Transmitter(threading.Thread):
 
 	gsmInstance = None
 	gprsInstance = None
@@ -30,169 +43,242 @@ class Transmitter(threading.Thread):
 
 	isActive = False
 	transmissionQueue = None
+	transmissionLog = None # Registro persistente de los mensajes pendientes (None --> deshabilitado)
+
+	routeTable = None      # Rutas precalculadas (medio, destino) por cada receptor
+	mediaStatistics = None # Latencia y tasa de éxito medidas por medio y receptor
+	workerPools = None     # Hilos de envío acotados, uno por cada medio de comunicación
+	retryScheduler = None  # Mensajes cuyo envío falló, esperando (sin hilos) el momento de su reintento
+	inFlightCount = 0      # Cantidad de mensajes tomados de la cola que todavía no terminaron su envío
 
 	def __init__(self, _transmissionQueue):
 		threading.Thread.__init__(self, name = 'TransmitterThread')
 		self.transmissionQueue = _transmissionQueue
+		self.transmissionQueue.expirationCallback = self.discardExpired
+		self.inFlightCondition = threading.Condition()
+		# Creamos un conjunto de hilos para cada medio (en GSM, el tamaño configurado es el máximo: ver 'resizeGsmPool')
+		self.workerPools = dict()
+		for mediaName, poolSize in JSON_CONFIG["POOL_SIZES"].items():
+			self.workerPools[mediaName] = workerPoolClass.WorkerPool(mediaName, poolSize)
+		RETRY_TIME = JSON_CONFIG["COMMUNICATOR"]["RETRY_TIME"]
+		MAX_RETRY_TIME = JSON_CONFIG["COMMUNICATOR"]["MAX_RETRY_TIME"]
+		RETRY_JITTER = JSON_CONFIG["COMMUNICATOR"]["RETRY_JITTER"]
+		self.retryScheduler = retrySchedulerClass.RetryScheduler(RETRY_TIME, MAX_RETRY_TIME, RETRY_JITTER)
+		EWMA_ALPHA = JSON_CONFIG["TRANSMITTER"]["EWMA_ALPHA"]
+		FAILURE_THRESHOLD = JSON_CONFIG["TRANSMITTER"]["FAILURE_THRESHOLD"]
+		COOL_DOWN = JSON_CONFIG["TRANSMITTER"]["COOL_DOWN"]
+		self.mediaStatistics = mediaStatisticsClass.MediaStatistics(EWMA_ALPHA, FAILURE_THRESHOLD, COOL_DOWN)
 
 	def __del__(self):
 		logger.write('INFO', '[TRANSMITTER] Objeto destruido.')
 
 	def run(self):
- 		self.isActive = True
+		self.isActive = True
+		# Las instancias de los medios se asignan luego de crear el objeto, por eso la tabla se crea acá
+		self.mediaInstances = {'GSM' : self.gsmInstance,
+							   'GPRS' : self.gprsInstance,
+							   'WIFI' : self.wifiInstance,
+							   'ETHERNET' : self.ethernetInstance,
+							   'BLUETOOTH' : self.bluetoothInstance,
+							   'EMAIL' : self.emailInstance}
+		self.routeTable = routeTableClass.RouteTable(self.mediaInstances)
+		self.resizeGsmPool()
+		for workerPool in self.workerPools.values():
+			workerPool.start()
+		# Se acota la cantidad de mensajes en curso para que hilos y memoria no crezcan con la carga
+		MAX_IN_FLIGHT = JSON_CONFIG["COMMUNICATOR"]["TRANSMISSION_QSIZE"]
 		while self.isActive:
+			# Sincronizamos con el disco, de una sola vez, los mensajes registrados desde la última pasada
+			if self.transmissionLog is not None:
+				self.transmissionLog.flush(time.time())
+			# Los módems se conectan y desconectan mientras el transmisor funciona
+			self.resizeGsmPool()
+			# Liberamos el lugar que ocupan en la cola los mensajes que ya expiraron
+			self.transmissionQueue.sweep()
+			# Devolvemos a la cola de transmisión los mensajes cuyo reintento ya está vencido
+			self.releaseRetries()
+			# Esperamos a que alguno de los mensajes en curso termine, si se alcanzó el límite
+			with self.inFlightCondition:
+				while self.inFlightCount >= MAX_IN_FLIGHT and self.isActive:
+					self.inFlightCondition.wait(1.5)
 			try:
-				# El elemento 0 es la prioridad, por eso sacamos el 1 que es el mensaje
-				messageInstance = self.transmissionQueue.get(True, 1.5)[1]
-				# Calculamos el tiempo transcurrido desde la creación del mensaje
-				elapsedTime = time.time() - messageInstance.timeStamp
-				# Actualizamos el tiempo de vida restante del mensaje
-				messageInstance.timeToLive = messageInstance.timeToLive - elapsedTime
-				# Si todavía no se alcanzó el tiempo de vida, el mensaje sigue siendo válido...
-				if messageInstance.timeToLive > 0:
-					transmitterThread = threading.Thread(target = self.trySend, args = (messageInstance,), name = 'TransmitterThread')
-					transmitterThread.start()
+				# No esperamos un mensaje nuevo más allá del próximo reintento programado
+				getTimeout = 1.5
+				retryTimeout = self.retryScheduler.timeToNextRetry(time.time())
+				if retryTimeout is not None:
+					getTimeout = min(getTimeout, retryTimeout)
+				# El elemento 0 es la prioridad, por eso sacamos el 1 que es el sobre con el mensaje
+				envelope = self.transmissionQueue.get(True, getTimeout)[1]
+				# Si todavía no se alcanzó el tiempo de vida (contado desde su creación), el mensaje sigue siendo válido...
+				if time.time() < envelope.timeStamp + envelope.timeToLive:
+					with self.inFlightCondition:
+						self.inFlightCount += 1
+					self.trySend(self.coalesce(envelope))
 				# ... sino, el tiempo fue excedido y el mensaje debe ser descartado.
 				else:
-					logger.write('WARNING', '[COMMUNICATOR] Mensaje para \'%s\' descartado (el tiempo expiró).' % messageInstance.receiver)
-					# Eliminamos la instancia de mensaje, dado que ya no está en el buffer de transmisión
-					del messageInstance
+					self.discardMessage(envelope, 'el tiempo expiró')
+					# Eliminamos el sobre, dado que ya no está en el buffer de transmisión
+					del envelope
 			# Para que el bloque 'try' (en la funcion 'get') no se quede esperando indefinidamente
 			except Queue.Empty:
 				pass
+		for workerPool in self.workerPools.values():
+			workerPool.stop()
 		logger.write('WARNING', '[TRANSMITTER] Funcion \'%s\' terminada.' % inspect.stack()[0][3])
 
-	def trySend(self, messageInstance):
-		# Establecemos el orden jerárquico de los medios de comunicación
-		self.setPriorities(messageInstance.receiver, messageInstance.media)
-		# Hacemos una copia de los campos del objeto
-		media = messageInstance.media
-		timeStamp = messageInstance.timeStamp
-		timeToLive = messageInstance.timeToLive
-		# Eliminamos los campos del objeto, ya que el receptor no los necesita
-		delattr(messageInstance, 'media')
-		delattr(messageInstance, 'timeStamp')
-		delattr(messageInstance, 'timeToLive')
-		# Intentamos enviar el mensaje por todos los medios disponibles
-		if not self.send(messageInstance):
-			# Insertamos nuevamente los campos eliminados para manejar el próximo envío
-			setattr(messageInstance, 'media', media)
-			setattr(messageInstance, 'timeStamp', timeStamp)
-			setattr(messageInstance, 'timeToLive', timeToLive)
-			# Esperamos un tiempo ‘retryTime’ antes de un posterior reintento
-			time.sleep(JSON_CONFIG["COMMUNICATOR"]["RETRY_TIME"])
-			# Como el envío falló, se vuelve a colocar el mensaje en la cola
-			self.transmissionQueue.put((messageInstance.priority, messageInstance), True)
-		# Como el mensaje fue enviado con éxito, se lo elimina del sistema
+	def resizeGsmPool(self):
+		# Cada módem atiende un envío por vez: más hilos que módems activos sólo esperan su turno ocupando memoria.
+		# Se deja al menos uno, para que los envíos encolados no se pierdan mientras no hay módems
+		activeModems = len(self.gsmInstance.getActiveModems()) if self.gsmInstance is not None else 0
+		self.workerPools['GSM'].resize(min(JSON_CONFIG["POOL_SIZES"]["GSM"], max(1, activeModems)))
+
+	def discardMessage(self, envelope, discardReason):
+		logger.write('WARNING', '[COMMUNICATOR] Mensaje para \'%s\' descartado (%s).' % (envelope.receiver, discardReason))
+		# Informamos el motivo a quien esté esperando el resultado del envío
+		if envelope.future is not None:
+			envelope.future.setFailure(discardReason)
+		self.completeRecord(envelope.logRecord)
+
+	def completeRecord(self, logRecord):
+		# El mensaje ya no tiene que recuperarse ante un reinicio
+		if self.transmissionLog is not None:
+			self.transmissionLog.complete(logRecord)
+
+	def discardExpired(self, item):
+		# El elemento 0 es la prioridad, por eso tomamos el 1 que es el sobre con el mensaje
+		self.discardMessage(item[1], 'el tiempo expiró')
+
+	def releaseRetries(self):
+		dueList, expiredList = self.retryScheduler.popDue(time.time())
+		for envelope in expiredList:
+			self.discardMessage(envelope, 'el tiempo expiró esperando el reintento')
+		for envelope, expirationTime in dueList:
+			try:
+				self.transmissionQueue.put_nowait((envelope.priority, envelope))
+			# Si la cola está llena se lo vuelve a intentar más tarde, sin bloquear al transmisor
+			except Queue.Full:
+				self.retryScheduler.postpone(envelope, expirationTime, 1.5)
+
+	def coalesce(self, envelope):
+		MAX_BUNDLE_SIZE = JSON_CONFIG["TRANSMITTER"]["MAX_BUNDLE_SIZE"]
+		if MAX_BUNDLE_SIZE <= 1 or not isCoalescible(envelope.message):
+			return envelope
+		# Tomamos los mensajes que esperan detrás de éste para el mismo receptor (y con el mismo medio preferido)
+		acceptFunction = lambda item: isCoalescible(item[1].message) and item[1].media == envelope.media
+		followingList = self.transmissionQueue.getFollowing((envelope.priority, envelope), MAX_BUNDLE_SIZE - 1, acceptFunction)
+		if len(followingList) == 0:
+			return envelope
+		envelopeList = [envelope] + [item[1] for item in followingList]
+		futureList = [bundledEnvelope.future for bundledEnvelope in envelopeList if bundledEnvelope.future is not None]
+		logRecord = sum((bundledEnvelope.logRecord for bundledEnvelope in envelopeList if bundledEnvelope.logRecord is not None), ())
+		timeStamp = min(bundledEnvelope.timeStamp for bundledEnvelope in envelopeList)
+		expirationTime = min(bundledEnvelope.timeStamp + bundledEnvelope.timeToLive for bundledEnvelope in envelopeList)
+		bundledList = [bundledEnvelope.message for bundledEnvelope in envelopeList]
+		bundleMessage = messageClass.BundleMessage(envelope.message.sender, envelope.receiver, bundledList)
+		# El grupo vive lo que el más urgente de sus mensajes, y su resultado se informa a cada uno de ellos
+		bundleEnvelope = envelopeClass.Envelope(bundleMessage, envelope.media, timeStamp, expirationTime - timeStamp)
+		bundleEnvelope.logRecord = logRecord if len(logRecord) > 0 else None
+		# Cada mensaje del grupo conserva su identificador, para que el receptor descarte las copias de cualquiera de ellos
+		for bundledEnvelope in envelopeList:
+			bundleEnvelope.frameCache.messageIds.update(bundledEnvelope.frameCache.messageIds)
+		if len(futureList) > 0:
+			bundleEnvelope.future = futureClass.Future()
+			def bundleCallback(bundleFuture):
+				for future in futureList:
+					future.resolve(bundleFuture.successfulSending, bundleFuture.media, bundleFuture.latency, bundleFuture.failureReason)
+			bundleEnvelope.future.addDoneCallback(bundleCallback)
+		logger.write('DEBUG', '[TRANSMITTER] %s mensajes para \'%s\' agrupados en un único envío.' % (len(envelopeList), envelope.receiver))
+		return bundleEnvelope
+
+	def trySend(self, envelope):
+		# Obtenemos la ruta (tupla inmutable de medios y destinos) que recorrerá este mensaje en particular
+		messageRoute = self.routeTable.getRoute(envelope.receiver, envelope.media)
+		# Reordenamos los candidatos según lo medido, salteando los enlaces degradados
+		messageRoute = self.mediaStatistics.sortRoute(messageRoute, envelope.receiver, envelope.media)
+		# Las instancias urgentes se envían por varios medios a la vez; el resto, por un medio por vez
+		HEDGE_PRIORITY = JSON_CONFIG["TRANSMITTER"]["HEDGE_PRIORITY"]
+		HEDGE_WIDTH = JSON_CONFIG["TRANSMITTER"]["HEDGE_WIDTH"]
+		if HEDGE_WIDTH > 1 and envelope.priority <= HEDGE_PRIORITY and isIdentified(envelope):
+			self.hedgedSend(envelope, messageRoute, HEDGE_WIDTH)
+		# Intentamos enviar el mensaje por todos los medios disponibles (el resultado llega en 'sendCompleted')
 		else:
-			del messageInstance
-
-	def setPriorities(self, receiver, media):
-		self.gsmPriority = 0
-		self.gprsPriority = 0
-		self.wifiPriority = 0
-		self.ethernetPriority = 0
-		self.emailPriority = 0
-		self.bluetoothPriority = 0
-		# Para GSM
-		if contactList.allowedNumbers.has_key(receiver) and self.gsmInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'GSM':
-				self.gsmPriority = 10
-			else:
-				self.gsmPriority = JSON_CONFIG["PRIORITY_LEVELS"]["GSM"]
-		# Para GPRS
-		if contactList.allowedHosts.has_key(receiver) and self.gprsInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'GPRS':
-				self.gprsPriority = 10
-			else:
-				self.gprsPriority = JSON_CONFIG["PRIORITY_LEVELS"]["GPRS"]
-		# Para WIFI
-		if contactList.allowedHosts.has_key(receiver) and self.wifiInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'WIFI':
-				self.wifiPriority = 10
-			else:
-				self.wifiPriority = JSON_CONFIG["PRIORITY_LEVELS"]["WIFI"]
-		# Para ETHERNET
-		if contactList.allowedHosts.has_key(receiver) and self.ethernetInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'ETHERNET':
-				self.ethernetPriority = 10
-			else:
-				self.ethernetPriority = JSON_CONFIG["PRIORITY_LEVELS"]["ETHERNET"]
-		# Para BLUETOOTH
-		if contactList.allowedBtAddress.has_key(receiver) and self.bluetoothInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'BLUETOOTH':
-				self.bluetoothPriority = 10
-			else:
-				self.bluetoothPriority = JSON_CONFIG["PRIORITY_LEVELS"]["BLUETOOTH"]
-		# Para EMAIL
-		if contactList.allowedEmails.has_key(receiver) and self.emailInstance.isActive:
-			# En caso de preferencia se da máxima prioridad
-			if media == 'EMAIL':
-				self.emailPriority = 10
-			else:
-				self.emailPriority = JSON_CONFIG["PRIORITY_LEVELS"]["EMAIL"]
-
-	def send(self, messageInstance):
-		# Intentamos transmitir por GSM
-		if all(self.gsmPriority != 0 and self.gsmPriority >= x for x in(self.gprsPriority, self.emailPriority, self.wifiPriority, self.ethernetPriority, self.bluetoothPriority)):
-			destinationNumber = contactList.allowedNumbers[messageInstance.receiver]
-			if not self.gsmInstance.send(messageInstance, destinationNumber):
-				logger.write('DEBUG', '[COMMUNICATOR-GSM] Falló. Reintentando con otro medio.')
-				self.gsmPriority = 0              # Se descarta para la próxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
-		# Intentamos transmitir por GPRS
-		if all(self.gprsPriority != 0 and self.gprsPriority >= x for x in(self.emailPriority, self.wifiPriority, self.ethernetPriority, self.bluetoothPriority)):
-			destinationHost, destinationTcpPort, destinationUdpPort = contactList.allowedHosts[messageInstance.receiver]
-			if not self.gprsInstance.send(messageInstance, destinationHost, destinationTcpPort, destinationUdpPort):
-				logger.write('DEBUG', '[COMMUNICATOR-GPRS] Falló. Reintentando con otro medio.')
-				self.gprsPriority = 0             # Se descarta para la próxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
-		# Intentamos transmitir por EMAIL
-		elif all(self.emailPriority != 0 and self.emailPriority >= x for x in(self.wifiPriority, self.ethernetPriority, self.bluetoothPriority)):
-			destinationEmail = contactList.allowedEmails[messageInstance.receiver]
-			if not self.emailInstance.send(messageInstance, destinationEmail):
-				logger.write('DEBUG', '[COMMUNICATOR-EMAIL] Falló. Reintentando con otro medio.')
-				self.emailPriority = 0            # Se descarta para la próxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
-		# Intentamos transmitir por WIFI
-		elif all(self.wifiPriority != 0 and self.wifiPriority >= x for x in(self.ethernetPriority, self.bluetoothPriority)):
-			destinationHost, destinationTcpPort, destinationUdpPort = contactList.allowedHosts[messageInstance.receiver]
-			if not self.wifiInstance.send(messageInstance, destinationHost, destinationTcpPort, destinationUdpPort):
-				logger.write('DEBUG', '[COMMUNICATOR-WIFI] Falló. Reintentando con otro medio.')
-				self.wifiPriority = 0             # Se descarta para la próxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
-		# Intentamos transmitir por ETHERNET
-		elif self.ethernetPriority != 0 and self.ethernetPriority >= self.bluetoothPriority:
-			destinationHost, destinationTcpPort, destinationUdpPort = contactList.allowedHosts[messageInstance.receiver]
-			if not self.ethernetInstance.send(messageInstance, destinationHost, destinationTcpPort, destinationUdpPort):
-				logger.write('DEBUG', '[COMMUNICATOR-ETHERNET] Falló. Reintentando con otro medio.')
-				self.ethernetPriority = 0         # Se descarta para la próxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
-		# Intentamos transmitir por BLUETOOTH
-		elif self.bluetoothPriority != 0:
-			destinationServiceName, destinationMAC, destinationUUID = contactList.allowedBtAddress[messageInstance.receiver]
-			if not self.bluetoothInstance.send(messageInstance, destinationServiceName, destinationMAC, destinationUUID):
-				logger.write('DEBUG', '[COMMUNICATOR-BLUETOOTH] Falló. Reintentando con otro medio.')
-				self.bluetoothPriority = 0        # Entonces se descarta para la proxima selección
-				return self.send(messageInstance) # Se reintenta con otro medio
-			else:
-				return True
+			self.send(envelope, messageRoute, 0)
+
+	def sendSucceeded(self, envelope, mediaName):
+		self.retryScheduler.reset(envelope.receiver)
+		# Informamos el medio usado y la demora desde que el mensaje entró a la cola
+		if envelope.future is not None:
+			envelope.future.setResult(mediaName, time.time() - envelope.timeStamp)
+		self.completeRecord(envelope.logRecord)
+		self.sendCompleted(envelope)
+
+	def sendCompleted(self, envelope):
+		# Como el mensaje fue enviado con éxito (o se lo reprogramó), deja de estar en curso
+		with self.inFlightCondition:
+			self.inFlightCount -= 1
+			self.inFlightCondition.notify()
+
+	def sendFailed(self, envelope):
+		# Programamos el reintento (con espera exponencial por receptor), sin ocupar ningún hilo mientras tanto
+		expirationTime = envelope.timeStamp + envelope.timeToLive
+		if not self.retryScheduler.schedule(envelope, expirationTime):
+			self.discardMessage(envelope, 'expira antes del reintento')
+		self.sendCompleted(envelope)
+
+	def timedSend(self, mediaName, envelope, destination):
+		startTime = time.time()
+		# El medio recibe sólo el mensaje (y sus tramas ya codificadas): los datos de transmisión quedan en el sobre
+		successfulSending = self.mediaInstances[mediaName].send(envelope.message, *destination, frameCache = envelope.frameCache)
+		# Registramos el resultado y la duración del intento, para las próximas selecciones de medio
+		self.mediaStatistics.record(mediaName, envelope.receiver, successfulSending, time.time() - startTime)
+		return successfulSending
+
+	def hedgedTimedSend(self, hedgeState, mediaName, envelope, destination):
+		# Si otro medio ya entregó el mensaje, este intento se cancela antes de comenzar
+		if hedgeState[1]:
+			return None
+		return self.timedSend(mediaName, envelope, destination)
+
+	def hedgedSend(self, envelope, messageRoute, hedgeWidth):
+		activeRoute = tuple(mediaRoute for mediaRoute in messageRoute if self.mediaInstances[mediaRoute[0]].isActive)
+		hedgedRoute, remainingRoute = activeRoute[:hedgeWidth], activeRoute[hedgeWidth:]
+		if len(hedgedRoute) <= 1:
+			self.send(envelope, activeRoute, 0)
+			return
+		hedgeState = [len(hedgedRoute), False] # [intentos sin resultado, mensaje entregado]
+		hedgeLock = threading.Lock()
+		for mediaName, destination in hedgedRoute:
+			def hedgeCallback(successfulSending, mediaName = mediaName):
+				# El primer medio que entrega el mensaje gana; los intentos que todavía no empezaron se cancelan
+				with hedgeLock:
+					hedgeState[0] -= 1
+					isWinner = bool(successfulSending) and not hedgeState[1]
+					if isWinner:
+						hedgeState[1] = True
+					allFailed = hedgeState[0] == 0 and not hedgeState[1]
+				if isWinner:
+					self.sendSucceeded(envelope, mediaName)
+				# Si fallaron todos a la vez, seguimos con el resto de la ruta como en un envío normal
+				elif allFailed:
+					logger.write('DEBUG', '[COMMUNICATOR] Falló el envío simultáneo. Reintentando con otro medio.')
+					self.send(envelope, remainingRoute, 0)
+			self.workerPools[mediaName].submit(self.hedgedTimedSend, (hedgeState, mediaName, envelope, destination), hedgeCallback)
+
+	def send(self, envelope, messageRoute, routeIndex):
+		# Recorremos la ruta propia del mensaje, salteando los medios que dejaron de estar activos
+		while routeIndex < len(messageRoute) and not self.mediaInstances[messageRoute[routeIndex][0]].isActive:
+			routeIndex += 1
+		if routeIndex < len(messageRoute):
+			mediaName, destination = messageRoute[routeIndex]
+			def sendCallback(successfulSending):
+				if successfulSending:
+					self.sendSucceeded(envelope, mediaName)
+				else:
+					logger.write('DEBUG', '[COMMUNICATOR-%s] Falló. Reintentando con otro medio.' % mediaName)
+					self.send(envelope, messageRoute, routeIndex + 1)
+			# El envío lo realiza alguno de los hilos del medio elegido
+			self.workerPools[mediaName].submit(self.timedSend, (mediaName, envelope, destination), sendCallback)
 		# No fue posible transmitir por ningún medio
 		else:
-			logger.write('WARNING', '[COMMUNICATOR] No hay módulos para el envío a \'%s\'...' % messageInstance.receiver)
-			return False
\ No newline at end of file
+			logger.write('WARNING', '[COMMUNICATOR] No hay módulos para el envío a \'%s\'...' % envelope.receiver)
+			self.sendFailed(envelope)
@@ -0,0 +1,319 @@
+# coding=utf-8
+
+import zlib
+import base64
+import struct
+import binascii
+
+import compression
+import messageClass
+
+# Cabecera de cada trama: marca, versión, tipo de trama, opciones, longitud y CRC32 del cuerpo
+FRAME_HEADER = struct.Struct('>2sBBBII')
+FRAME_MAGIC = '\xc3\x4d'
+FRAME_VERSION = 1
+
+INSTANCE_FRAME = 1 # El cuerpo es una instancia de mensaje
+
+COMPRESSED_FLAG = 0x01 # El cuerpo viaja comprimido con zlib (el receptor lo reconoce sin necesidad de acordarlo antes)
+
+MAX_BODY_SIZE = 16 * 1024 * 1024 # Tamaño máximo de un cuerpo descomprimido (en bytes)
+
+# Los medios de texto (SMS, email) transportan la trama en base64, precedida por esta marca
+TEXT_PREFIX = 'CM:'
+
+MAX_DEPTH = 32 # Anidamiento máximo de valores (un grupo de mensajes contiene mensajes, que contienen tuplas...)
+
+class CodecError(Exception):
+	pass
+
+class FrameCache(object):
+
+	# Tramas de un mismo mensaje, armadas una única vez para todos sus reintentos y todos los medios que recorra
+	__slots__ = ('frameBody',      # Cuerpo codificado, sin comprimir (None --> todavía no codificado)
+	             'compressedBody', # Cuerpo comprimido (None --> todavía no comprimido, '' --> no conviene comprimirlo)
+	             'frameDict',      # (opciones, en texto) --> trama completa, lista para transmitir
+	             'messageIds')     # id(mensaje) --> identificador que viaja en su trama (el mensaje no se modifica)
+
+	def __init__(self):
+		self.frameBody = None
+		self.compressedBody = None
+		self.frameDict = dict()
+		self.messageIds = dict()
+
+# Clase --> (identificador, campos), e identificador --> (clase, campos). Los campos del esquema viajan
+# como un índice de un byte en lugar de su nombre; cualquier otro atributo viaja con su nombre completo.
+classRegistry = dict()
+identifierRegistry = dict()
+slotRegistry = dict() # Clase --> campos declarados en '__slots__' (incluidos los de sus clases base)
+
+def register(messageType, classId, fieldNames = ()):
+	# Los identificadores menores a 64 quedan reservados para las clases de 'messageClass'
+	if classId in identifierRegistry and identifierRegistry[classId][0] is not messageType:
+		raise CodecError('el identificador %s ya está asignado a \'%s\'' % (classId, identifierRegistry[classId][0].__name__))
+	fieldNames = ('sender', 'receiver', 'priority', 'messageId') + tuple(fieldNames)
+	classRegistry[messageType] = (classId, fieldNames)
+	identifierRegistry[classId] = (messageType, fieldNames)
+
+register(messageClass.Message, 1, ('plainText', 'fileName'))
+register(messageClass.InfoMessage, 2, ('infoText',))
+register(messageClass.ConfigMessage, 3, ('startService', 'stopService'))
+register(messageClass.BundleMessage, 4, ('messageList',))
+
+def encode(messageInstance, mediaName = None, frameCache = None):
+	return getFrame(messageInstance, mediaName, frameCache, False)
+
+def getFrame(messageInstance, mediaName, frameCache, isText):
+	# Sin 'frameCache' la trama se arma cada vez; con él, sólo la primera (si dos hilos la arman a la vez, ambos obtienen la misma)
+	if frameCache is None:
+		frameCache = FrameCache()
+	if frameCache.frameBody is None:
+		bodyList = list()
+		encodeValue(messageInstance, bodyList, 0, frameCache.messageIds)
+		frameCache.frameBody = ''.join(bodyList)
+	frameBody = frameCache.frameBody
+	frameFlags = 0
+	# Si se indica el medio, el cuerpo se comprime según el umbral configurado para él
+	if mediaName is not None and compression.isEnabled(mediaName, len(frameBody)):
+		if frameCache.compressedBody is None:
+			frameCache.compressedBody = compression.compress(frameBody) or ''
+		if frameCache.compressedBody:
+			compression.recordSavings(mediaName, len(frameBody), len(frameCache.compressedBody))
+			frameBody, frameFlags = frameCache.compressedBody, COMPRESSED_FLAG
+	frameKey = (frameFlags, isText)
+	if frameKey not in frameCache.frameDict:
+		frameChecksum = zlib.crc32(frameBody) & 0xffffffff
+		frameData = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, INSTANCE_FRAME, frameFlags, len(frameBody), frameChecksum) + frameBody
+		# En texto, el base64 se corta en líneas de 76 caracteres (como en MIME), ya que el correo limita el largo de cada línea
+		frameCache.frameDict[frameKey] = TEXT_PREFIX + base64.encodestring(frameData) if isText else frameData
+	return frameCache.frameDict[frameKey]
+
+def decode(frameData):
+	if not isFrame(frameData):
+		raise CodecError('la trama no comienza con la marca esperada')
+	frameMagic, frameVersion, frameType, frameFlags, bodyLength, frameChecksum = FRAME_HEADER.unpack_from(frameData)
+	if frameVersion != FRAME_VERSION:
+		raise CodecError('versión de trama %s no soportada' % frameVersion)
+	frameBody = frameData[FRAME_HEADER.size:FRAME_HEADER.size + bodyLength]
+	if len(frameBody) != bodyLength or zlib.crc32(frameBody) & 0xffffffff != frameChecksum:
+		raise CodecError('trama incompleta o corrupta')
+	if frameType != INSTANCE_FRAME:
+		raise CodecError('tipo de trama %s desconocido' % frameType)
+	if frameFlags & COMPRESSED_FLAG:
+		try:
+			frameBody = compression.decompress(frameBody, MAX_BODY_SIZE)
+		except zlib.error as errorMessage:
+			raise CodecError('cuerpo comprimido inválido: %s' % str(errorMessage))
+		bodyLength = len(frameBody)
+	messageInstance, bodyOffset = decodeValue(frameBody, 0, 0)
+	if bodyOffset != bodyLength or not isinstance(messageInstance, messageClass.Message):
+		raise CodecError('el cuerpo de la trama no es una instancia de mensaje')
+	return messageInstance
+
+def isFrame(frameData):
+	return frameData.startswith(FRAME_MAGIC) and len(frameData) >= FRAME_HEADER.size
+
+def encodeText(messageInstance, mediaName = None, frameCache = None):
+	return getFrame(messageInstance, mediaName, frameCache, True)
+
+def decodeText(textData):
+	try:
+		# Se ignoran los saltos de línea (y cualquier espacio que haya agregado un servidor de correo en el camino)
+		frameData = base64.b64decode(''.join(textData.strip()[len(TEXT_PREFIX):].split()))
+	except (TypeError, binascii.Error) as errorMessage:
+		raise CodecError('texto base64 inválido: %s' % str(errorMessage))
+	return decode(frameData)
+
+def isTextFrame(textData):
+	return textData.startswith(TEXT_PREFIX)
+
+def encodeVarint(integerValue, bodyList):
+	byteList = list()
+	while integerValue > 0x7f:
+		byteList.append(chr(0x80 | (integerValue & 0x7f)))
+		integerValue >>= 7
+	byteList.append(chr(integerValue))
+	bodyList.append(''.join(byteList))
+
+def decodeVarint(frameBody, bodyOffset):
+	integerValue, bitShift = 0, 0
+	while True:
+		if bodyOffset >= len(frameBody):
+			raise CodecError('entero truncado')
+		byteValue = ord(frameBody[bodyOffset])
+		bodyOffset += 1
+		integerValue |= (byteValue & 0x7f) << bitShift
+		if byteValue < 0x80:
+			return integerValue, bodyOffset
+		bitShift += 7
+
+def encodeBytes(byteString, bodyList):
+	encodeVarint(len(byteString), bodyList)
+	bodyList.append(byteString)
+
+def decodeBytes(frameBody, bodyOffset):
+	byteLength, bodyOffset = decodeVarint(frameBody, bodyOffset)
+	if bodyOffset + byteLength > len(frameBody):
+		raise CodecError('campo truncado')
+	return frameBody[bodyOffset:bodyOffset + byteLength], bodyOffset + byteLength
+
+def encodeValue(fieldValue, bodyList, valueDepth, messageIds = None):
+	if valueDepth > MAX_DEPTH:
+		raise CodecError('anidamiento demasiado profundo')
+	# 'bool' se evalúa antes que 'int', ya que es una subclase suya
+	if fieldValue is None:
+		bodyList.append('N')
+	elif fieldValue is True:
+		bodyList.append('T')
+	elif fieldValue is False:
+		bodyList.append('F')
+	elif isinstance(fieldValue, (int, long)):
+		# Codificación 'zigzag': los enteros negativos pequeños también ocupan pocos bytes
+		bodyList.append('i')
+		encodeVarint(fieldValue * 2 if fieldValue >= 0 else -fieldValue * 2 - 1, bodyList)
+	elif isinstance(fieldValue, float):
+		bodyList.append('d' + struct.pack('>d', fieldValue))
+	elif isinstance(fieldValue, str):
+		bodyList.append('s')
+		encodeBytes(fieldValue, bodyList)
+	elif isinstance(fieldValue, unicode):
+		bodyList.append('u')
+		encodeBytes(fieldValue.encode('utf-8'), bodyList)
+	elif isinstance(fieldValue, (tuple, list)):
+		bodyList.append('t' if isinstance(fieldValue, tuple) else 'l')
+		encodeVarint(len(fieldValue), bodyList)
+		for itemValue in fieldValue:
+			encodeValue(itemValue, bodyList, valueDepth + 1, messageIds)
+	elif isinstance(fieldValue, dict):
+		bodyList.append('m')
+		encodeVarint(len(fieldValue), bodyList)
+		for itemKey, itemValue in fieldValue.items():
+			encodeValue(itemKey, bodyList, valueDepth + 1, messageIds)
+			encodeValue(itemValue, bodyList, valueDepth + 1, messageIds)
+	elif isinstance(fieldValue, messageClass.Message):
+		encodeMessage(fieldValue, bodyList, valueDepth, messageIds)
+	else:
+		raise CodecError('tipo \'%s\' no soportado' % type(fieldValue).__name__)
+
+def encodeMessage(messageInstance, bodyList, valueDepth, messageIds = None):
+	if type(messageInstance) not in classRegistry:
+		raise CodecError('clase \'%s\' no registrada' % type(messageInstance).__name__)
+	classId, fieldNames = classRegistry[type(messageInstance)]
+	messageFields = getFields(messageInstance)
+	# El identificador asignado al enviar viaja en la trama, en lugar del que pudiera tener el mensaje
+	if messageIds and id(messageInstance) in messageIds:
+		messageFields = [(fieldName, fieldValue) for fieldName, fieldValue in messageFields if fieldName != 'messageId']
+		messageFields.append(('messageId', messageIds[id(messageInstance)]))
+	fieldList = list()
+	for fieldName, fieldValue in messageFields:
+		if fieldName in fieldNames:
+			fieldList.append((fieldNames.index(fieldName) + 1, fieldName, fieldValue))
+		else:
+			fieldList.append((0, fieldName, fieldValue))
+	bodyList.append('M')
+	encodeVarint(classId, bodyList)
+	encodeVarint(len(fieldList), bodyList)
+	for fieldIndex, fieldName, fieldValue in fieldList:
+		encodeVarint(fieldIndex, bodyList)
+		if fieldIndex == 0:
+			encodeBytes(fieldName, bodyList)
+		encodeValue(fieldValue, bodyList, valueDepth + 1, messageIds)
+
+def getFields(messageInstance):
+	fieldList = list()
+	# Los campos de '__slots__' viajan si tienen un valor asignado (aunque sea None), porque no hay valor por defecto
+	for fieldName in getSlotNames(type(messageInstance)):
+		try:
+			fieldList.append((fieldName, getattr(messageInstance, fieldName)))
+		except AttributeError:
+			pass
+	# Las clases derivadas sin '__slots__' también tienen '__dict__': sus atributos con valor None no viajan,
+	# al decodificar se toma el valor por defecto de la clase
+	if hasattr(messageInstance, '__dict__'):
+		fieldList.extend((fieldName, fieldValue) for fieldName, fieldValue in vars(messageInstance).items() if fieldValue is not None)
+	return fieldList
+
+def getSlotNames(messageType):
+	if messageType not in slotRegistry:
+		slotNames = list()
+		for baseType in reversed(messageType.__mro__):
+			baseSlots = baseType.__dict__.get('__slots__', ())
+			if isinstance(baseSlots, basestring):
+				baseSlots = (baseSlots,)
+			slotNames.extend(slotName for slotName in baseSlots if not slotName.startswith('__'))
+		slotRegistry[messageType] = tuple(slotNames)
+	return slotRegistry[messageType]
+
+def decodeValue(frameBody, bodyOffset, valueDepth):
+	if valueDepth > MAX_DEPTH:
+		raise CodecError('anidamiento demasiado profundo')
+	if bodyOffset >= len(frameBody):
+		raise CodecError('valor truncado')
+	valueTag = frameBody[bodyOffset]
+	bodyOffset += 1
+	if valueTag == 'N':
+		return None, bodyOffset
+	elif valueTag == 'T':
+		return True, bodyOffset
+	elif valueTag == 'F':
+		return False, bodyOffset
+	elif valueTag == 'i':
+		zigzagValue, bodyOffset = decodeVarint(frameBody, bodyOffset)
+		return (zigzagValue >> 1) ^ -(zigzagValue & 1), bodyOffset
+	elif valueTag == 'd':
+		if bodyOffset + 8 > len(frameBody):
+			raise CodecError('valor truncado')
+		return struct.unpack_from('>d', frameBody, bodyOffset)[0], bodyOffset + 8
+	elif valueTag == 's':
+		return decodeBytes(frameBody, bodyOffset)
+	elif valueTag == 'u':
+		byteString, bodyOffset = decodeBytes(frameBody, bodyOffset)
+		try:
+			return byteString.decode('utf-8'), bodyOffset
+		except UnicodeDecodeError:
+			raise CodecError('texto UTF-8 inválido')
+	elif valueTag in ('t', 'l'):
+		itemCount, bodyOffset = decodeVarint(frameBody, bodyOffset)
+		itemList = list()
+		for itemIndex in xrange(itemCount):
+			itemValue, bodyOffset = decodeValue(frameBody, bodyOffset, valueDepth + 1)
+			itemList.append(itemValue)
+		return (tuple(itemList) if valueTag == 't' else itemList), bodyOffset
+	elif valueTag == 'm':
+		itemCount, bodyOffset = decodeVarint(frameBody, bodyOffset)
+		itemDict = dict()
+		for itemIndex in xrange(itemCount):
+			itemKey, bodyOffset = decodeValue(frameBody, bodyOffset, valueDepth + 1)
+			itemValue, bodyOffset = decodeValue(frameBody, bodyOffset, valueDepth + 1)
+			try:
+				itemDict[itemKey] = itemValue
+			except TypeError:
+				raise CodecError('clave de diccionario inválida')
+		return itemDict, bodyOffset
+	elif valueTag == 'M':
+		return decodeMessage(frameBody, bodyOffset, valueDepth)
+	else:
+		raise CodecError('marca de valor desconocida')
+
+def decodeMessage(frameBody, bodyOffset, valueDepth):
+	classId, bodyOffset = decodeVarint(frameBody, bodyOffset)
+	if classId not in identifierRegistry:
+		raise CodecError('identificador de clase %s no registrado' % classId)
+	messageType, fieldNames = identifierRegistry[classId]
+	# Sólo se crean instancias de clases registradas, y sin ejecutar su constructor
+	messageInstance = messageType.__new__(messageType)
+	fieldCount, bodyOffset = decodeVarint(frameBody, bodyOffset)
+	for fieldNumber in xrange(fieldCount):
+		fieldIndex, bodyOffset = decodeVarint(frameBody, bodyOffset)
+		if fieldIndex == 0:
+			fieldName, bodyOffset = decodeBytes(frameBody, bodyOffset)
+		elif fieldIndex <= len(fieldNames):
+			fieldName = fieldNames[fieldIndex - 1]
+		else:
+			raise CodecError('campo %s desconocido para \'%s\'' % (fieldIndex, messageType.__name__))
+		fieldValue, bodyOffset = decodeValue(frameBody, bodyOffset, valueDepth + 1)
+		try:
+			setattr(messageInstance, fieldName, fieldValue)
+		except (AttributeError, TypeError):
+			raise CodecError('campo \'%s\' inválido para \'%s\'' % (fieldName, messageType.__name__))
+	return messageInstance, bodyOffset
@@ -0,0 +1,86 @@
+# coding=utf-8
+
+import Queue
+import inspect
+import threading
+
+import logger
+
+class WorkerPool(object):
+
+	poolName = None   # Nombre del conjunto de hilos (por lo general, el medio de comunicación)
+	poolSize = 1      # Cantidad máxima de hilos trabajando en simultáneo
+	taskQueue = None  # Cola de tareas pendientes de ejecución
+	maxTasks = 0      # Cantidad máxima de tareas esperando en la cola (0 --> sin límite)
+	pendingTasks = 0  # Tareas encoladas o en ejecución
+
+	isActive = False
+
+	def __init__(self, _poolName, _poolSize, _maxTasks = 0):
+		self.poolName = str(_poolName)
+		self.poolSize = max(1, _poolSize)
+		self.maxTasks = _maxTasks
+		self.taskQueue = Queue.Queue(_maxTasks)
+		self.pendingLock = threading.Lock()
+		self.workerLock = threading.Lock()
+		self.workerList = list() # Hilo que ocupa cada posición del conjunto (puede haber terminado)
+
+	def start(self):
+		self.isActive = True
+		self.resize(self.poolSize)
+
+	def resize(self, poolSize):
+		# Los hilos que faltan se crean enseguida; los que sobran terminan al completar la tarea que estén ejecutando
+		with self.workerLock:
+			self.poolSize = max(1, poolSize)
+			if not self.isActive:
+				return
+			for workerIndex in range(self.poolSize):
+				# Un hilo que iba a terminar y sigue vivo retoma su trabajo, ya que su posición vuelve a estar en el conjunto
+				if workerIndex < len(self.workerList) and self.workerList[workerIndex].isAlive():
+					continue
+				workerThread = threading.Thread(target = self.work, args = (workerIndex,), name = '%sWorker%s' % (self.poolName, workerIndex))
+				if workerIndex < len(self.workerList):
+					self.workerList[workerIndex] = workerThread
+				else:
+					self.workerList.append(workerThread)
+				workerThread.start()
+
+	def stop(self):
+		# Los hilos terminan al completar la tarea que estén ejecutando (no se los espera)
+		self.isActive = False
+
+	def submit(self, function, args = (), callback = None):
+		with self.pendingLock:
+			self.pendingTasks += 1
+		# Sin límite, la cantidad de tareas la acota quien las envía (el transmisor); con límite, la tarea que
+		# no entra se rechaza enseguida (devuelve False), para que quien la envía nunca espere
+		try:
+			self.taskQueue.put_nowait((function, args, callback))
+			return True
+		except Queue.Full:
+			with self.pendingLock:
+				self.pendingTasks -= 1
+			return False
+
+	def work(self, workerIndex = 0):
+		while self.isActive and workerIndex < self.poolSize:
+			try:
+				function, args, callback = self.taskQueue.get(True, 1.5)
+			# Para que el bloque 'try' (en la funcion 'get') no se quede esperando indefinidamente
+			except Queue.Empty:
+				continue
+			try:
+				result = function(*args)
+			except Exception as errorMessage:
+				logger.write('ERROR', '[%s-POOL] Error al ejecutar la tarea: %s' % (self.poolName, str(errorMessage)))
+				result = False
+			with self.pendingLock:
+				self.pendingTasks -= 1
+			# Un error en la notificación no debe terminar con el hilo de trabajo
+			if callback is not None:
+				try:
+					callback(result)
+				except Exception as errorMessage:
+					logger.write('ERROR', '[%s-POOL] Error al notificar el resultado: %s' % (self.poolName, str(errorMessage)))
+		logger.write('DEBUG', '[%s-POOL] Función \'%s\' terminada.' % (self.poolName, inspect.stack()[0][3]))